@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+from job_store import job_store, input_hash
+from metrics import cache_lookup
+
+# /analyze results kept server-side under an analysis_id, so later steps send the id instead of re-posting
+# the whole analysis. Stored in the shared job store (every worker can resolve any id) and dropped
+# TTL_SECONDS after they were last saved. Results of steps derived from an analysis (prompt proposals,
+# script previews) are kept for the same TTL, keyed by a hash of the analysis content rather than an id
+# a client could copy, so a posted analysis only ever hits results computed from that same content.
+TTL_SECONDS = float(os.getenv("ANALYSIS_TTL_SECONDS", str(24 * 3600)))
+MAX_CACHED = int(os.getenv("ANALYSIS_CACHE_ENTRIES", "256"))  # parsed analyses held in this worker's memory
+
+PROVIDER = "analysis"
+
+
+class AnalysisStore:
+    """
+    analysis_id -> analysis dict (with analysis_id embedded), backed by the job store.
+    A small per-worker LRU saves re-reading and re-parsing hot analyses; treat returned dicts as read-only.
+    """
+
+    def __init__(self, ttl: float = TTL_SECONDS, max_cached: int = MAX_CACHED):
+        self.ttl = ttl
+        self.max_cached = max_cached
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()  # analysis_id -> (analysis, expires_at)
+        self._lock = threading.Lock()
+
+    def save(self, analysis: dict, **params) -> dict:
+        """Store a fresh analysis under a new id; returns it with analysis_id set."""
+        analysis_id = uuid.uuid4().hex
+        stored = {**analysis, "analysis_id": analysis_id}
+        self._put(analysis_id, stored, params)
+        return stored
+
+    def get(self, analysis_id: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(analysis_id)
+            if entry is not None and entry[1] > now:
+                self._cache.move_to_end(analysis_id)
+                cache_lookup("analyses", True)
+                return entry[0]
+        job = job_store.get(PROVIDER, analysis_id)
+        if job is None or job["kind"] != "analysis" or job["updated_at"] + self.ttl <= now or not job["result"]:
+            cache_lookup("analyses", False)
+            return None
+        cache_lookup("analyses", True)
+        self._remember(analysis_id, job["result"], job["updated_at"] + self.ttl)
+        return job["result"]
+
+    def resolve(self, analysis_id: Optional[str], analysis: Optional[dict]) -> dict:
+        """
+        The analysis a request refers to: the stored one for analysis_id, else the inline dict.
+        An inline analysis is client data: any analysis_id embedded in it is dropped, and it is
+        never stored. Raises KeyError when neither is usable.
+        """
+        if analysis_id:
+            stored = self.get(analysis_id)
+            if stored is not None:
+                return stored
+        if analysis is None:
+            raise KeyError(analysis_id)
+        return {k: v for k, v in analysis.items() if k != "analysis_id"}
+
+    def get_step(self, analysis: dict, step: str, *inputs):
+        """A cached result of a step run on this analysis (by content) with these inputs, or None."""
+        job = job_store.get(PROVIDER, self._step_id(analysis, step, inputs))
+        fresh = job is not None and job["updated_at"] + self.ttl > time.time() and job["result"] is not None
+        cache_lookup("analysis_steps", fresh)
+        return job["result"]["value"] if fresh else None
+
+    def put_step(self, analysis: dict, step: str, value, *inputs) -> None:
+        job_store.upsert(
+            "analysis_step", PROVIDER, self._step_id(analysis, step, inputs), "succeeded",
+            params={"analysis_id": analysis.get("analysis_id"), "step": step}, result={"value": value},
+        )
+
+    def prune(self) -> int:
+        """Drop expired analyses and step results (called from the maintenance loop)."""
+        now = time.time()
+        with self._lock:
+            for analysis_id in [k for k, (_, expires_at) in self._cache.items() if expires_at <= now]:
+                del self._cache[analysis_id]
+        return job_store.prune(kinds=("analysis", "analysis_step"), max_age=self.ttl)
+
+    @staticmethod
+    def _step_id(analysis: dict, step: str, inputs: tuple) -> str:
+        # The id and trace are bookkeeping, not content: a stored analysis and an inline copy share results
+        content = {k: v for k, v in analysis.items() if k not in ("analysis_id", "trace_id")}
+        return f"step:{input_hash(content)[:32]}:{step}:{input_hash(*inputs)[:16]}"
+
+    def _put(self, analysis_id: str, analysis: dict, params: Optional[dict]) -> None:
+        job_store.upsert("analysis", PROVIDER, analysis_id, "succeeded", params=params or None, result=analysis)
+        self._remember(analysis_id, analysis, time.time() + self.ttl)
+
+    def _remember(self, analysis_id: str, analysis: dict, expires_at: float) -> None:
+        with self._lock:
+            self._cache[analysis_id] = (analysis, expires_at)
+            self._cache.move_to_end(analysis_id)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+
+analysis_store = AnalysisStore()
@@ -1,5 +1,11 @@
-import anthropic
 import json
+import time
+
+import metrics
+from startup import sdk
+from tracing import traced
+
+anthropic = sdk("anthropic")
 
 
 def _summarize_posts(posts: list[dict], platform: str = "instagram") -> str:
@@ -36,6 +42,7 @@ def _summarize_posts(posts: list[dict], platform: str = "instagram") -> str:
     return "\n\n".join(lines)
 
 
+@traced()
 def analyze_posts(api_key: str, posts: list[dict], hashtags: list[str], platform: str = "instagram") -> dict:
     """
     Send post data to Claude and get back structured trend analysis
@@ -96,11 +103,13 @@ Analyze these posts and respond ONLY with a valid JSON object in exactly this st
 
 Return ONLY the JSON. No markdown, no extra text."""
 
+    started = time.perf_counter()
     message = client.messages.create(
         model="claude-opus-4-6",
         max_tokens=2048,
         messages=[{"role": "user", "content": prompt}],
     )
+    metrics.record_llm("analyze_posts", message, started)
 
     raw = message.content[0].text.strip()
 
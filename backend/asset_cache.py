@@ -0,0 +1,240 @@
+import hashlib
+import ipaddress
+import os
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+
+from metrics import cache_lookup, observe_upstream
+
+# Content-addressed local copies of finished videos. Provider URLs are short-lived and each
+# re-composite or replay would fetch them again; blobs here are named by the sha256 of their bytes.
+ASSET_DIR = Path(os.getenv("ASSET_CACHE_DIR", Path(__file__).parent / ".cache" / "assets"))
+MAX_BYTES = int(os.getenv("ASSET_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+FETCH_TIMEOUT = float(os.getenv("ASSET_FETCH_TIMEOUT", "60"))
+FETCH_MAX_BYTES = int(os.getenv("ASSET_FETCH_MAX_BYTES", str(512 * 1024 ** 2)))  # larger downloads are abandoned
+# Hosts exempt from the public-address check (e.g. local fakes in benchmarks): comma-separated
+ALLOWED_PRIVATE_HOSTS = {h.strip() for h in os.getenv("ASSET_FETCH_ALLOW_HOSTS", "").split(",") if h.strip()}
+MAX_REDIRECTS = 5
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+RETRY_FAILED_SECONDS = float(os.getenv("ASSET_FETCH_RETRY_SECONDS", "300"))  # a failed download isn't retried sooner
+
+BLOB_DIR = ASSET_DIR / "blobs"
+URL_DIR = ASSET_DIR / "urls"  # sha256(source url) -> digest of the blob it resolved to
+ASSET_ROUTE = "/assets/"
+CHUNK_SIZE = 1024 * 1024
+
+_url_locks: dict = {}
+_url_locks_guard = threading.Lock()
+_downloading: set = set()  # url keys with a background download queued or running
+_failed: dict = {}  # url key -> time.monotonic() of its last failed download
+
+
+def _url_key(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def _url_lock(url: str) -> threading.Lock:
+    with _url_locks_guard:
+        return _url_locks.setdefault(_url_key(url), threading.Lock())
+
+
+def is_remote_url(url: str) -> bool:
+    """Only http(s) URLs are downloaded: never local paths or other protocols."""
+    parts = urlsplit(url)
+    return parts.scheme in ("http", "https") and bool(parts.hostname)
+
+
+def _check_url(url: str) -> None:
+    """
+    Raise ValueError unless url is http(s) and its host resolves only to public addresses, so a
+    client-supplied URL (or a redirect) can't make this server fetch from its own network.
+    """
+    if not is_remote_url(url):
+        raise ValueError(f"Not an http(s) URL: {url}")
+    parts = urlsplit(url)
+    if parts.hostname in ALLOWED_PRIVATE_HOSTS:
+        return
+    try:
+        addresses = socket.getaddrinfo(parts.hostname, parts.port or 443, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError(f"Cannot resolve {parts.hostname}: {e}")
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split("%", 1)[0])
+        if not address.is_global:
+            raise ValueError(f"Refusing to download from non-public address {address}")
+
+
+def blob_path(digest: str) -> Path:
+    return BLOB_DIR / f"{digest}.mp4"
+
+
+def is_digest(value: str) -> bool:
+    return len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+
+def asset_url(digest: str) -> Optional[str]:
+    """Public URL of a cached blob, or None when PUBLIC_BASE_URL isn't configured."""
+    return f"{PUBLIC_BASE_URL}{ASSET_ROUTE}{digest}.mp4" if PUBLIC_BASE_URL else None
+
+
+def _digest_from_asset_url(url: str) -> Optional[str]:
+    if ASSET_ROUTE not in url:
+        return None
+    name = url.rsplit("/", 1)[-1].split("?", 1)[0]
+    digest = name[:-4] if name.endswith(".mp4") else name
+    return digest if is_digest(digest) else None
+
+
+def lookup(url: str) -> Optional[str]:
+    """Digest of the cached blob for a source URL or one of our asset URLs, if present."""
+    digest = _digest_from_asset_url(url)
+    if digest is None:
+        try:
+            digest = (URL_DIR / _url_key(url)).read_text().strip()
+        except OSError:
+            return None
+    path = blob_path(digest)
+    if not path.exists():
+        return None
+    touch(path)
+    return digest
+
+
+def touch(path: Path) -> None:
+    # mtime doubles as last-access time for eviction
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def fetch(url: str) -> Optional[str]:
+    """
+    Download url into the cache once and return its digest (None on failure, or if url
+    isn't a public http(s) address; see _check_url).
+    The body is streamed to a temp file while hashing, then renamed to its content address,
+    so concurrent workers never see a partial blob and identical bytes are stored once.
+    """
+    digest = lookup(url)
+    cache_lookup("assets", digest is not None)
+    if digest is not None:
+        return digest
+    with _url_lock(url):
+        digest = lookup(url)
+        if digest is not None:
+            return digest
+        BLOB_DIR.mkdir(parents=True, exist_ok=True)
+        URL_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = BLOB_DIR / f".{uuid.uuid4().hex}.part"
+        sha = hashlib.sha256()
+        try:
+            with observe_upstream("assets", "download"), open(tmp_path, "wb") as f:
+                _download(url, f, sha)
+            digest = sha.hexdigest()
+            os.replace(tmp_path, blob_path(digest))
+            (URL_DIR / _url_key(url)).write_text(digest)
+        except (httpx.HTTPError, OSError, ValueError):
+            return None
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+    evict()
+    return digest
+
+
+def _download(url: str, f, sha) -> None:
+    """Stream url into f, checking every redirect hop with _check_url and capping the size."""
+    for _ in range(MAX_REDIRECTS + 1):
+        _check_url(url)
+        with httpx.stream("GET", url, timeout=FETCH_TIMEOUT, follow_redirects=False) as resp:
+            if resp.is_redirect:
+                url = urljoin(url, resp.headers["location"])
+                continue
+            resp.raise_for_status()
+            if int(resp.headers.get("content-length") or 0) > FETCH_MAX_BYTES:
+                raise ValueError(f"Download larger than {FETCH_MAX_BYTES} bytes")
+            size = 0
+            for chunk in resp.iter_bytes(CHUNK_SIZE):
+                size += len(chunk)
+                if size > FETCH_MAX_BYTES:
+                    raise ValueError(f"Download larger than {FETCH_MAX_BYTES} bytes")
+                sha.update(chunk)
+                f.write(chunk)
+            return
+    raise ValueError(f"More than {MAX_REDIRECTS} redirects")
+
+
+def local_path(url: str) -> str:
+    """Local file for url, downloading it on first use. Raises ValueError if it can't be fetched."""
+    digest = fetch(url) if is_remote_url(url) else None
+    if digest is None:
+        raise ValueError(f"Could not download input {url}")
+    return str(blob_path(digest))
+
+
+def localize_result(result: dict) -> Tuple[dict, Optional[str]]:
+    """
+    For a succeeded poll result, when this API is publicly reachable: point video_url at the stable
+    local copy if it is cached (the provider's URL is kept as source_video_url). Never downloads;
+    returns (result, url) where url is a video to fetch in the background with prefetch(), if any.
+    """
+    url = result.get("video_url")
+    if not PUBLIC_BASE_URL or result.get("status") != "succeeded" or not url or _digest_from_asset_url(url):
+        return result, None
+    digest = lookup(url)
+    if digest is not None:
+        return {**result, "video_url": asset_url(digest), "source_video_url": url}, None
+    key = _url_key(url)
+    with _url_locks_guard:
+        if key in _downloading or time.monotonic() - _failed.get(key, float("-inf")) < RETRY_FAILED_SECONDS:
+            return result, None
+        _downloading.add(key)
+    return result, url
+
+
+def prefetch(url: str) -> Optional[str]:
+    """Background download of a url handed out by localize_result(); failures are remembered."""
+    key = _url_key(url)
+    digest = None
+    try:
+        digest = fetch(url)
+    finally:
+        now = time.monotonic()
+        with _url_locks_guard:
+            _downloading.discard(key)
+            if digest is None:
+                _failed[key] = now
+            else:
+                _failed.pop(key, None)
+            for stale in [k for k, at in _failed.items() if now - at >= RETRY_FAILED_SECONDS]:
+                del _failed[stale]
+    return digest
+
+
+def evict() -> int:
+    """Delete least-recently-used blobs until the cache fits in MAX_BYTES. Returns bytes freed."""
+    try:
+        blobs = [(p.stat(), p) for p in BLOB_DIR.glob("*.mp4")]
+    except OSError:
+        return 0
+    total = sum(st.st_size for st, _ in blobs)
+    freed = 0
+    for st, path in sorted(blobs, key=lambda b: b[0].st_mtime):
+        if total - freed <= MAX_BYTES:
+            break
+        # Keep anything touched in the last minute: a render may be about to read it
+        if time.time() - st.st_mtime < 60:
+            continue
+        try:
+            path.unlink()
+            freed += st.st_size
+        except OSError:
+            pass
+    return freed
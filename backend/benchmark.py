@@ -0,0 +1,407 @@
+"""
+Benchmark harness: drives the API in-process against fake_upstreams.py at a target concurrency
+and records throughput, latency percentiles, memory, CPU and response bytes per request.
+No real provider is called or billed.
+
+    python benchmark.py --scenario analyze --concurrency 16 --requests 200
+    python benchmark.py --scenario all --out bench_results.jsonl --save-baseline bench_baseline.json
+    python benchmark.py --scenario all --baseline bench_baseline.json   # exits 1 on a regression
+    python benchmark.py --scenario analyze --posts 200 --accept-encoding identity   # uncompressed, for comparison
+
+Scenarios:
+    analyze          POST /analyze (Apify Instagram runs + Claude analysis)
+    tiktok_analyze   POST /tiktok/analyze
+    generate_videos  POST /generate-videos (Claude concept + submits to every video provider)
+    backgrounds      POST /pipeline/generate-backgrounds, then poll both clips like the frontend
+    composite        POST /pipeline/composite (Shotstack), then poll until the render finishes
+    pipeline         POST /pipeline/run, then poll until the whole pipeline finishes
+
+Each request uses distinct inputs, so Apify reattach and the result caches don't short-circuit it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+BACKEND_DIR = Path(__file__).parent
+
+ANALYSIS = {
+    "trend_patterns": [{"pattern": "Fast hook", "description": "Bold claim up front", "frequency": "~70%"}],
+    "key_insights": "Short, punchy openings outperform.",
+    "video_proposal": {"title": "The 3-minute reset", "hook": "You're wasting your first hour.", "visual_style": {}},
+}
+
+TERMINAL = ("succeeded", "failed", "cancelled", "error", "timeout")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _rss_mb() -> float:
+    """Current resident set size (Linux /proc), falling back to the peak from getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def _percentile(values: list, pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))] * 1000, 1)
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=5,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def start_fakes(port: int, args) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "FAKE_UPSTREAM_LATENCY": str(args.latency),
+        "FAKE_UPSTREAM_RESPONSE_DELAY": str(args.response_delay),
+        "FAKE_ANTHROPIC_DELAY": str(args.anthropic_delay),
+        "FAKE_UPSTREAM_ERROR_RATE": str(args.error_rate),
+        "FAKE_UPSTREAM_FAIL_RATE": str(args.fail_rate),
+        "FAKE_UPSTREAM_SEED": str(args.seed),
+        "FAKE_APIFY_ITEMS": str(args.posts),
+        "FAKE_UPSTREAM_VIDEO_URL": f"http://127.0.0.1:{port}/media/fake-video.mp4",
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "fake_upstreams:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/fake/stats", timeout=1)
+            return proc
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("fake upstreams did not start")
+
+
+def configure_api(fake_url: str, state_dir: str, args) -> None:
+    """Point every provider at the fakes and keep all local state in a throwaway directory."""
+    os.environ.update({
+        "APIFY_BASE_URL": f"{fake_url}/apify",
+        "ANTHROPIC_BASE_URL": f"{fake_url}/anthropic",
+        "RUNWAYML_BASE_URL": f"{fake_url}/runway",
+        "LUMAAI_BASE_URL": f"{fake_url}/luma",
+        "HEYGEN_BASE_URL": f"{fake_url}/heygen",
+        "SHOTSTACK_BASE_URL": f"{fake_url}/shotstack",
+        "APIFY_TOKEN": "bench-apify",
+        "ANTHROPIC_API_KEY": "bench-anthropic",
+        "RUNWAYML_API_KEY": "bench-runway",
+        "FAL_KEY": "bench-fal",
+        "LUMAAI_API_KEY": "bench-luma",
+        "HEYGEN_API_KEY": "bench-heygen",
+        "SHOTSTACK_API_KEY": "bench-shotstack",
+        # Empty values also stop load_dotenv() from filling these in from .env: no webhooks, no public asset URLs
+        "PUBLIC_BASE_URL": "",
+        "WEBHOOK_SECRET": "",
+        "JOB_STORE_PATH": f"{state_dir}/jobs.db",
+        "ASSET_CACHE_DIR": f"{state_dir}/assets",
+        "ASSET_FETCH_ALLOW_HOSTS": urlsplit(fake_url).hostname,
+        "HEYGEN_CATALOG_PATH": f"{state_dir}/heygen_catalog.json",
+        "TRACE_EXPORT_PATH": f"{state_dir}/traces.jsonl" if args.trace else "",
+        "APIFY_POLL_INTERVAL": str(args.poll_interval),
+        "PIPELINE_POLL_INTERVAL": str(args.poll_interval),
+    })
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+
+def patch_fal(fake_url: str) -> None:
+    """fal_client's queue host is https-only and not configurable: point it at the fakes in-process."""
+    import fal_client.client
+    fal_client.client.QUEUE_URL_FORMAT = f"{fake_url}/fal/"
+
+
+async def _poll(client: httpx.AsyncClient, url: str, interval: float, timeout: float, done) -> dict:
+    deadline = time.monotonic() + timeout
+    while True:
+        resp = await client.get(url)
+        resp.raise_for_status()
+        body = resp.json()
+        if done(body) or time.monotonic() > deadline:
+            return body
+        await asyncio.sleep(interval)
+
+
+# Each scenario: async (client, i, args) -> True if the request (and any follow-up polling) succeeded
+
+async def scenario_analyze(client, i, args):
+    resp = await client.post("/analyze", json={"hashtags": [f"bench{i}"], "max_posts": min(args.posts, 200)})
+    resp.raise_for_status()
+    return bool(resp.json()["analysis"])
+
+
+async def scenario_tiktok_analyze(client, i, args):
+    resp = await client.post("/tiktok/analyze", json={"hashtags": [f"bench{i}"]})
+    resp.raise_for_status()
+    return bool(resp.json()["analysis"])
+
+
+async def scenario_generate_videos(client, i, args):
+    resp = await client.post("/generate-videos", json={"analysis": ANALYSIS, "hashtags": [f"bench{i}"]})
+    resp.raise_for_status()
+    return all(card.get("status") == "pending" for card in resp.json()["videos"])
+
+
+async def scenario_backgrounds(client, i, args):
+    resp = await client.post("/pipeline/generate-backgrounds", json={
+        "prompt_a": f"Bench clip {i} A, slow aerial drift", "prompt_b": f"Bench clip {i} B, macro texture", "model": "kling",
+    })
+    resp.raise_for_status()
+    results = await asyncio.gather(*(
+        _poll(client, f"/video-status/kling/{card['task_id']}", args.poll_interval, args.timeout,
+              lambda body: body.get("status") in TERMINAL)
+        for card in resp.json()["backgrounds"]
+    ))
+    return all(r.get("status") == "succeeded" for r in results)
+
+
+async def scenario_composite(client, i, args):
+    media = f"{args.fake_url}/media"
+    resp = await client.post("/pipeline/composite", json={
+        "heygen_video_url": f"{media}/avatar-{i}.mp4",
+        "background_video_url": f"{media}/background-{i}.mp4",
+        "hook_text": f"Bench hook {i}",
+        "engine": "shotstack",
+    })
+    resp.raise_for_status()
+    result = await _poll(client, f"/pipeline/composite-status/{resp.json()['render_id']}", args.poll_interval,
+                         args.timeout, lambda body: body.get("status") in TERMINAL)
+    return result.get("status") == "succeeded"
+
+
+async def scenario_pipeline(client, i, args):
+    resp = await client.post("/pipeline/run", json={
+        "analysis": ANALYSIS,
+        "hashtags": [f"bench{i}"],
+        "avatar_id": "fake-avatar-1",
+        "voice_id": "fake-voice-1",
+        "background_prompt": f"Bench background {i}, golden hour",
+        "background_model": "kling",
+        "engine": "shotstack",
+    })
+    resp.raise_for_status()
+    result = await _poll(client, f"/pipeline/run/{resp.json()['pipeline_id']}", args.poll_interval,
+                         args.timeout, lambda body: body.get("status") != "running")
+    return result.get("status") == "succeeded"
+
+
+SCENARIOS = {
+    "analyze": scenario_analyze,
+    "tiktok_analyze": scenario_tiktok_analyze,
+    "generate_videos": scenario_generate_videos,
+    "backgrounds": scenario_backgrounds,
+    "composite": scenario_composite,
+    "pipeline": scenario_pipeline,
+}
+
+
+async def run_scenario(name: str, client: httpx.AsyncClient, fakes: httpx.AsyncClient, args, offset: int) -> dict:
+    await fakes.delete("/fake/stats")
+    fn = SCENARIOS[name]
+    latencies, outcomes = [], Counter()
+    next_index = iter(range(offset, offset + args.requests))
+    rss_start = rss_peak = _rss_mb()
+    cpu_start, wire_start = time.process_time(), _wire["bytes"]
+    sampling = True
+
+    async def sample_memory():
+        nonlocal rss_peak
+        while sampling:
+            rss_peak = max(rss_peak, _rss_mb())
+            await asyncio.sleep(0.1)
+
+    async def worker():
+        for i in next_index:
+            started = time.perf_counter()
+            try:
+                ok = await fn(client, i, args)
+                outcomes["ok" if ok else "failed"] += 1
+            except httpx.HTTPStatusError as e:
+                outcomes[f"http_{e.response.status_code}"] += 1
+                ok = False
+            except Exception as e:
+                outcomes[type(e).__name__] += 1
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+
+    sampler = asyncio.create_task(sample_memory())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    duration = time.perf_counter() - started
+    cpu = time.process_time() - cpu_start
+    sampling = False
+    await sampler
+
+    upstream = (await fakes.get("/fake/stats")).json()["calls"]
+    return {
+        "scenario": name,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "ok": outcomes.pop("ok", 0),
+        "errors": dict(outcomes),
+        "duration_s": round(duration, 2),
+        "throughput_rps": round(len(latencies) / duration, 2) if duration else None,
+        "p50_ms": _percentile(latencies, 50),
+        "p90_ms": _percentile(latencies, 90),
+        "p99_ms": _percentile(latencies, 99),
+        "max_ms": round(max(latencies) * 1000, 1) if latencies else None,
+        "rss_start_mb": round(rss_start, 1),
+        "rss_peak_mb": round(rss_peak, 1),
+        "rss_end_mb": round(_rss_mb(), 1),
+        # This process runs the API and the client (fakes are a subprocess), so this is mostly API CPU
+        "cpu_ms_per_request": round(cpu / args.requests * 1000, 2),
+        "wire_kb_per_request": round((_wire["bytes"] - wire_start) / args.requests / 1024, 1),
+        "upstream_calls": upstream,
+    }
+
+
+_wire = Counter()  # response bytes as sent by the API, i.e. compressed when negotiated
+
+
+async def _count_wire_bytes(response: httpx.Response) -> None:
+    await response.aread()
+    _wire["bytes"] += response.num_bytes_downloaded
+
+
+async def run(args, names: list) -> list:
+    import main  # imported only now: provider base URLs and keys are read at import time
+
+    patch_fal(args.fake_url)
+
+    results = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with (
+        main.app.router.lifespan_context(main.app),
+        httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=args.timeout,
+            headers={"Accept-Encoding": args.accept_encoding} if args.accept_encoding else None,
+            event_hooks={"response": [_count_wire_bytes]},
+        ) as client,
+        httpx.AsyncClient(base_url=args.fake_url, timeout=10) as fakes,
+    ):
+        for n, name in enumerate(names):
+            results.append(await run_scenario(name, client, fakes, args, offset=n * args.requests))
+            print(_format_row(results[-1]), flush=True)
+    return results
+
+
+def _format_row(r: dict) -> str:
+    errors = ", ".join(f"{k}={v}" for k, v in r["errors"].items()) or "-"
+    return (
+        f"{r['scenario']:<16} ok {r['ok']:>4}/{r['requests']:<4} {r['throughput_rps']:>7} req/s  "
+        f"p50 {r['p50_ms']} ms  p99 {r['p99_ms']} ms  rss peak {r['rss_peak_mb']} MB  "
+        f"cpu {r['cpu_ms_per_request']} ms/req  {r['wire_kb_per_request']} KB/req  errors: {errors}"
+    )
+
+
+def compare(results: list, baseline: dict, tolerance: float) -> list:
+    """Regressions against a saved baseline: lower throughput, higher p50/p99 or more memory, beyond tolerance."""
+    regressions = []
+    for r in results:
+        base = baseline.get(r["scenario"])
+        if not base:
+            continue
+        checks = [
+            ("throughput_rps", lambda new, old: new < old * (1 - tolerance)),
+            ("p50_ms", lambda new, old: new > old * (1 + tolerance)),
+            ("p99_ms", lambda new, old: new > old * (1 + tolerance)),
+            ("rss_peak_mb", lambda new, old: new > old * (1 + tolerance)),
+        ]
+        for metric, worse in checks:
+            new, old = r.get(metric), base.get(metric)
+            if new is not None and old and worse(new, old):
+                regressions.append(f"{r['scenario']}: {metric} {old} -> {new}")
+        success, base_success = r["ok"] / r["requests"], base.get("ok", 0) / base.get("requests", 1)
+        if success < base_success:
+            regressions.append(f"{r['scenario']}: success rate {base_success:.0%} -> {success:.0%}")
+    return regressions
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", default="all", choices=[*SCENARIOS, "all"])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=40, help="requests per scenario")
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds until a fake upstream job finishes")
+    parser.add_argument("--response-delay", type=float, default=0.02, help="seconds added to every fake API response")
+    parser.add_argument("--anthropic-delay", type=float, default=0.5, help="seconds per fake Claude call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of submits answered with a 503")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of jobs that finish failed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--posts", type=int, default=30, help="posts per fake Apify dataset")
+    parser.add_argument("--accept-encoding", help="Accept-Encoding to send, e.g. identity; default httpx's")
+    parser.add_argument("--poll-interval", type=float, default=0.25, help="client and server-side poll interval")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout, including polling")
+    parser.add_argument("--trace", action="store_true", help="also export trace spans (off by default: file I/O)")
+    parser.add_argument("--out", help="append results as JSON lines to this file")
+    parser.add_argument("--baseline", help="baseline JSON to compare against; exit 1 on a regression")
+    parser.add_argument("--save-baseline", help="write these results as the new baseline JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    port = _free_port()
+    args.fake_url = f"http://127.0.0.1:{port}"
+    fakes = start_fakes(port, args)
+    try:
+        with tempfile.TemporaryDirectory(prefix="bench-") as state_dir:
+            configure_api(args.fake_url, state_dir, args)
+            results = asyncio.run(run(args, names))
+    finally:
+        fakes.terminate()
+        fakes.wait(timeout=10)
+
+    meta = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_rev": _git_rev(),
+        "python": sys.version.split()[0],
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "save_baseline")},
+    }
+    if args.out:
+        with open(args.out, "a") as f:
+            for r in results:
+                f.write(json.dumps({**meta, **r}) + "\n")
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps({r["scenario"]: r for r in results}, indent=2))
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
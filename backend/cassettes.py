@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+# Record every upstream HTTP exchange during a real session, then serve it back offline.
+# Every SDK here (anthropic, runwayml, lumaai, fal_client) and every hand-written client (Apify,
+# HeyGen, Shotstack, asset downloads) sends through httpx's default transports, so patching those
+# catches them all.
+#   UPSTREAM_CASSETTE_MODE=record  pass through and append each exchange to the cassette
+#   UPSTREAM_CASSETTE_MODE=replay  answer from the cassette; nothing leaves the machine
+# Replay matches on method + URL (credentials stripped), preferring a recording with the same body.
+# Repeated requests to one URL, e.g. status polls, get the recorded responses in order and then the last
+# one again. UPSTREAM_CASSETTE_SPEED scales the recorded upstream latency: 1 = as recorded, 10 = 10x faster,
+# 0 = no waiting.
+MODE = os.getenv("UPSTREAM_CASSETTE_MODE", "").strip().lower()
+CASSETTE_DIR = os.getenv("UPSTREAM_CASSETTE_DIR", str(Path(__file__).parent / ".cache" / "cassettes" / "default"))
+SPEED = float(os.getenv("UPSTREAM_CASSETTE_SPEED", "1"))
+
+INLINE_LIMIT = 64 * 1024  # larger or binary bodies go to bodies/<sha256>
+SECRET_PARAMS = {"token", "api_key", "apikey", "key"}
+DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "set-cookie"}
+TEXT_TYPES = ("json", "text", "xml", "javascript", "x-www-form-urlencoded")
+
+
+def normalize_url(url: httpx.URL) -> str:
+    params = [(k, v) for k, v in url.params.multi_items() if k.lower() not in SECRET_PARAMS]
+    return str(url.copy_with(params=params or None))
+
+
+def body_digest(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()[:16]
+
+
+class Cassette:
+    """One directory: exchanges.jsonl (one exchange per line) plus bodies/ for large or binary payloads."""
+
+    def __init__(self, directory: str):
+        self.dir = Path(directory)
+        self.path = self.dir / "exchanges.jsonl"
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._entries: Optional[dict] = None  # (method, url) -> [entry, ...] once loaded for replay
+        self._used: set = set()
+
+    # Recording
+
+    def record(self, request: httpx.Request, response: httpx.Response, body: bytes, elapsed: float) -> httpx.Response:
+        headers = [(k, v) for k, v in response.headers.multi_items() if k.lower() not in DROP_HEADERS]
+        entry = {
+            "method": request.method,
+            "url": normalize_url(request.url),
+            "request_sha": body_digest(request.content),
+            "status": response.status_code,
+            "headers": headers,
+            "at_ms": round((time.monotonic() - self._started) * 1000, 1),
+            "elapsed_ms": round(elapsed * 1000, 1),
+        }
+        content_type = response.headers.get("content-type", "")
+        if len(body) <= INLINE_LIMIT and (not content_type or any(t in content_type for t in TEXT_TYPES)):
+            try:
+                entry["body"] = body.decode()
+            except UnicodeDecodeError:
+                pass
+        with self._lock:
+            if "body" not in entry:
+                entry["body_file"] = hashlib.sha256(body).hexdigest()
+                blob = self.dir / "bodies" / entry["body_file"]
+                if not blob.exists():
+                    blob.parent.mkdir(parents=True, exist_ok=True)
+                    blob.write_bytes(body)
+            self.dir.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        # The body was decoded while reading it, hence the dropped content-encoding/length headers
+        return httpx.Response(response.status_code, headers=headers, content=body)
+
+    # Replay
+
+    def load(self) -> dict:
+        entries = defaultdict(list)
+        if self.path.exists():
+            with open(self.path) as f:
+                for i, line in enumerate(f):
+                    if line.strip():
+                        entry = json.loads(line)
+                        entry["index"] = i
+                        entries[(entry["method"], entry["url"])].append(entry)
+        return entries
+
+    def match(self, request: httpx.Request) -> dict:
+        with self._lock:
+            if self._entries is None:
+                self._entries = self.load()
+            candidates = self._entries.get((request.method, normalize_url(request.url)))
+            if not candidates:
+                raise httpx.ConnectError(
+                    f"No recorded exchange for {request.method} {normalize_url(request.url)} in {self.path}",
+                    request=request,
+                )
+            digest = body_digest(request.content)
+            unused = [e for e in candidates if e["index"] not in self._used]
+            entry = next((e for e in unused if e["request_sha"] == digest), None) or (unused[0] if unused else None)
+            if entry is None:
+                # Polled more often than during recording: keep answering with the final state
+                entry = next((e for e in reversed(candidates) if e["request_sha"] == digest), candidates[-1])
+            self._used.add(entry["index"])
+            return entry
+
+    def response(self, entry: dict) -> httpx.Response:
+        if "body" in entry:
+            content = entry["body"].encode()
+        else:
+            content = (self.dir / "bodies" / entry["body_file"]).read_bytes()
+        return httpx.Response(entry["status"], headers=entry["headers"], content=content)
+
+
+def _delay(entry: dict) -> float:
+    return entry["elapsed_ms"] / 1000 / SPEED if SPEED > 0 else 0.0
+
+
+_cassette: Optional[Cassette] = None
+_send_sync = httpx.HTTPTransport.handle_request
+_send_async = httpx.AsyncHTTPTransport.handle_async_request
+
+
+def _handle_request(transport: httpx.HTTPTransport, request: httpx.Request) -> httpx.Response:
+    request.read()
+    if MODE == "replay":
+        entry = _cassette.match(request)
+        time.sleep(_delay(entry))
+        return _cassette.response(entry)
+    started = time.perf_counter()
+    response = _send_sync(transport, request)
+    try:
+        body = response.read()
+    finally:
+        response.close()
+    return _cassette.record(request, response, body, time.perf_counter() - started)
+
+
+async def _handle_async_request(transport: httpx.AsyncHTTPTransport, request: httpx.Request) -> httpx.Response:
+    await request.aread()
+    if MODE == "replay":
+        entry = _cassette.match(request)
+        await asyncio.sleep(_delay(entry))
+        return _cassette.response(entry)
+    started = time.perf_counter()
+    response = await _send_async(transport, request)
+    try:
+        body = await response.aread()
+    finally:
+        await response.aclose()
+    return _cassette.record(request, response, body, time.perf_counter() - started)
+
+
+def install() -> None:
+    """Route httpx through the cassette when UPSTREAM_CASSETTE_MODE is record or replay; otherwise a no-op."""
+    global _cassette
+    if MODE not in ("record", "replay") or _cassette is not None:
+        return
+    _cassette = Cassette(CASSETTE_DIR)
+    httpx.HTTPTransport.handle_request = _handle_request
+    httpx.AsyncHTTPTransport.handle_async_request = _handle_async_request
+
+
+def summarize(directory: str) -> list:
+    """Per host: exchanges, payload bytes and recorded upstream time."""
+    cassette = Cassette(directory)
+    hosts = defaultdict(lambda: {"exchanges": 0, "bytes": 0, "upstream_ms": 0.0, "errors": 0})
+    for entries in cassette.load().values():
+        for entry in entries:
+            row = hosts[httpx.URL(entry["url"]).host]
+            row["exchanges"] += 1
+            row["upstream_ms"] += entry["elapsed_ms"]
+            row["errors"] += entry["status"] >= 400
+            if "body" in entry:
+                row["bytes"] += len(entry["body"].encode())
+            else:
+                row["bytes"] += (cassette.dir / "bodies" / entry["body_file"]).stat().st_size
+    return [{"host": host, **row, "upstream_ms": round(row["upstream_ms"], 1)} for host, row in sorted(hosts.items())]
+
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else CASSETTE_DIR
+    rows = summarize(directory)
+    if not rows:
+        sys.exit(f"No exchanges in {directory}")
+    print(f"{'host':<40} {'exchanges':>9} {'errors':>6} {'bytes':>12} {'upstream s':>10}")
+    for r in rows:
+        print(f"{r['host']:<40} {r['exchanges']:>9} {r['errors']:>6} {r['bytes']:>12} {r['upstream_ms'] / 1000:>10.1f}")
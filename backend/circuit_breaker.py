@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+import executors
+import rate_limit
+from executors import Saturated
+
+# Per-provider circuit breakers. When most of a provider's recent calls fail or crawl, its circuit opens:
+# generate_videos skips it, and its other submits and status polls fail fast (503 + Retry-After) instead
+# of each waiting out the 30s client timeout. After OPEN_SECONDS a single probe call is let through (half-open); if it
+# succeeds the circuit closes, otherwise it opens again. State is per worker process.
+WINDOW_SECONDS = float(os.getenv("BREAKER_WINDOW_SECONDS", "60"))  # rolling window of recent calls
+MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))  # calls in the window before it can trip
+ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "10"))
+SLOW_RATE = float(os.getenv("BREAKER_SLOW_RATE", "0.5"))
+OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+PROBE_TIMEOUT = 60.0  # a probe that never reports back (e.g. rejected before it ran) frees the slot after this
+
+# /video-status provider names: kling, pika and hailuo share fal but fail independently
+PROVIDERS = ("runway", "kling", "pika", "hailuo", "luma", "heygen", "shotstack")
+# Runway submits get a breaker per model ("runway:veo3.1"), so one model failing doesn't stop submits to the
+# others. Status polls stay on "runway": every model shares the tasks endpoint and a task id doesn't name its model.
+RUNWAY_MODELS = ("veo3.1", "gen4.5", "gen4_turbo")
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpen(Saturated):
+    """Raised instead of calling a provider whose circuit is open; served like Saturated, with Retry-After."""
+
+    def __init__(self, provider: str, retry_after: float):
+        Exception.__init__(self, f"{provider} is failing; not calling it for {retry_after:.0f}s")
+        self.pool = provider
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = deque()  # (finished_at, ok, slow) within the window
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self._trips = 0
+        self._rejected = 0
+        self._last_error: Optional[str] = None
+
+    def _refresh(self, now: float) -> None:
+        while self._calls and self._calls[0][0] < now - WINDOW_SECONDS:
+            self._calls.popleft()
+        if self._state == OPEN and now - self._opened_at >= OPEN_SECONDS:
+            self._state = HALF_OPEN
+            self._probe_started = None
+
+    def _open(self, now: float) -> None:
+        self._state = OPEN
+        self._opened_at = now
+        self._probe_started = None
+        self._calls.clear()
+        self._trips += 1
+
+    def _probe_free(self, now: float) -> bool:
+        return self._probe_started is None or now - self._probe_started > PROBE_TIMEOUT
+
+    def available(self) -> bool:
+        """Whether a call would be admitted right now (without taking the half-open probe)."""
+        now = time.monotonic()
+        with self._lock:
+            self._refresh(now)
+            return self._state == CLOSED or (self._state == HALF_OPEN and self._probe_free(now))
+
+    def before_call(self) -> None:
+        """Admit a call or raise CircuitOpen. While half-open, one probe is admitted at a time."""
+        now = time.monotonic()
+        with self._lock:
+            self._refresh(now)
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and self._probe_free(now):
+                self._probe_started = now
+                return
+            self._rejected += 1
+            raise CircuitOpen(self.name, max(1.0, self._opened_at + OPEN_SECONDS - now))
+
+    def record(self, ok: bool, seconds: float, error: Optional[str] = None) -> None:
+        now = time.monotonic()
+        slow = seconds >= SLOW_CALL_SECONDS
+        with self._lock:
+            if not ok:
+                self._last_error = error
+            self._refresh(now)
+            if self._state == HALF_OPEN:
+                if ok and not slow:
+                    self._state = CLOSED
+                    self._probe_started = None
+                else:
+                    self._open(now)
+                return
+            if self._state == OPEN:
+                return  # a call that started before the circuit opened
+            self._calls.append((now, ok, slow))
+            n = len(self._calls)
+            if n >= MIN_CALLS:
+                errors = sum(1 for _, ok, _ in self._calls if not ok)
+                slow_calls = sum(1 for _, _, slow in self._calls if slow)
+                if errors / n >= ERROR_RATE or slow_calls / n >= SLOW_RATE:
+                    self._open(now)
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            self._refresh(now)
+            n = len(self._calls)
+            return {
+                "state": self._state,
+                "calls": n,
+                "error_rate": round(sum(1 for _, ok, _ in self._calls if not ok) / n, 3) if n else None,
+                "slow_rate": round(sum(1 for _, _, slow in self._calls if slow) / n, 3) if n else None,
+                "retry_after_seconds": round(self._opened_at + OPEN_SECONDS - now, 1) if self._state == OPEN else None,
+                "trips_total": self._trips,
+                "rejected_total": self._rejected,
+                "last_error": self._last_error,
+            }
+
+
+breakers = {name: CircuitBreaker(name) for name in PROVIDERS + tuple(f"runway:{m}" for m in RUNWAY_MODELS)}
+
+
+def submit_breaker(provider: str, model: str) -> str:
+    """Breaker name for a submit to model on provider."""
+    return f"{provider}:{model}" if provider == "runway" else provider
+
+
+def guard(provider: str, fn):
+    """
+    Admit one call to provider now (raises CircuitOpen) and return fn wrapped to report its outcome.
+    Like a raised exception, a returned {"status": "error"} card or poll result counts as a failure.
+    Only upstream time is measured: rate-limiter queueing and retry backoff don't make a call slow.
+    """
+    breaker = breakers.get(provider)
+    if breaker is None:
+        return fn
+    breaker.before_call()
+
+    def wrapper(*args, **kwargs):
+        started = time.monotonic()
+        waited = rate_limit.waited()
+
+        def elapsed() -> float:
+            return time.monotonic() - started - (rate_limit.waited() - waited)
+
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            breaker.record(False, elapsed(), str(e))
+            raise
+        failed = isinstance(result, dict) and result.get("status") == "error"
+        breaker.record(not failed, elapsed(), result.get("error") if failed else None)
+        return result
+
+    return wrapper
+
+
+async def run_for(provider: str, fn, *args, admit: bool = True):
+    """
+    executors.run_for() through the provider's circuit breaker; raises CircuitOpen without queueing.
+    provider may be a submit_breaker() name; the call still runs on the provider's pool.
+    """
+    return await executors.run_for(provider.split(":")[0], guard(provider, fn), *args, admit=admit)
+
+
+def available(provider: str) -> bool:
+    breaker = breakers.get(provider)
+    return breaker is None or breaker.available()
+
+
+def states() -> dict:
+    return {name: breaker.snapshot() for name, breaker in breakers.items()}
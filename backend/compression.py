@@ -0,0 +1,100 @@
+import gzip
+import os
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only without it
+    brotli = None
+
+# Response compression negotiated from Accept-Encoding: brotli when the client takes it (and the
+# package is installed), else gzip. Only complete JSON/text bodies of at least MIN_BYTES are compressed;
+# streamed responses (video files and ranges) pass through untouched.
+MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))  # 4-5 is brotli's sweet spot for dynamic content
+
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)  # preference order on equal q
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """The supported encoding the client weights highest (q > 0), or None for identity."""
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name.strip():
+            weights[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in ENCODINGS:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """ASGI middleware: compresses single-message JSON/text responses of at least MIN_BYTES."""
+
+    def __init__(self, app, minimum_size: int = MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                response_headers = dict(message.get("headers", []))
+                content_type = response_headers.get(b"content-type", b"").decode("latin-1")
+                if b"content-encoding" in response_headers or not content_type.startswith(COMPRESSIBLE_TYPES):
+                    await send(message)
+                else:
+                    start = message  # held until we know whether the body is worth compressing
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            held, start = start, None
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                # Streamed or small: send as is
+                held["headers"] = [*held.get("headers", []), (b"vary", b"Accept-Encoding")]
+                await send(held)
+                await send(message)
+                return
+            body = compress(body, encoding)
+            held["headers"] = [
+                (k, v) for k, v in held.get("headers", []) if k.lower() != b"content-length"
+            ] + [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(body)).encode()),
+                (b"vary", b"Accept-Encoding"),
+            ]
+            await send(held)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,164 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+# One bounded thread pool per upstream, so a slow provider only queues behind itself
+# instead of starving every other provider's submits and polls in the shared default pool.
+# Override with e.g. RUNWAY_WORKERS=16, RUNWAY_MAX_QUEUE=64
+DEFAULT_POOLS = {
+    "anthropic": {"workers": 8, "max_queue": 32},
+    "runway": {"workers": 8, "max_queue": 64},
+    "fal": {"workers": 8, "max_queue": 64},
+    "luma": {"workers": 4, "max_queue": 32},
+    "heygen": {"workers": 8, "max_queue": 64},
+    "shotstack": {"workers": 8, "max_queue": 64},
+    "assets": {"workers": 4, "max_queue": 64},  # asset cache downloads
+}
+
+# /video-status provider -> pool (kling, pika and hailuo all run on fal)
+POOL_BY_PROVIDER = {
+    "runway": "runway",
+    "kling": "fal",
+    "pika": "fal",
+    "hailuo": "fal",
+    "luma": "luma",
+    "heygen": "heygen",
+    "shotstack": "shotstack",
+}
+
+WAIT_SAMPLES = 500
+
+
+class Saturated(Exception):
+    """Raised instead of queueing when an upstream's pool already has max_queue calls waiting."""
+
+    def __init__(self, pool: str, retry_after: float):
+        super().__init__(f"{pool} is saturated; retry in {retry_after:.0f}s")
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+class UpstreamExecutor:
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"upstream-{name}")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._rejected = 0
+        self._waits = deque(maxlen=WAIT_SAMPLES)  # seconds from submit to start
+        self._runtimes = deque(maxlen=WAIT_SAMPLES)
+
+    def _retry_after(self) -> float:
+        # Roughly how long the current backlog takes to drain at the recent call duration
+        with self._lock:
+            runtimes = sorted(self._runtimes)
+        typical = runtimes[len(runtimes) // 2] if runtimes else 1.0
+        return max(1.0, round(typical * (self._queued / self.workers + 1)))
+
+    async def run(self, fn, *args, admit: bool = True):
+        """
+        Run fn(*args) on this upstream's pool. With admit=True (request handlers) a full queue
+        raises Saturated immediately; background work passes admit=False and waits its turn.
+        """
+        with self._lock:
+            if admit and self._queued >= self.max_queue:
+                self._rejected += 1
+                rejected = True
+            else:
+                self._queued += 1
+                rejected = False
+        if rejected:
+            raise Saturated(self.name, self._retry_after())
+
+        submitted = time.monotonic()
+
+        def call():
+            started = time.monotonic()
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+                self._waits.append(started - submitted)
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._completed += 1
+                    self._runtimes.append(time.monotonic() - started)
+
+        def dequeue_if_cancelled(future):
+            # A call cancelled before it started never runs, so it never leaves the queue itself
+            if future.cancelled():
+                with self._lock:
+                    self._queued -= 1
+
+        try:
+            # Run in a copy of the caller's context so spans opened in the thread join its trace
+            future = self._pool.submit(contextvars.copy_context().run, call)
+        except RuntimeError:
+            with self._lock:
+                self._queued -= 1
+            raise
+        future.add_done_callback(dequeue_if_cancelled)
+        return await asyncio.wrap_future(future)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+
+            def pct(p: float) -> Optional[float]:
+                return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 1) if waits else None
+
+            return {
+                "workers": self.workers,
+                "active": self._active,
+                "queued": self._queued,
+                "max_queue": self.max_queue,
+                "completed_total": self._completed,
+                "rejected_total": self._rejected,
+                "wait_p50_ms": pct(0.5),
+                "wait_p95_ms": pct(0.95),
+            }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _build_executor(name: str, defaults: dict) -> UpstreamExecutor:
+    prefix = name.upper()
+    return UpstreamExecutor(
+        name,
+        workers=int(os.getenv(f"{prefix}_WORKERS", defaults["workers"])),
+        max_queue=int(os.getenv(f"{prefix}_MAX_QUEUE", defaults["max_queue"])),
+    )
+
+
+executors = {name: _build_executor(name, defaults) for name, defaults in DEFAULT_POOLS.items()}
+
+
+async def run(pool: str, fn, *args, admit: bool = True):
+    """Run a blocking call on the named upstream's pool (see UpstreamExecutor.run)."""
+    return await executors[pool].run(fn, *args, admit=admit)
+
+
+async def run_for(provider: str, fn, *args, admit: bool = True):
+    """Same as run(), keyed by /video-status provider name."""
+    return await run(POOL_BY_PROVIDER[provider], fn, *args, admit=admit)
+
+
+def executor_stats() -> dict:
+    return {name: executor.snapshot() for name, executor in executors.items()}
+
+
+def shutdown() -> None:
+    for executor in executors.values():
+        executor.shutdown()
@@ -0,0 +1,489 @@
+"""
+Local stand-ins for every upstream provider, for tests, offline runs and benchmarks (see benchmark.py).
+
+Run alongside the API:
+    uvicorn fake_upstreams:app --port 9000
+
+and point the API at it:
+    APIFY_BASE_URL=http://localhost:9000/apify
+    ANTHROPIC_BASE_URL=http://localhost:9000/anthropic
+    RUNWAYML_BASE_URL=http://localhost:9000/runway
+    LUMAAI_BASE_URL=http://localhost:9000/luma
+    HEYGEN_BASE_URL=http://localhost:9000/heygen
+    SHOTSTACK_BASE_URL=http://localhost:9000/shotstack
+    PUBLIC_BASE_URL=http://localhost:8000
+    WEBHOOK_SECRET=dev-secret
+
+Submitted jobs complete after FAKE_UPSTREAM_LATENCY seconds and, when the submit
+carried a callback URL, fire the provider's webhook in its real payload format.
+fal.ai's queue host is https-only and not configurable; point fal_client.client.QUEUE_URL_FORMAT
+at http://localhost:9000/fal/ in-process (benchmark.py does), or fire fal callbacks via fire_callback().
+
+Latency and error injection (env, or PUT /fake/config at runtime):
+    FAKE_UPSTREAM_RESPONSE_DELAY  seconds added to every API response
+    FAKE_ANTHROPIC_DELAY          seconds per Claude messages call
+    FAKE_UPSTREAM_ERROR_RATE      fraction of submits answered with a retryable 503
+    FAKE_UPSTREAM_FAIL_RATE       fraction of accepted jobs that finish failed
+    FAKE_UPSTREAM_SEED            seed for the injection RNG, so runs are repeatable
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from collections import Counter
+from typing import Optional
+
+import httpx
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+FAKE_LATENCY = float(os.getenv("FAKE_UPSTREAM_LATENCY", "2"))
+FAKE_VIDEO_URL = os.getenv("FAKE_UPSTREAM_VIDEO_URL", "https://example.com/fake-video.mp4")
+FAKE_VIDEO_BYTES = 256 * 1024  # size of the clip served at /media/
+
+config = {
+    "latency": FAKE_LATENCY,
+    "response_delay": float(os.getenv("FAKE_UPSTREAM_RESPONSE_DELAY", "0")),
+    "anthropic_delay": float(os.getenv("FAKE_ANTHROPIC_DELAY", "0")),
+    "error_rate": float(os.getenv("FAKE_UPSTREAM_ERROR_RATE", "0")),
+    "fail_rate": float(os.getenv("FAKE_UPSTREAM_FAIL_RATE", "0")),
+    "dataset_items": int(os.getenv("FAKE_APIFY_ITEMS", "30")),
+}
+_rng = random.Random(int(os.getenv("FAKE_UPSTREAM_SEED", "0")))
+_calls: Counter = Counter()  # "<service>.<operation>" -> requests served
+
+app = FastAPI(title="Fake upstream providers")
+
+# job_id -> {"done_at": float, "failed": bool}
+_jobs: dict = {}
+
+
+def fal_callback_payload(request_id: str, video_url: str = FAKE_VIDEO_URL, ok: bool = True) -> dict:
+    if ok:
+        return {"request_id": request_id, "status": "OK", "payload": {"video": {"url": video_url}}}
+    return {"request_id": request_id, "status": "ERROR", "payload": None, "error": "Fake generation failure"}
+
+
+def heygen_callback_payload(video_id: str, video_url: str = FAKE_VIDEO_URL, ok: bool = True) -> dict:
+    if ok:
+        return {"event_type": "avatar_video.success", "event_data": {"video_id": video_id, "url": video_url}}
+    return {"event_type": "avatar_video.fail", "event_data": {"video_id": video_id, "msg": "Fake generation failure"}}
+
+
+def shotstack_callback_payload(render_id: str, video_url: str = FAKE_VIDEO_URL, ok: bool = True) -> dict:
+    return {
+        "type": "edit",
+        "action": "render",
+        "id": render_id,
+        "status": "done" if ok else "failed",
+        "url": video_url if ok else None,
+        "error": None if ok else "Fake render failure",
+    }
+
+
+async def fire_callback(url: str, payload: dict, delay: float = 0.0) -> Optional[int]:
+    """POST a webhook payload to url after delay seconds. Returns the HTTP status, or None on connection error."""
+    if delay:
+        await asyncio.sleep(delay)
+    try:
+        async with httpx.AsyncClient(timeout=10) as client:
+            resp = await client.post(url, json=payload)
+            return resp.status_code
+    except httpx.HTTPError:
+        return None
+
+
+def _new_job(failed: Optional[bool] = None, **extra) -> str:
+    """Register a job finishing after config["latency"]; failed=None draws from config["fail_rate"]."""
+    if failed is None:
+        failed = _rng.random() < config["fail_rate"]
+    job_id = f"fake-{uuid.uuid4().hex[:12]}"
+    _jobs[job_id] = {"done_at": time.monotonic() + config["latency"], "failed": failed, **extra}
+    return job_id
+
+
+def _job_state(job_id: str) -> str:
+    job = _jobs.get(job_id)
+    if job is None:
+        return "missing"
+    if time.monotonic() < job["done_at"]:
+        return "running"
+    return "failed" if job["failed"] else "done"
+
+
+async def _serve(call: str, submit: bool = False, delay: Optional[float] = None) -> Optional[JSONResponse]:
+    """
+    Count the call and apply the configured response delay. Submits may instead get an injected
+    503, returned for the route to send back; None means carry on with the normal response.
+    """
+    _calls[call] += 1
+    await asyncio.sleep(config["response_delay"] if delay is None else delay)
+    if submit and _rng.random() < config["error_rate"]:
+        _calls["injected_errors"] += 1
+        return JSONResponse({"error": "Injected upstream error"}, status_code=503, headers={"Retry-After": "0"})
+    return None
+
+
+# ── Control ─────────────────────────────────────────────────────────────────
+
+@app.put("/fake/config")
+async def update_config(request: Request):
+    """Change latency/error knobs without a restart, e.g. between benchmark scenarios."""
+    body = await request.json()
+    for key, value in body.items():
+        if key == "seed":
+            _rng.seed(value)
+        elif key in config:
+            config[key] = type(config[key])(value)
+    return config
+
+
+@app.get("/fake/stats")
+async def fake_stats():
+    """Requests served per provider operation since startup (or the last reset)."""
+    return {"calls": dict(_calls), "jobs": len(_jobs)}
+
+
+@app.delete("/fake/stats")
+async def reset_stats():
+    _calls.clear()
+    _jobs.clear()
+    return {"calls": {}}
+
+
+@app.get("/media/{name}")
+async def media(name: str):
+    """A deterministic stand-in clip, so finished jobs point at something the asset cache can download."""
+    return Response((name.encode() * (FAKE_VIDEO_BYTES // len(name) + 1))[:FAKE_VIDEO_BYTES], media_type="video/mp4")
+
+
+# ── Apify ───────────────────────────────────────────────────────────────────
+
+_CAPTION_WORDS = (
+    "morning routine ideas that actually stick honestly this changed everything for me save it for later "
+    "three simple habits small wins every day coffee first then journaling no phone for an hour trust the "
+    "process link in bio comment below which one you will try tag a friend who needs this"
+).split()
+
+
+def _caption(i: int, prefix: str) -> str:
+    """A deterministic caption of real-post length (~450 characters) that doesn't compress unrealistically well."""
+    rng = random.Random(i)
+    words = [prefix]
+    while sum(len(w) + 1 for w in words) < 450:
+        words.append(rng.choice(_CAPTION_WORDS))
+    return " ".join(words) + " #routine #productivity"
+
+
+def _instagram_item(run_id: str, i: int) -> dict:
+    return {
+        "id": f"{run_id}-{i}",
+        "shortCode": f"C{run_id[-6:]}{i}",
+        "type": "Video" if i % 3 else "Image",
+        "likesCount": 100 + (i * 7919) % 50000,
+        "commentsCount": (i * 104729) % 900,
+        "caption": _caption(i, f"Fake post {i}:"),
+        "hashtags": ["routine", "productivity", f"tag{i % 5}"],
+        "displayUrl": f"https://example.com/post-{i}.jpg",
+        "timestamp": "2025-01-01T00:00:00.000Z",
+        "url": f"https://www.instagram.com/p/C{run_id[-6:]}{i}/",
+    }
+
+
+def _tiktok_item(run_id: str, i: int) -> dict:
+    return {
+        "id": f"{run_id}-{i}",
+        "text": _caption(i, f"Fake TikTok {i}:"),
+        "diggCount": 500 + (i * 7919) % 200000,
+        "commentCount": (i * 104729) % 3000,
+        "playCount": 10000 + (i * 15485863) % 2000000,
+        "shareCount": (i * 31) % 800,
+        "hashtags": [{"name": "routine"}, {"name": "fyp"}],
+        "covers": {"default": f"https://example.com/cover-{i}.jpg"},
+        "webVideoUrl": f"https://www.tiktok.com/@fake/video/{i}",
+        "createTimeISO": "2025-01-01T00:00:00.000Z",
+    }
+
+
+@app.post("/apify/acts/{actor_id}/runs")
+async def apify_start_run(actor_id: str):
+    if error := await _serve("apify.start", submit=True):
+        return error
+    run_id = _new_job(actor=actor_id)
+    return {"data": {"id": run_id, "status": "RUNNING", "defaultDatasetId": f"ds-{run_id}"}}
+
+
+@app.get("/apify/actor-runs/{run_id}")
+async def apify_run_status(run_id: str):
+    await _serve("apify.poll")
+    state = _job_state(run_id)
+    if state == "missing":
+        return JSONResponse({"error": {"type": "record-not-found"}}, status_code=404)
+    status = {"running": "RUNNING", "done": "SUCCEEDED"}.get(state, "FAILED")
+    return {"data": {"id": run_id, "status": status, "defaultDatasetId": f"ds-{run_id}"}}
+
+
+@app.get("/apify/datasets/{dataset_id}/items")
+async def apify_dataset_items(dataset_id: str):
+    await _serve("apify.fetch")
+    run_id = dataset_id.removeprefix("ds-")
+    actor = _jobs.get(run_id, {}).get("actor", "")
+    make_item = _tiktok_item if "tiktok" in actor else _instagram_item
+    return [make_item(run_id, i) for i in range(config["dataset_items"])]
+
+
+# ── Anthropic ───────────────────────────────────────────────────────────────
+
+def _fake_analysis() -> dict:
+    return {
+        "trend_patterns": [
+            {"pattern": "Fast hook", "description": "A bold claim in the first second", "frequency": "~70% of top posts"},
+            {"pattern": "Routine walkthrough", "description": "Step-by-step morning routines", "frequency": "~40% of top posts"},
+        ],
+        "key_insights": "Short, punchy openings outperform. Routine content with clear steps drives saves.",
+        "video_proposal": {
+            "title": "The 3-minute reset",
+            "hook": "You're wasting your first hour.",
+            "content_structure": [{"section": "Hook", "duration": "0-3 sec", "description": "Bold claim"}],
+            "visual_style": {"aesthetic": "raw", "lighting": "soft daylight", "color_palette": "warm", "editing_style": "fast"},
+            "hashtag_recommendations": ["routine", "productivity", "morning"],
+            "engagement_rationale": "Matches the dominant hook pattern.",
+        },
+    }
+
+
+def _fake_concept(n: int) -> dict:
+    return {
+        "concept_number": n,
+        "title": "The 3-minute reset",
+        "angle": "aspirational",
+        "hook": "You're wasting your first hour.",
+        "script_outline": [
+            {"timestamp": "0-3s", "action": "Alarm, hand reaches for phone"},
+            {"timestamp": "3-10s", "action": "Phone goes in a drawer"},
+            {"timestamp": "10-20s", "action": "Sunlight, stretching, coffee"},
+            {"timestamp": "20-30s", "action": "Follow for the full routine"},
+        ],
+        "runway_prompt": "Slow push-in on a sunlit kitchen counter, steam curling from a ceramic mug, golden hour rim light.",
+        "hashtags": ["routine", "morning", "productivity", "reset", "fyp"],
+    }
+
+
+def _fake_completion(prompt: str) -> str:
+    """Pick the response shape the calling stage parses, keyed on its prompt wording."""
+    if "Analyze these posts" in prompt:
+        return json.dumps(_fake_analysis())
+    if "video prompt variations" in prompt:
+        return json.dumps([
+            {"label": f"Angle {i}", "description": "Fake variation", "prompt": f"Fake cinematic prompt number {i}, slow aerial drift."}
+            for i in range(1, 8)
+        ])
+    return json.dumps([_fake_concept(1)])
+
+
+@app.post("/anthropic/v1/messages")
+async def anthropic_messages(request: Request):
+    if error := await _serve("anthropic.messages", submit=True, delay=config["anthropic_delay"]):
+        return error
+    body = await request.json()
+    content = body["messages"][0]["content"]
+    prompt = content if isinstance(content, str) else " ".join(c.get("text", "") for c in content)
+    text = _fake_completion(prompt)
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model", "claude-opus-4-6"),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4},
+    }
+
+
+# ── fal.ai queue (Kling, Pika, Hailuo) ──────────────────────────────────────
+
+def _fal_request_url(request: Request, owner: str, alias: str, request_id: str) -> str:
+    return str(request.base_url).rstrip("/") + f"/fal/{owner}/{alias}/requests/{request_id}"
+
+
+@app.get("/fal/{owner}/{alias}/requests/{request_id}/status")
+async def fal_status(owner: str, alias: str, request_id: str):
+    await _serve("fal.status")
+    state = _job_state(request_id)
+    if state == "missing":
+        return JSONResponse({"detail": "Request not found"}, status_code=404)
+    if state == "running":
+        return {"status": "IN_PROGRESS", "request_id": request_id, "logs": None}
+    return {"status": "COMPLETED", "request_id": request_id, "logs": None, "metrics": {}}
+
+
+@app.get("/fal/{owner}/{alias}/requests/{request_id}")
+async def fal_result(owner: str, alias: str, request_id: str):
+    await _serve("fal.result")
+    if _job_state(request_id) == "failed":
+        return JSONResponse({"detail": "Fake generation failure"}, status_code=500)
+    return {"video": {"url": FAKE_VIDEO_URL}}
+
+
+@app.put("/fal/{owner}/{alias}/requests/{request_id}/cancel")
+async def fal_cancel(owner: str, alias: str, request_id: str):
+    await _serve("fal.cancel")
+    _jobs.pop(request_id, None)
+    return {"status": "CANCELLATION_REQUESTED"}
+
+
+@app.post("/fal/{application:path}")
+async def fal_submit(application: str, request: Request):
+    if error := await _serve("fal.submit", submit=True):
+        return error
+    owner, alias = application.split("/")[:2]
+    request_id = _new_job()
+    webhook = request.query_params.get("fal_webhook")
+    if webhook:
+        ok = not _jobs[request_id]["failed"]
+        asyncio.create_task(fire_callback(webhook, fal_callback_payload(request_id, ok=ok), config["latency"]))
+    base = _fal_request_url(request, owner, alias, request_id)
+    return {
+        "request_id": request_id,
+        "response_url": base,
+        "status_url": f"{base}/status",
+        "cancel_url": f"{base}/cancel",
+    }
+
+
+# ── Runway ──────────────────────────────────────────────────────────────────
+
+@app.post("/runway/v1/text_to_video")
+@app.post("/runway/v1/image_to_video")
+async def runway_submit():
+    if error := await _serve("runway.submit", submit=True):
+        return error
+    return {"id": _new_job(created_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))}
+
+
+@app.get("/runway/v1/tasks/{task_id}")
+async def runway_task(task_id: str):
+    await _serve("runway.poll")
+    state = _job_state(task_id)
+    if state == "missing":
+        return JSONResponse({"error": "Task not found"}, status_code=404)
+    task = {"id": task_id, "createdAt": _jobs[task_id]["created_at"]}
+    if state == "running":
+        return {**task, "status": "RUNNING", "progress": 0.5}
+    if state == "failed":
+        return {**task, "status": "FAILED", "failure": "Fake generation failure"}
+    return {**task, "status": "SUCCEEDED", "output": [FAKE_VIDEO_URL]}
+
+
+@app.delete("/runway/v1/tasks/{task_id}", status_code=204)
+async def runway_cancel(task_id: str):
+    await _serve("runway.cancel")
+    _jobs.pop(task_id, None)
+
+
+# ── Luma ────────────────────────────────────────────────────────────────────
+
+@app.post("/luma/generations/video")
+async def luma_submit():
+    if error := await _serve("luma.submit", submit=True):
+        return error
+    return {"id": _new_job(), "state": "queued", "generation_type": "video"}
+
+
+@app.get("/luma/generations/{generation_id}")
+async def luma_generation(generation_id: str):
+    await _serve("luma.poll")
+    state = _job_state(generation_id)
+    if state == "missing":
+        return JSONResponse({"detail": "Generation not found"}, status_code=404)
+    luma_state = {"running": "dreaming", "done": "completed"}.get(state, "failed")
+    return {
+        "id": generation_id,
+        "state": luma_state,
+        "generation_type": "video",
+        "assets": {"video": FAKE_VIDEO_URL} if luma_state == "completed" else None,
+        "failure_reason": "Fake generation failure" if luma_state == "failed" else None,
+    }
+
+
+@app.delete("/luma/generations/{generation_id}", status_code=204)
+async def luma_cancel(generation_id: str):
+    await _serve("luma.cancel")
+    _jobs.pop(generation_id, None)
+
+
+# ── HeyGen ──────────────────────────────────────────────────────────────────
+
+@app.post("/heygen/v2/video/generate")
+async def heygen_generate(request: Request):
+    if error := await _serve("heygen.submit", submit=True):
+        return error
+    body = await request.json()
+    video_id = _new_job()
+    if body.get("callback_url"):
+        ok = not _jobs[video_id]["failed"]
+        asyncio.create_task(fire_callback(body["callback_url"], heygen_callback_payload(video_id, ok=ok), config["latency"]))
+    return {"error": None, "data": {"video_id": video_id}}
+
+
+@app.get("/heygen/v2/avatars")
+async def heygen_avatars():
+    await _serve("heygen.avatars")
+    avatars = [
+        {
+            "avatar_id": f"fake-avatar-{i}",
+            "avatar_name": f"Fake Avatar {i}",
+            "gender": "female" if i % 2 else "male",
+            "preview_image_url": f"https://example.com/avatar-{i}.jpg",
+        }
+        for i in range(40)
+    ]
+    return {"error": None, "data": {"avatars": avatars}}
+
+
+@app.get("/heygen/v2/voices")
+async def heygen_voices():
+    await _serve("heygen.voices")
+    voices = [
+        {
+            "voice_id": f"fake-voice-{i}",
+            "name": f"Fake Voice {i}",
+            "language": "English" if i % 4 else "Spanish",
+            "gender": "female" if i % 2 else "male",
+        }
+        for i in range(20)
+    ]
+    return {"error": None, "data": {"voices": voices}}
+
+
+@app.get("/heygen/v1/video_status.get")
+async def heygen_status(video_id: str):
+    await _serve("heygen.poll")
+    state = _job_state(video_id)
+    status = {"running": "processing", "done": "completed"}.get(state, "failed")
+    return {"data": {"status": status, "video_url": FAKE_VIDEO_URL if state == "done" else None}}
+
+
+# ── Shotstack ───────────────────────────────────────────────────────────────
+
+@app.post("/shotstack/render")
+async def shotstack_render(request: Request):
+    if error := await _serve("shotstack.submit", submit=True):
+        return error
+    body = await request.json()
+    render_id = _new_job()
+    if body.get("callback"):
+        ok = not _jobs[render_id]["failed"]
+        asyncio.create_task(fire_callback(body["callback"], shotstack_callback_payload(render_id, ok=ok), config["latency"]))
+    return {"success": True, "response": {"id": render_id}}
+
+
+@app.get("/shotstack/render/{render_id}")
+async def shotstack_status(render_id: str):
+    await _serve("shotstack.poll")
+    state = _job_state(render_id)
+    status = {"running": "rendering", "done": "done"}.get(state, "failed")
+    return {"response": {"id": render_id, "status": status, "url": FAKE_VIDEO_URL if state == "done" else None}}
@@ -1,57 +1,147 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
 import httpx
+import http_clients
+from webhooks import callback_url
+from rate_limit import limited_call
+from metrics import cache_lookup, observe_upstream
+from tracing import traced
 
-HEYGEN_BASE = "https://api.heygen.com"
+HEYGEN_BASE = os.getenv("HEYGEN_BASE_URL", "https://api.heygen.com")
 
+CATALOG_TTL = float(os.getenv("HEYGEN_CATALOG_TTL", "3600"))  # serve without revalidating
+CATALOG_MAX_STALE = float(os.getenv("HEYGEN_CATALOG_MAX_STALE", "86400"))  # serve stale while refreshing
+CATALOG_PATH = Path(os.getenv("HEYGEN_CATALOG_PATH", Path(__file__).parent / ".cache" / "heygen_catalog.json"))
 
-def fetch_heygen_config(api_key: str) -> dict:
+
+def _is_avatar_iv(a: dict) -> bool:
+    style = a.get("avatar_style") or a.get("style") or a.get("type") or ""
+    return "IV" in style.upper() or "4" in style
+
+
+async def fetch_heygen_config(api_key: str) -> dict:
     """
     Fetch Avatar IV avatars and English voices from HeyGen.
+    The two lists are fetched concurrently.
     Returns {"avatars": [...], "voices": [...]}
     """
     headers = {"x-api-key": api_key, "accept": "application/json"}
 
-    with httpx.Client(timeout=30) as client:
-        # Fetch avatars
-        resp = client.get(f"{HEYGEN_BASE}/v2/avatars", headers=headers)
-        resp.raise_for_status()
-        avatar_data = resp.json().get("data", {})
-        all_avatars = avatar_data.get("avatars", [])
+    client = http_clients.async_client("heygen")
+    async with observe_upstream("heygen", "catalog"):
+        avatar_resp, voice_resp = await asyncio.gather(
+            client.get(f"{HEYGEN_BASE}/v2/avatars", headers=headers),
+            client.get(f"{HEYGEN_BASE}/v2/voices", headers=headers),
+        )
+    avatar_resp.raise_for_status()
+    voice_resp.raise_for_status()
 
-        # Return all avatars; tag any that are identified as Avatar IV style
-        def _is_avatar_iv(a):
-            style = a.get("avatar_style") or a.get("style") or a.get("type") or ""
-            return "IV" in style.upper() or "4" in style
+    # Return all avatars; tag any that are identified as Avatar IV style
+    all_avatars = avatar_resp.json().get("data", {}).get("avatars", [])
+    avatars = [
+        {
+            "avatar_id": a.get("avatar_id"),
+            "name": a.get("avatar_name") or a.get("name", ""),
+            "thumbnail": a.get("preview_image_url") or a.get("preview_url"),
+            "gender": a.get("gender", ""),
+            "is_avatar_iv": _is_avatar_iv(a),
+        }
+        for a in all_avatars
+    ]
 
-        avatars = [
-            {
-                "avatar_id": a.get("avatar_id"),
-                "name": a.get("avatar_name") or a.get("name", ""),
-                "thumbnail": a.get("preview_image_url") or a.get("preview_url"),
-                "gender": a.get("gender", ""),
-                "is_avatar_iv": _is_avatar_iv(a),
-            }
-            for a in all_avatars
-        ]
+    # Filter for English voices
+    all_voices = voice_resp.json().get("data", {}).get("voices", [])
+    voices = [
+        {
+            "voice_id": v.get("voice_id"),
+            "name": v.get("name", ""),
+            "language": v.get("language", ""),
+            "gender": v.get("gender", ""),
+        }
+        for v in all_voices
+        if (v.get("language") or "").lower().startswith("en")
+    ]
 
-        # Fetch voices
-        resp = client.get(f"{HEYGEN_BASE}/v2/voices", headers=headers)
-        resp.raise_for_status()
-        voice_data = resp.json().get("data", {})
-        all_voices = voice_data.get("voices", [])
+    return {"avatars": avatars, "voices": voices}
 
-        # Filter for English voices
-        voices = [
-            {
-                "voice_id": v.get("voice_id"),
-                "name": v.get("name", ""),
-                "language": v.get("language", ""),
-                "gender": v.get("gender", ""),
-            }
-            for v in all_voices
-            if (v.get("language") or "").lower().startswith("en")
-        ]
 
-    return {"avatars": avatars, "voices": voices}
+class HeyGenCatalogCache:
+    """
+    In-process + on-disk cache of the avatar/voice catalog with stale-while-revalidate.
+    Fresh (< CATALOG_TTL): served as-is.
+    Stale (< CATALOG_MAX_STALE): served immediately while one background refresh runs.
+    Older or missing: fetched inline.
+    Entries are keyed by a hash of the API key so different accounts never share a catalog.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._entries = {}  # key_hash -> {"fetched_at": float, "catalog": dict}
+        self._refreshing = {}  # key_hash -> asyncio.Task
+        self._load()
+
+    @staticmethod
+    def _key(api_key: str) -> str:
+        return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+    async def get(self, api_key: str) -> dict:
+        key = self._key(api_key)
+        entry = self._entries.get(key)
+        age = time.time() - entry["fetched_at"] if entry else None
+
+        if entry is not None and age < CATALOG_TTL:
+            cache_lookup("heygen_catalog", True)
+            return entry["catalog"]
+        if entry is not None and age < CATALOG_MAX_STALE:
+            cache_lookup("heygen_catalog", True)
+            self._start_refresh(key, api_key)
+            return entry["catalog"]
+        cache_lookup("heygen_catalog", False)
+
+        # Nothing usable — wait for the refresh (joining one already in flight)
+        await asyncio.shield(self._start_refresh(key, api_key))
+        return self._entries[key]["catalog"]
+
+    def _start_refresh(self, key: str, api_key: str) -> asyncio.Task:
+        task = self._refreshing.get(key)
+        if task is None:
+            task = asyncio.create_task(self._refresh(key, api_key))
+            # Background refresh errors are retried on the next request; don't log them as unretrieved
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._refreshing[key] = task
+        return task
+
+    async def _refresh(self, key: str, api_key: str) -> None:
+        try:
+            catalog = await fetch_heygen_config(api_key)
+            self._entries[key] = {"fetched_at": time.time(), "catalog": catalog}
+            self._save()
+        finally:
+            self._refreshing.pop(key, None)
+
+    def _load(self) -> None:
+        try:
+            with open(self.path) as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def _save(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+
+catalog_cache = HeyGenCatalogCache(CATALOG_PATH)
 
 
 def build_spoken_script(concept: dict, max_words: int = 22) -> str:
@@ -71,6 +161,7 @@ def build_spoken_script(concept: dict, max_words: int = 22) -> str:
     return " ".join(words)
 
 
+@traced()
 def submit_heygen_task(
     api_key: str,
     concept: dict,
@@ -116,17 +207,23 @@ def submit_heygen_task(
         ],
         "dimension": {"width": 720, "height": 1280},
     }
+    webhook_url = callback_url("heygen", "heygen")
+    if webhook_url:
+        payload["callback_url"] = webhook_url
+
+    def _post() -> httpx.Response:
+        resp = http_clients.client("heygen").post(
+            f"{HEYGEN_BASE}/v2/video/generate",
+            headers=headers,
+            json=payload,
+        )
+        resp.raise_for_status()
+        return resp
 
     try:
-        with httpx.Client(timeout=30) as client:
-            resp = client.post(
-                f"{HEYGEN_BASE}/v2/video/generate",
-                headers=headers,
-                json=payload,
-            )
-            resp.raise_for_status()
-            data = resp.json().get("data", {})
-            video_id = data.get("video_id")
+        resp = limited_call("heygen", _post)
+        data = resp.json().get("data", {})
+        video_id = data.get("video_id")
 
         return {
             **concept,
@@ -157,14 +254,13 @@ def poll_heygen_task(api_key: str, video_id: str) -> dict:
     headers = {"x-api-key": api_key, "accept": "application/json"}
 
     try:
-        with httpx.Client(timeout=30) as client:
-            resp = client.get(
-                f"{HEYGEN_BASE}/v1/video_status.get",
-                headers=headers,
-                params={"video_id": video_id},
-            )
-            resp.raise_for_status()
-            data = resp.json().get("data", {})
+        resp = http_clients.client("heygen").get(
+            f"{HEYGEN_BASE}/v1/video_status.get",
+            headers=headers,
+            params={"video_id": video_id},
+        )
+        resp.raise_for_status()
+        data = resp.json().get("data", {})
 
         status = data.get("status", "pending")
 
@@ -189,7 +285,7 @@ def poll_heygen_task(api_key: str, video_id: str) -> dict:
             }
         else:
             # pending, processing, waiting
-            return {"task_id": video_id, "status": "pending", "video_url": None}
+            return {"task_id": video_id, "status": "pending", "video_url": None, "running": status == "processing"}
 
     except Exception as e:
         return {"task_id": video_id, "status": "error", "video_url": None, "error": str(e)}
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import threading
+
+import httpx
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:  # optional: HTTP/1.1 keep-alive only without it
+    HTTP2 = False
+
+# Long-lived HTTP clients per upstream. Submits and status polls reuse warm connections (multiplexed
+# over one on HTTP/2) instead of paying a TCP+TLS handshake, and building a fresh SSL context, on
+# every call. Blocking calls on the upstream's executor pool use client(); coroutines use async_client().
+# The app lifespan opens them at startup and closes them on shutdown; outside the app they are
+# created on first use.
+TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))  # idle seconds before a pooled connection closes
+
+# Pooled connections per upstream, sized to its executor pool. Override with e.g. HEYGEN_HTTP_CONNECTIONS=32
+DEFAULT_CONNECTIONS = {
+    "heygen": 16,
+    "shotstack": 16,
+    "apify": 8,
+}
+
+_lock = threading.Lock()
+_sync: dict = {}  # upstream -> httpx.Client
+_async: dict = {}  # upstream -> (event loop, httpx.AsyncClient)
+
+
+def _options(upstream: str) -> dict:
+    connections = int(os.getenv(f"{upstream.upper()}_HTTP_CONNECTIONS", DEFAULT_CONNECTIONS[upstream]))
+    return {
+        "http2": HTTP2,
+        "timeout": TIMEOUT,
+        "limits": httpx.Limits(
+            max_connections=connections, max_keepalive_connections=connections, keepalive_expiry=KEEPALIVE_EXPIRY
+        ),
+    }
+
+
+def client(upstream: str) -> httpx.Client:
+    """The shared blocking client for an upstream in DEFAULT_CONNECTIONS (thread-safe)."""
+    shared = _sync.get(upstream)
+    if shared is None:
+        with _lock:
+            shared = _sync.get(upstream)
+            if shared is None:
+                shared = _sync[upstream] = httpx.Client(**_options(upstream))
+    return shared
+
+
+def async_client(upstream: str) -> httpx.AsyncClient:
+    """The shared async client for an upstream, bound to the running event loop."""
+    loop = asyncio.get_running_loop()
+    entry = _async.get(upstream)
+    if entry is None or entry[0] is not loop:
+        # First use, or a new loop (scripts calling asyncio.run repeatedly): pooled connections can't cross loops
+        entry = _async[upstream] = (loop, httpx.AsyncClient(**_options(upstream)))
+    return entry[1]
+
+
+def start() -> None:
+    """Open every upstream's clients (app startup, on the serving loop)."""
+    for upstream in DEFAULT_CONNECTIONS:
+        client(upstream)
+        async_client(upstream)
+
+
+async def aclose() -> None:
+    """Close every pooled connection (app shutdown)."""
+    with _lock:
+        sync_clients = list(_sync.values())
+        _sync.clear()
+    for shared in sync_clients:
+        shared.close()
+    async_clients = [c for loop, c in _async.values() if loop is asyncio.get_running_loop()]
+    _async.clear()
+    for shared in async_clients:
+        await shared.aclose()
+
+
+def pool_stats() -> dict:
+    """Open connections per upstream client, for /queue-stats."""
+    stats = {}
+    for upstream in DEFAULT_CONNECTIONS:
+        stats[upstream] = {
+            "http2": HTTP2,
+            "sync_connections": _connections(_sync.get(upstream)),
+            "async_connections": _connections((_async.get(upstream) or (None, None))[1]),
+        }
+    return stats
+
+
+def _connections(shared) -> int:
+    pool = getattr(getattr(shared, "_transport", None), "_pool", None)
+    return len(getattr(pool, "connections", ()))
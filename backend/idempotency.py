@@ -0,0 +1,179 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+
+from job_store import job_store
+from metrics import cache_lookup
+
+# Idempotency-Key support for the endpoints that submit paid provider work, so a double-click or a
+# retried request doesn't submit the same jobs twice. Keys live in the shared job store (scoped by path)
+# for TTL_SECONDS; the worker running the original holds a lease on it, renewed by the maintenance
+# heartbeat, so a repeat arriving at another worker waits for that response instead of resubmitting.
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "600"))  # how long a repeat waits for the original
+MAX_BODY = int(os.getenv("IDEMPOTENCY_MAX_BODY", str(1024 ** 2)))  # larger responses are not kept
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.25
+
+PROVIDER = "idempotency"
+
+_active: set = set()  # keys this worker is running the original request for
+
+
+def active() -> list:
+    return list(_active)
+
+
+def prune() -> int:
+    return job_store.prune(kinds=("idempotency",), max_age=TTL_SECONDS)
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if message["type"] != "http.request" or not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+def _fingerprint(body: bytes) -> str:
+    """Hash of the request body; JSON is canonicalized first, so key order and whitespace don't matter."""
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode()
+    except ValueError:
+        pass
+    return hashlib.sha256(body).hexdigest()
+
+
+async def _store(fn, *args):
+    """Run a blocking job-store call off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+def _replaying(body: bytes, receive):
+    """A receive callable that hands the already-read body to the app, then defers to the real one."""
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return replay
+
+
+async def _send(send, status: int, body: bytes, content_type: str = "application/json", headers: list = ()) -> None:
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", content_type.encode("latin-1")),
+            (b"content-length", str(len(body)).encode()),
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_error(send, status: int, detail: str, headers: list = ()) -> None:
+    await _send(send, status, json.dumps({"detail": detail}).encode(), headers=headers)
+
+
+def _template(path: str):
+    """A route template's {param} segments match any single path segment."""
+    return re.compile(re.sub(r"\\\{[^/]+?\\\}", "[^/]+", re.escape(path)))
+
+
+class IdempotencyMiddleware:
+    """
+    For POSTs to `paths` that carry an Idempotency-Key: the first request runs and its 2xx response is kept.
+    A repeat with the same key and body (compared as canonical JSON) gets that response back (with
+    Idempotent-Replayed: true), after waiting for it if the original is still running. If the original
+    failed, the repeat runs afresh.
+    The same key with a different body is rejected with 422. Paths may be route templates
+    ("/pipeline/composite/{render_id}/approve"); keys are scoped to the concrete path.
+    """
+
+    def __init__(self, app, paths):
+        self.app = app
+        self.paths = {p for p in paths if "{" not in p}
+        self.templates = [_template(p) for p in paths if "{" in p]
+
+    def _matches(self, path: str) -> bool:
+        return path in self.paths or any(t.fullmatch(path) for t in self.templates)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not self._matches(scope["path"]):
+            return await self.app(scope, receive, send)
+        key = dict(scope["headers"]).get(HEADER.lower().encode(), b"").decode("latin-1").strip()
+        if not key:
+            return await self.app(scope, receive, send)
+        if len(key) > MAX_KEY_LENGTH:
+            return await _send_error(send, 400, f"{HEADER} must be at most {MAX_KEY_LENGTH} characters")
+
+        body = await _read_body(receive)
+        fingerprint = _fingerprint(body)
+        record_id = f"{scope['path']}:{key}"
+
+        deadline = time.monotonic() + WAIT_SECONDS
+        while not await _store(job_store.insert, "idempotency", PROVIDER, record_id, "running", {"fingerprint": fingerprint}):
+            job = await _store(job_store.get, PROVIDER, record_id)
+            if job is None:
+                continue  # the original just failed and released the key: run it here
+            if (job["params"] or {}).get("fingerprint") != fingerprint:
+                return await _send_error(send, 422, f"{HEADER} was already used with a different request body")
+            if job["status"] == "succeeded" and job["result"]:
+                cache_lookup("idempotency", True)
+                stored = job["result"]
+                return await _send(
+                    send, stored["status_code"], stored["body"].encode(), stored["content_type"],
+                    headers=[(REPLAYED_HEADER.lower().encode(), b"true")],
+                )
+            if record_id not in _active and await _store(job_store.claim, PROVIDER, record_id):
+                break  # lease expired: the worker running the original died, so run it here
+            if time.monotonic() > deadline:
+                return await _send_error(
+                    send, 409, f"A request with this {HEADER} is still in progress", headers=[(b"retry-after", b"5")],
+                )
+            await asyncio.sleep(POLL_INTERVAL)
+
+        cache_lookup("idempotency", False)
+        _active.add(record_id)
+        response = {"status_code": None, "content_type": "application/json", "chunks": []}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                response["status_code"] = message["status"]
+                for name, value in message.get("headers", []):
+                    if name.lower() == b"content-type":
+                        response["content_type"] = value.decode("latin-1")
+            elif message["type"] == "http.response.body":
+                response["chunks"].append(message.get("body", b""))
+            await send(message)
+
+        kept = False
+        try:
+            await self.app(scope, _replaying(body, receive), capture)
+            content = b"".join(response["chunks"])
+            if response["status_code"] is not None and 200 <= response["status_code"] < 300 and len(content) <= MAX_BODY:
+                try:
+                    await _store(job_store.update, PROVIDER, record_id, "succeeded", {
+                        "status_code": response["status_code"],
+                        "content_type": response["content_type"],
+                        "body": content.decode(),
+                    })
+                    kept = True
+                except UnicodeDecodeError:
+                    pass
+        finally:
+            _active.discard(record_id)
+            if not kept:
+                await _store(job_store.delete, PROVIDER, record_id)
@@ -0,0 +1,78 @@
+import asyncio
+import hashlib
+import io
+import os
+import time
+from typing import BinaryIO, Tuple
+
+from fastapi import UploadFile
+
+from job_store import job_store
+from metrics import cache_lookup, observe_upstream
+from startup import sdk
+
+fal_client = sdk("fal")
+
+# Reference images only need to cover the 720x1280 generation frame; anything larger
+# is downscaled before upload so fewer bytes go over the wire.
+MAX_DIMENSION = int(os.getenv("UPLOAD_MAX_DIMENSION", "1280"))
+JPEG_QUALITY = int(os.getenv("UPLOAD_JPEG_QUALITY", "90"))
+# fal CDN URLs outlive this comfortably; after it, a duplicate is uploaded again
+URL_TTL = float(os.getenv("UPLOAD_URL_TTL", "86400"))
+HASH_CHUNK = 1024 * 1024
+
+
+async def _content_hash(file: UploadFile) -> str:
+    """sha256 of the upload, read in chunks from the spooled upload file and rewound afterwards."""
+    sha = hashlib.sha256()
+    while chunk := await file.read(HASH_CHUNK):
+        sha.update(chunk)
+    await file.seek(0)
+    return sha.hexdigest()
+
+
+def _prepare(fileobj: BinaryIO, content_type: str) -> Tuple[bytes, str]:
+    """
+    Downscale images larger than MAX_DIMENSION (EXIF rotation applied first).
+    Images already small enough, and anything Pillow can't read, are passed through unchanged.
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError  # only uploads need Pillow
+
+    try:
+        image = Image.open(fileobj)  # lazy: reads the header only
+        oversized = max(image.size) > MAX_DIMENSION
+    except (UnidentifiedImageError, OSError):
+        oversized = False
+    if not oversized:
+        fileobj.seek(0)
+        return fileobj.read(), content_type
+
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.LANCZOS)
+    buffer = io.BytesIO()
+    if image.mode in ("RGBA", "LA", "P") and "png" in content_type:
+        image.save(buffer, format="PNG", optimize=True)
+        return buffer.getvalue(), "image/png"
+    image.convert("RGB").save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    return buffer.getvalue(), "image/jpeg"
+
+
+async def upload_image(fal_key: str, file: UploadFile) -> dict:
+    """
+    Upload an image to the fal CDN, deduplicated by content hash.
+    A repeat upload of the same bytes returns the earlier CDN URL without touching fal.
+    """
+    content_type = file.content_type or "image/jpeg"
+    key = f"{await _content_hash(file)}-{MAX_DIMENSION}"
+    job = job_store.get("fal_cdn", key)
+    hit = job is not None and job["result"] and time.time() - job["updated_at"] < URL_TTL
+    cache_lookup("fal_uploads", bool(hit))
+    if hit:
+        return {"url": job["result"]["url"], "cached": True}
+
+    loop = asyncio.get_event_loop()
+    data, upload_type = await loop.run_in_executor(None, _prepare, file.file, content_type)
+    with observe_upstream("fal", "upload"):
+        url = await fal_client.AsyncClient(key=fal_key).upload(data, upload_type, file_name=file.filename)
+    job_store.upsert("upload", "fal_cdn", key, "succeeded", result={"url": url, "bytes": len(data)})
+    return {"url": url, "cached": False}
@@ -0,0 +1,261 @@
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import tracing
+
+# Shared, durable record of in-flight upstream work: Apify runs, provider tasks, renders and
+# pipeline runs. SQLite in WAL mode lets every uvicorn worker on the host read and write it.
+DB_PATH = Path(os.getenv("JOB_STORE_PATH", Path(__file__).parent / ".cache" / "jobs.db"))
+LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(7 * 86400)))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+UNFINISHED_STATUSES = ("pending", "running")
+_UNFINISHED_SQL = "('pending', 'running')"
+# Once a provider task reaches one of these states it never changes again
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+
+# Telemetry model name -> /video-status provider, so a submitted card can be polled after a restart
+PROVIDER_BY_MODEL = {
+    "veo3.1": "runway",
+    "gen4.5": "runway",
+    "gen4_turbo-img2vid": "runway",
+    "kling-2.6-pro": "kling",
+    "kling-2.6-pro-img2vid": "kling",
+    "pika-2.2": "pika",
+    "hailuo-02-pro": "hailuo",
+    "ray-2": "luma",
+    "Avatar IV": "heygen",
+    "shotstack": "shotstack",
+    "local-ffmpeg": "local",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id      TEXT PRIMARY KEY,   -- '<provider>:<external_id>'
+    kind        TEXT NOT NULL,      -- apify_run | task | render | pipeline | upload | analysis | analysis_step | idempotency | hedge | preview
+    provider    TEXT NOT NULL,
+    external_id TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    input_hash  TEXT,               -- Apify: hash of the actor input, for reattaching to a run
+    params      TEXT,               -- JSON
+    result      TEXT,               -- JSON
+    lease_owner TEXT,
+    lease_until REAL,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_updated ON jobs (status, updated_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_updated ON jobs (updated_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_input ON jobs (kind, input_hash, created_at);
+"""
+
+
+class JobStore:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are per-thread; executor threads each get their own
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row(row: Optional[sqlite3.Row]) -> Optional[dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"]) if job["params"] else None
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def upsert(
+        self,
+        kind: str,
+        provider: str,
+        external_id: str,
+        status: str,
+        params: dict = None,
+        result: dict = None,
+        input_hash: str = None,
+    ) -> None:
+        now = time.time()
+        self._conn().execute(
+            """
+            INSERT INTO jobs (job_id, kind, provider, external_id, status, input_hash, params, result, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (job_id) DO UPDATE SET
+                status = excluded.status,
+                params = COALESCE(excluded.params, jobs.params),
+                result = COALESCE(excluded.result, jobs.result),
+                updated_at = excluded.updated_at
+            """,
+            (
+                f"{provider}:{external_id}", kind, provider, external_id, status, input_hash,
+                json.dumps(params) if params is not None else None,
+                json.dumps(result) if result is not None else None,
+                now, now,
+            ),
+        )
+
+    def insert(
+        self,
+        kind: str,
+        provider: str,
+        external_id: str,
+        status: str,
+        params: dict = None,
+        owner: str = WORKER_ID,
+        lease: float = LEASE_SECONDS,
+    ) -> bool:
+        """Create a job leased to owner unless one with this id already exists. Returns True if created."""
+        now = time.time()
+        cur = self._conn().execute(
+            """
+            INSERT OR IGNORE INTO jobs
+                (job_id, kind, provider, external_id, status, params, lease_owner, lease_until, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                f"{provider}:{external_id}", kind, provider, external_id, status,
+                json.dumps(params) if params is not None else None, owner, now + lease, now, now,
+            ),
+        )
+        return cur.rowcount == 1
+
+    def delete(self, provider: str, external_id: str) -> None:
+        self._conn().execute("DELETE FROM jobs WHERE job_id = ?", (f"{provider}:{external_id}",))
+
+    def update(self, provider: str, external_id: str, status: str, result: dict = None) -> None:
+        """
+        Update a job's status; terminal jobs are never moved back to an unfinished state.
+        An "error" row (a failed call, not a finished job) may still move back to pending/running.
+        """
+        self._conn().execute(
+            f"""
+            UPDATE jobs SET status = ?, result = COALESCE(?, result), updated_at = ?
+            WHERE job_id = ? AND (status IN {_UNFINISHED_SQL} OR status = 'error' OR ? NOT IN {_UNFINISHED_SQL})
+            """,
+            (status, json.dumps(result) if result is not None else None, time.time(), f"{provider}:{external_id}", status),
+        )
+
+    def get(self, provider: str, external_id: str) -> Optional[dict]:
+        row = self._conn().execute("SELECT * FROM jobs WHERE job_id = ?", (f"{provider}:{external_id}",)).fetchone()
+        return self._row(row)
+
+    def find_by_input(self, kind: str, input_hash: str, max_age: float) -> Optional[dict]:
+        """Most recent job with this input that hasn't failed, within max_age seconds."""
+        row = self._conn().execute(
+            """
+            SELECT * FROM jobs
+            WHERE kind = ? AND input_hash = ? AND created_at > ? AND status IN ('pending', 'running', 'succeeded')
+            ORDER BY created_at DESC LIMIT 1
+            """,
+            (kind, input_hash, time.time() - max_age),
+        ).fetchone()
+        return self._row(row)
+
+    def unfinished(self, kinds: Iterable[str], idle: float = 0, max_age: float = 86400) -> List[dict]:
+        """Unfinished jobs of these kinds not updated for at least idle seconds (nobody is polling them)."""
+        kinds = list(kinds)
+        now = time.time()
+        rows = self._conn().execute(
+            f"""
+            SELECT * FROM jobs
+            WHERE status IN {_UNFINISHED_SQL} AND updated_at BETWEEN ? AND ? AND kind IN ({",".join("?" * len(kinds))})
+            ORDER BY updated_at
+            """,
+            (now - max_age, now - idle, *kinds),
+        ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def claim(self, provider: str, external_id: str, owner: str = WORKER_ID, lease: float = LEASE_SECONDS) -> bool:
+        """
+        Take (or renew) the lease on a job. Returns False if another live worker holds it.
+        Used so exactly one worker drives a pipeline, and a dead worker's pipelines are picked up.
+        """
+        now = time.time()
+        cur = self._conn().execute(
+            """
+            UPDATE jobs SET lease_owner = ?, lease_until = ?
+            WHERE job_id = ? AND (lease_owner IS NULL OR lease_owner = ? OR lease_until < ?)
+            """,
+            (owner, now + lease, f"{provider}:{external_id}", owner, now),
+        )
+        return cur.rowcount == 1
+
+    def prune(self, kinds: Iterable[str] = None, max_age: float = RETENTION_SECONDS) -> int:
+        """Delete jobs not updated for max_age seconds, optionally only those of the given kinds."""
+        if kinds is None:
+            cur = self._conn().execute("DELETE FROM jobs WHERE updated_at < ?", (time.time() - max_age,))
+            return cur.rowcount
+        kinds = list(kinds)
+        cur = self._conn().execute(
+            f"DELETE FROM jobs WHERE updated_at < ? AND kind IN ({','.join('?' * len(kinds))})",
+            (time.time() - max_age, *kinds),
+        )
+        return cur.rowcount
+
+    def counts(self) -> dict:
+        rows = self._conn().execute("SELECT kind, status, COUNT(*) AS n FROM jobs GROUP BY kind, status").fetchall()
+        counts = {}
+        for r in rows:
+            counts.setdefault(r["kind"], {})[r["status"]] = r["n"]
+        return counts
+
+
+job_store = JobStore(DB_PATH)
+
+
+def input_hash(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def _kind(provider: str) -> str:
+    return "render" if provider in ("shotstack", "local") else "task"
+
+
+def record_submit(external_id: Optional[str], model: str, params: dict = None) -> None:
+    """Persist a freshly submitted provider task or render so it can be resumed after a restart."""
+    provider = PROVIDER_BY_MODEL.get(model)
+    if provider is None or not external_id:
+        return
+    trace_id = tracing.current_trace_id()
+    if trace_id:
+        params = {**(params or {}), "trace_id": trace_id}
+    job_store.upsert(_kind(provider), provider, external_id, "pending", params=params)
+
+
+def record_cards(cards: Iterable[dict], params: dict = None) -> None:
+    for card in cards:
+        record_submit(card.get("task_id") or card.get("render_id"), card.get("model", ""), params)
+
+
+def record_result(provider: str, external_id: str, result: dict) -> None:
+    """
+    Persist a poll/webhook result. Terminal results are upserted so every worker can serve them.
+    Anything else, e.g. a poll's "error" (the status call failed, not the job), leaves the job unfinished.
+    """
+    status = result.get("status")
+    if status in TERMINAL_STATUSES:
+        job_store.upsert(_kind(provider), provider, external_id, status, result=result)
+    elif status in UNFINISHED_STATUSES:
+        job_store.update(provider, external_id, "running" if result.get("running") else "pending")
@@ -1,5 +1,9 @@
 import os
-import fal_client
+from startup import sdk
+from webhooks import callback_url
+from rate_limit import limited_call
+
+fal_client = sdk("fal")
 
 # Kling 2.6 Pro via fal.ai
 # Supports 9:16, audio included, 5 or 10 seconds
@@ -13,6 +17,16 @@ PIKA_MODEL = "fal-ai/pika/v2.2/text-to-video"
 HAILUO_MODEL = "fal-ai/minimax/hailuo-02/pro/text-to-video"
 
 
+def extract_fal_video_url(result) -> str:
+    """fal returns {"video": {"url": "..."}} or {"videos": [...]}"""
+    if isinstance(result, dict):
+        if "video" in result and isinstance(result["video"], dict):
+            return result["video"].get("url")
+        elif "videos" in result and result["videos"]:
+            return result["videos"][0].get("url")
+    return None
+
+
 def submit_background_kling(
     fal_key: str,
     prompt_text: str,
@@ -40,7 +54,7 @@ def submit_background_kling(
         else:
             args["aspect_ratio"] = "9:16"
 
-        handler = fal_client.submit(model, arguments=args)
+        handler = limited_call("fal", fal_client.submit, model, arguments=args, webhook_url=callback_url("fal", "kling"))
         return {
             "task_id": handler.request_id,
             "video_url": None,
@@ -72,13 +86,16 @@ def submit_kling_task(fal_key: str, concept: dict, duration: str = "10") -> dict
     os.environ["FAL_KEY"] = fal_key
 
     try:
-        handler = fal_client.submit(
+        handler = limited_call(
+            "fal",
+            fal_client.submit,
             FAL_MODEL,
             arguments={
                 "prompt": concept["runway_prompt"],
                 "aspect_ratio": "9:16",
                 "duration": duration,
             },
+            webhook_url=callback_url("fal", "kling"),
         )
         return {
             **concept,
@@ -113,13 +130,7 @@ def poll_kling_task(fal_key: str, request_id: str) -> dict:
 
         if status_type == "Completed":
             result = fal_client.result(FAL_MODEL, request_id)
-            video_url = None
-            # fal returns {"video": {"url": "..."}} or {"videos": [...]}
-            if isinstance(result, dict):
-                if "video" in result and isinstance(result["video"], dict):
-                    video_url = result["video"].get("url")
-                elif "videos" in result and result["videos"]:
-                    video_url = result["videos"][0].get("url")
+            video_url = extract_fal_video_url(result)
             return {"task_id": request_id, "status": "succeeded", "video_url": video_url}
 
         elif status_type in ("Failed",):
@@ -127,7 +138,7 @@ def poll_kling_task(fal_key: str, request_id: str) -> dict:
 
         else:
             # Queued or InProgress
-            return {"task_id": request_id, "status": "pending", "video_url": None}
+            return {"task_id": request_id, "status": "pending", "video_url": None, "running": status_type == "InProgress"}
 
     except Exception as e:
         return {"task_id": request_id, "status": "error", "video_url": None, "error": str(e)}
@@ -141,12 +152,15 @@ def submit_pika_task(fal_key: str, concept: dict) -> dict:
     os.environ["FAL_KEY"] = fal_key
 
     try:
-        handler = fal_client.submit(
+        handler = limited_call(
+            "fal",
+            fal_client.submit,
             PIKA_MODEL,
             arguments={
                 "prompt": concept["runway_prompt"],
                 "aspect_ratio": "9:16",
             },
+            webhook_url=callback_url("fal", "pika"),
         )
         return {
             **concept,
@@ -181,19 +195,14 @@ def poll_pika_task(fal_key: str, request_id: str) -> dict:
 
         if status_type == "Completed":
             result = fal_client.result(PIKA_MODEL, request_id)
-            video_url = None
-            if isinstance(result, dict):
-                if "video" in result and isinstance(result["video"], dict):
-                    video_url = result["video"].get("url")
-                elif "videos" in result and result["videos"]:
-                    video_url = result["videos"][0].get("url")
+            video_url = extract_fal_video_url(result)
             return {"task_id": request_id, "status": "succeeded", "video_url": video_url}
 
         elif status_type == "Failed":
             return {"task_id": request_id, "status": "failed", "video_url": None, "error": str(status)}
 
         else:
-            return {"task_id": request_id, "status": "pending", "video_url": None}
+            return {"task_id": request_id, "status": "pending", "video_url": None, "running": status_type == "InProgress"}
 
     except Exception as e:
         return {"task_id": request_id, "status": "error", "video_url": None, "error": str(e)}
@@ -207,12 +216,15 @@ def submit_hailuo_task(fal_key: str, concept: dict) -> dict:
     os.environ["FAL_KEY"] = fal_key
 
     try:
-        handler = fal_client.submit(
+        handler = limited_call(
+            "fal",
+            fal_client.submit,
             HAILUO_MODEL,
             arguments={
                 "prompt": concept["runway_prompt"],
                 "prompt_optimizer": True,
             },
+            webhook_url=callback_url("fal", "hailuo"),
         )
         return {
             **concept,
@@ -247,19 +259,39 @@ def poll_hailuo_task(fal_key: str, request_id: str) -> dict:
 
         if status_type == "Completed":
             result = fal_client.result(HAILUO_MODEL, request_id)
-            video_url = None
-            if isinstance(result, dict):
-                if "video" in result and isinstance(result["video"], dict):
-                    video_url = result["video"].get("url")
-                elif "videos" in result and result["videos"]:
-                    video_url = result["videos"][0].get("url")
+            video_url = extract_fal_video_url(result)
             return {"task_id": request_id, "status": "succeeded", "video_url": video_url}
 
         elif status_type == "Failed":
             return {"task_id": request_id, "status": "failed", "video_url": None, "error": str(status)}
 
         else:
-            return {"task_id": request_id, "status": "pending", "video_url": None}
+            return {"task_id": request_id, "status": "pending", "video_url": None, "running": status_type == "InProgress"}
 
     except Exception as e:
         return {"task_id": request_id, "status": "error", "video_url": None, "error": str(e)}
+
+
+def cancel_fal_task(fal_key: str, model: str, request_id: str) -> bool:
+    """
+    Best-effort cancel of a queued fal.ai request. Returns True if the cancel was accepted.
+    Requests already running may still complete — their result is simply ignored.
+    """
+    os.environ["FAL_KEY"] = fal_key
+    try:
+        fal_client.cancel(model, request_id)
+        return True
+    except Exception:
+        return False
+
+
+def cancel_kling_task(fal_key: str, request_id: str) -> bool:
+    return cancel_fal_task(fal_key, FAL_MODEL, request_id)
+
+
+def cancel_pika_task(fal_key: str, request_id: str) -> bool:
+    return cancel_fal_task(fal_key, PIKA_MODEL, request_id)
+
+
+def cancel_hailuo_task(fal_key: str, request_id: str) -> bool:
+    return cancel_fal_task(fal_key, HAILUO_MODEL, request_id)
@@ -0,0 +1,338 @@
+"""
+Load test that replays how the frontend actually loads the API: sessions that analyze once,
+then keep polling status endpoints every few seconds while their clips and composites render.
+
+Each session follows PipelineView.jsx: /analyze, music tracks + HeyGen catalog + script preview
++ prompt proposals, HeyGen and background generation polled every 5s (backgrounds one after
+another, as the component does), then a composite polled every 5s. A share of sessions also
+uses VideoPanel.jsx: /generate-videos with every card polled every 6s.
+
+The API runs as one uvicorn worker in a subprocess against fake_upstreams.py. Sessions are
+added step by step (--sessions 10,20,40,...); for each step the status-poll latency is measured
+after a warm-up, and the run reports the most sessions the worker held within the SLO.
+
+    python loadtest.py --sessions 10,20,40,80 --slo-ms 300
+    python loadtest.py --speedup 10 --sessions 5,10,20   # 10x faster jobs and polls: 1 session ~ 10 real ones
+
+--speedup divides job latency, Claude latency and poll intervals alike, so each simulated
+session issues the requests of `speedup` real sessions in the same wall time.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import Namespace
+from collections import Counter
+from typing import Optional
+
+import httpx
+
+from benchmark import ANALYSIS, BACKEND_DIR, _free_port, _git_rev, _percentile, configure_api, patch_fal, start_fakes
+
+PIPELINE_POLL_SECONDS = 5  # PipelineView.jsx setInterval
+VIDEO_PANEL_POLL_SECONDS = 6  # VideoPanel.jsx POLL_INTERVAL_MS
+STATUS_ROUTES = ("/video-status/", "/pipeline/composite-status/")
+
+
+def _video_provider(card: dict) -> str:
+    """VideoPanel.jsx's platform -> /video-status provider mapping."""
+    platform = (card.get("platform") or "").lower()
+    if "luma" in platform:
+        return "luma"
+    if platform in ("pika", "hailuo", "heygen"):
+        return platform
+    if "fal" in platform or platform == "kling":
+        return "kling"
+    return "runway"
+
+
+class Session:
+    """One browser tab working through the pipeline."""
+
+    def __init__(self, client: httpx.AsyncClient, index: int, args, samples: list):
+        self.client = client
+        self.index = index
+        self.args = args
+        self.samples = samples
+        self.rng = random.Random(args.seed * 100003 + index)
+
+    async def call(self, method: str, url: str, **kwargs) -> Optional[dict]:
+        kind = "status" if url.startswith(STATUS_ROUTES) else "action"
+        started = time.perf_counter()
+        body, ok, code = None, False, "exception"
+        try:
+            resp = await self.client.request(method, url, **kwargs)
+            code = resp.status_code
+            ok = resp.status_code < 400
+            if ok:
+                body = resp.json()
+        except httpx.HTTPError as e:
+            code = type(e).__name__
+        self.samples.append((time.monotonic(), kind, time.perf_counter() - started, ok, code))
+        return body
+
+    async def poll(self, urls: list, interval: float, done) -> list:
+        """Like the components: check every pending item in turn, every interval, until each is done."""
+        results = [None] * len(urls)
+        pending = set(range(len(urls)))
+        deadline = time.monotonic() + self.args.session_timeout
+        while pending and time.monotonic() < deadline:
+            for i in sorted(pending):
+                body = await self.call("GET", urls[i])
+                if body is not None and done(body):
+                    results[i] = body
+                    pending.discard(i)
+            if pending:
+                await asyncio.sleep(interval)
+        return results
+
+    async def run(self) -> None:
+        args, tag = self.args, f"load{self.index}"
+        interval = PIPELINE_POLL_SECONDS / args.speedup
+        analyze = await self.call("POST", "/analyze", json={"hashtags": [tag]})
+        # Like analysisRequest.js: later steps send only the analysis_id
+        analysis = {"analysis_id": analyze["analysis_id"]} if analyze else {"analysis": ANALYSIS}
+
+        # Components mounting: music tracks, avatar catalog, auto script preview, prompt proposals
+        _, _, script, _ = await asyncio.gather(
+            self.call("GET", "/pipeline/music-tracks"),
+            self.call("GET", "/heygen/config"),
+            self.call("POST", "/heygen/preview-script", json={**analysis, "hashtags": [tag]}),
+            self.call("POST", "/propose-prompts", json={**analysis, "hashtags": [tag]}),
+        )
+        flows = [self.pipeline(analysis, tag, (script or {}).get("spoken_script"), interval)]
+        if self.rng.random() < args.video_panel_share:
+            flows.append(self.video_panel(analysis, tag))
+        await asyncio.gather(*flows)
+
+    async def pipeline(self, analysis: dict, tag: str, spoken_script: Optional[str], interval: float) -> None:
+        avatar, backgrounds = await asyncio.gather(
+            self.call("POST", "/heygen/generate", json={
+                **analysis, "hashtags": [tag], "avatar_id": "fake-avatar-1",
+                "voice_id": "fake-voice-1", "spoken_script": spoken_script,
+            }),
+            self.call("POST", "/pipeline/generate-backgrounds", json={
+                "prompt_a": f"{tag} slow aerial drift", "prompt_b": f"{tag} macro texture", "model": "kling",
+            }),
+        )
+        avatar_ids = [c["task_id"] for c in (avatar or {}).get("videos", []) if c.get("task_id")]
+        background_ids = [c["task_id"] for c in (backgrounds or {}).get("backgrounds", []) if c.get("task_id")]
+        finished = lambda body: body.get("status") != "pending"  # noqa: E731
+        avatar_done, background_done = await asyncio.gather(
+            self.poll([f"/video-status/heygen/{i}" for i in avatar_ids], interval, finished),
+            self.poll([f"/video-status/kling/{i}" for i in background_ids], interval, finished),
+        )
+        avatar_url = next((r["video_url"] for r in avatar_done if r and r.get("video_url")), None)
+        background_url = next((r["video_url"] for r in background_done if r and r.get("video_url")), None)
+        if not avatar_url or not background_url:
+            return
+        composite = await self.call("POST", "/pipeline/composite", json={
+            "heygen_video_url": avatar_url, "background_video_url": background_url,
+            "hook_text": f"{tag} hook", "engine": "shotstack",
+        })
+        if composite and composite.get("render_id"):
+            await self.poll([f"/pipeline/composite-status/{composite['render_id']}"], interval, finished)
+
+    async def video_panel(self, analysis: dict, tag: str) -> None:
+        generated = await self.call("POST", "/generate-videos", json={**analysis, "hashtags": [tag]})
+        cards = [c for c in (generated or {}).get("videos", []) if c.get("task_id")]
+        interval = VIDEO_PANEL_POLL_SECONDS / self.args.speedup
+        # Every card polls on its own timer
+        await asyncio.gather(*(
+            self.poll([f"/video-status/{_video_provider(c)}/{c['task_id']}"], interval, lambda b: b.get("status") != "pending")
+            for c in cards
+        ))
+
+
+def _rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2, 1)
+    except (OSError, ValueError):
+        return None
+
+
+def summarize(samples: list, completed: list, since: float, until: float, sessions: int, args, pid: int) -> dict:
+    window = [s for s in samples if since <= s[0] < until]
+    status = [s for s in window if s[1] == "status"]
+    actions = [s for s in window if s[1] == "action"]
+    latencies = [s[2] for s in status if s[3]]
+    failures = Counter(str(s[4]) for s in window if not s[3])
+    errors = sum(failures.values())
+    seconds = until - since
+    p_slo = _percentile(latencies, args.slo_percentile)
+    within_slo = None  # no polls yet: sessions still in /analyze or their first Claude calls
+    if latencies:
+        within_slo = p_slo <= args.slo_ms and errors / len(window) <= args.max_error_rate
+    return {
+        "sessions": sessions,
+        "equivalent_sessions": sessions * args.speedup,
+        "sessions_completed": sum(1 for t in completed if since <= t < until),
+        "status_rps": round(len(status) / seconds, 1),
+        "action_rps": round(len(actions) / seconds, 2),
+        "status_p50_ms": _percentile(latencies, 50),
+        "status_p95_ms": _percentile(latencies, 95),
+        "status_p99_ms": _percentile(latencies, 99),
+        "action_p95_ms": _percentile([s[2] for s in actions if s[3]], 95),
+        "error_rate": round(errors / len(window), 4) if window else 0.0,
+        "errors": dict(failures),
+        "worker_rss_mb": _rss_mb(pid),
+        "within_slo": within_slo,
+    }
+
+
+async def ramp(args, api_url: str, pid: int) -> list:
+    samples: list = []
+    completed: list = []
+    tasks: list = []
+    results = []
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+    async with httpx.AsyncClient(base_url=api_url, timeout=args.request_timeout, limits=limits) as client:
+
+        async def session_loop(index: int):
+            # A closed loop: when a session finishes, a new user starts in the same slot
+            n = 0
+            while True:
+                await Session(client, index * 100000 + n, args, samples).run()
+                completed.append(time.monotonic())
+                n += 1
+
+        try:
+            for sessions in args.sessions:
+                while len(tasks) < sessions:
+                    tasks.append(asyncio.create_task(session_loop(len(tasks))))
+                    await asyncio.sleep(args.stagger / args.speedup)  # users don't all arrive in the same instant
+                started = time.monotonic()
+                await asyncio.sleep(args.step_duration)
+                result = summarize(samples, completed, started + args.warmup, time.monotonic(), sessions, args, pid)
+                results.append(result)
+                print(_format_step(result, args), flush=True)
+                if result["within_slo"] is False and not args.keep_going:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    return results
+
+
+def _format_step(r: dict, args) -> str:
+    verdict = {True: "ok", False: "OVER SLO", None: "no polls yet, lengthen --step-duration"}[r["within_slo"]]
+    return (
+        f"sessions {r['sessions']:>4} (~{r['equivalent_sessions']:g} real)  status {r['status_rps']:>6} req/s  "
+        f"p50 {r['status_p50_ms']} ms  p{args.slo_percentile:g} {_percentile_value(r, args)} ms  "
+        f"errors {r['error_rate']:.1%}  done {r['sessions_completed']}  rss {r['worker_rss_mb']} MB  {verdict}"
+    )
+
+
+def _percentile_value(r: dict, args):
+    return r.get(f"status_p{args.slo_percentile:g}_ms")
+
+
+def serve_api(port: int, fake_url: str) -> None:
+    """Entry point of the API subprocess: one uvicorn worker, fal pointed at the fakes."""
+    import uvicorn
+
+    patch_fal(fake_url)
+    import main
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def start_api(port: int, fake_url: str) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, __file__, "--serve-api", str(port), "--fake-url", fake_url], cwd=BACKEND_DIR,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/health", timeout=1)
+            return proc
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("API worker did not start")
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", default="10,20,40,80,160", help="concurrent sessions per step")
+    parser.add_argument("--step-duration", type=float, default=60.0, help="seconds per step")
+    parser.add_argument("--warmup", type=float, default=15.0, help="seconds at the start of a step left out of its stats")
+    parser.add_argument("--stagger", type=float, default=0.5, help="seconds between session arrivals (before speedup)")
+    parser.add_argument("--slo-ms", type=float, default=500.0, help="status poll latency objective")
+    parser.add_argument("--slo-percentile", type=float, default=95, choices=[50, 95, 99])
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--speedup", type=float, default=1.0)
+    parser.add_argument("--video-panel-share", type=float, default=0.25, help="share of sessions that also use /generate-videos")
+    parser.add_argument("--job-latency", type=float, default=90.0, help="seconds a fake video/render job takes")
+    parser.add_argument("--anthropic-delay", type=float, default=8.0, help="seconds per fake Claude call")
+    parser.add_argument("--response-delay", type=float, default=0.15, help="seconds per fake upstream API response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream submits answered with a 503")
+    parser.add_argument("--request-timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--posts", type=int, default=30, help="posts per fake Apify dataset")
+    parser.add_argument("--keep-going", action="store_true", help="run every step even after the SLO is missed")
+    parser.add_argument("--out", help="append step results as JSON lines to this file")
+    parser.add_argument("--serve-api", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--fake-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_api:
+        serve_api(args.serve_api, args.fake_url)
+        return 0
+
+    args.sessions = [int(n) for n in args.sessions.split(",")]
+    args.session_timeout = 4 * args.job_latency / args.speedup + 60
+    # Fake job and Claude latency shrink with the poll intervals, keeping the frontend's timing ratios
+    fake_args = Namespace(
+        latency=args.job_latency / args.speedup,
+        response_delay=args.response_delay,
+        anthropic_delay=args.anthropic_delay / args.speedup,
+        error_rate=args.error_rate,
+        fail_rate=0.0,
+        seed=args.seed,
+        posts=args.posts,
+    )
+    fake_port, api_port = _free_port(), _free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    fakes = start_fakes(fake_port, fake_args)
+    api = None
+    try:
+        with tempfile.TemporaryDirectory(prefix="loadtest-") as state_dir:
+            configure_api(fake_url, state_dir, Namespace(trace=False, poll_interval=PIPELINE_POLL_SECONDS / args.speedup))
+            api = start_api(api_port, fake_url)
+            results = asyncio.run(ramp(args, f"http://127.0.0.1:{api_port}", api.pid))
+    finally:
+        for proc in (api, fakes):
+            if proc is not None:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:  # background pollers can hold up a graceful shutdown
+                    proc.kill()
+
+    passing = [r for r in results if r["within_slo"] is True]
+    best = max(passing, key=lambda r: r["sessions"]) if passing else None
+    print(
+        f"max sessions per worker within p{args.slo_percentile:g} <= {args.slo_ms:g} ms: "
+        + (f"{best['sessions']} (~{best['equivalent_sessions']:g} real sessions)" if best else "none of the steps")
+    )
+    if args.out:
+        meta = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_rev": _git_rev(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("out", "serve_api", "fake_url")},
+        }
+        with open(args.out, "a") as f:
+            for r in results:
+                f.write(json.dumps({**meta, **r}) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
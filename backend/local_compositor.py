@@ -0,0 +1,271 @@
+import os
+import shutil
+import subprocess
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import asset_cache
+from job_store import job_store, record_submit, record_result, UNFINISHED_STATUSES
+from metrics import UPSTREAM_LATENCY
+from shotstack_client import MUSIC_TRACKS, caption_chunks
+from tracing import traced
+
+# Local ffmpeg alternative to Shotstack: same inputs, same render_id poll contract.
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+RENDER_DIR = Path(os.getenv("LOCAL_RENDER_DIR", Path(__file__).parent / ".cache" / "renders"))
+RENDER_WORKERS = int(os.getenv("LOCAL_RENDER_WORKERS", "2"))
+RENDER_TIMEOUT = int(os.getenv("LOCAL_RENDER_TIMEOUT", "300"))  # seconds per ffmpeg run
+FONT_DIR = os.getenv("LOCAL_RENDER_FONT_DIR", "")  # optional dir with Open Sans; fontconfig fallback otherwise
+
+RENDER_PREFIX = "local-"
+
+OUTPUT_WIDTH = 720
+OUTPUT_HEIGHT = 1280
+OUTPUT_FPS = 25
+
+# Preview proxy: quarter the pixels, half the frames, fastest x264 preset
+PREVIEW_WIDTH = 360
+PREVIEW_HEIGHT = 640
+PREVIEW_FPS = 12
+
+_pool: Optional[ProcessPoolExecutor] = None
+_jobs = {}  # render_id -> Future
+
+
+def is_local_render(render_id: str) -> bool:
+    return render_id.startswith(RENDER_PREFIX)
+
+
+def render_path(render_id: str) -> Path:
+    return RENDER_DIR / f"{render_id}.mp4"
+
+
+ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+PlayResX: {width}
+PlayResY: {height}
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Caption,Open Sans,40,&H00FFFFFF,&H00FFFFFF,&H00000000,&H00000000,-1,0,0,0,100,100,0,0,1,2,3,2,40,40,102,1
+Style: Hook,Open Sans,38,&H00FFFFFF,&H00FFFFFF,&H00000000,&H00000000,-1,0,0,0,100,100,0,0,1,1,3,2,40,40,128,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+
+def _ass_time(seconds: float) -> str:
+    cs = int(round(seconds * 100))
+    return f"{cs // 360000}:{cs // 6000 % 60:02d}:{cs // 100 % 60:02d}.{cs % 100:02d}"
+
+
+def _ass_text(text: str) -> str:
+    # Braces start override blocks and backslashes start escapes in ASS
+    return text.replace("\\", "/").replace("{", "(").replace("}", ")").replace("\n", " ")
+
+
+def build_subtitles(hook_text: str, duration: float, spoken_script: str = None) -> str:
+    """
+    ASS subtitle track mirroring the Shotstack caption track:
+    timed script chunks with fade in/out, or the hook text for the first 3.5s.
+    Authored at 720x1280; libass scales it to the output size.
+    """
+    if spoken_script and spoken_script.strip():
+        events = [
+            (start, start + length, "Caption", "{\\fad(250,250)}" + _ass_text(text))
+            for text, start, length in caption_chunks(spoken_script, duration)
+        ]
+    else:
+        events = [(0, min(3.5, duration), "Hook", "{\\fad(0,400)}" + _ass_text(hook_text))]
+    lines = [
+        f"Dialogue: 0,{_ass_time(start)},{_ass_time(end)},{style},,0,0,0,,{text}"
+        for start, end, style, text in events
+    ]
+    return ASS_HEADER.format(width=OUTPUT_WIDTH, height=OUTPUT_HEIGHT) + "\n".join(lines) + "\n"
+
+
+def build_ffmpeg_command(
+    output_path: str,
+    subtitles_path: str,
+    heygen_video_url: str,
+    background_video_url: str,
+    music_url: str,
+    duration: float,
+    width: int = OUTPUT_WIDTH,
+    height: int = OUTPUT_HEIGHT,
+    fps: int = OUTPUT_FPS,
+    preset: str = "veryfast",
+    crf: int = 23,
+) -> list:
+    """
+    Build the ffmpeg invocation mirroring the Shotstack timeline:
+      - background looped and cover-fit, muted
+      - HeyGen avatar chroma-keyed from #00FF00, contain-fit, full audio
+      - captions burned in from the ASS file at subtitles_path
+      - music bed at 12% volume
+    """
+    fonts = f":fontsdir={FONT_DIR}" if FONT_DIR else ""
+    filter_graph = ";".join([
+        f"[0:v]scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},setsar=1,fps={fps}[bg]",
+        f"[1:v]scale={width}:{height}:force_original_aspect_ratio=decrease,chromakey=0x00FF00:0.3:0.08[fg]",
+        "[bg][fg]overlay=(W-w)/2:(H-h)/2:eof_action=pass[v0]",
+        f"[v0]ass=filename={subtitles_path}{fonts}[vout]",
+        "[1:a]volume=1.0[voice]",
+        "[2:a]volume=0.12[music]",
+        "[voice][music]amix=inputs=2:duration=longest:normalize=0[aout]",
+    ])
+
+    # Inputs are local cache files: don't let a crafted file point ffmpeg at any other protocol
+    local_only = ["-protocol_whitelist", "file"]
+    return [
+        FFMPEG_BIN, "-y", "-loglevel", "error",
+        *local_only, "-stream_loop", "-1", "-i", background_video_url,
+        *local_only, "-i", heygen_video_url,
+        *local_only, "-stream_loop", "-1", "-i", music_url,
+        "-filter_complex", filter_graph,
+        "-map", "[vout]", "-map", "[aout]",
+        "-t", str(duration),
+        "-r", str(fps),
+        "-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", "128k",
+        "-movflags", "+faststart",
+        output_path,
+    ]
+
+
+def _render(output_path: str, work_dir: str, subtitles_path: str, inputs: tuple, duration: float, quality: dict) -> str:
+    """
+    Worker-process entry point: resolve each input URL to its copy in the local asset cache
+    (downloading it once if needed), then run ffmpeg against local files. An input that
+    can't be fetched fails the render.
+    """
+    heygen_video, background_video, music = (asset_cache.local_path(url) for url in inputs)
+    command = build_ffmpeg_command(
+        output_path, subtitles_path, heygen_video, background_video, music, duration, **quality,
+    )
+    return _run_ffmpeg(command, output_path, work_dir)
+
+
+def _run_ffmpeg(command: list, output_path: str, work_dir: str) -> str:
+    """Render to a temp file, then atomically move into place."""
+    tmp_path = output_path + ".part.mp4"
+    command = command[:-1] + [tmp_path]
+    try:
+        proc = subprocess.run(command, capture_output=True, text=True, timeout=RENDER_TIMEOUT)
+        if proc.returncode != 0:
+            raise RuntimeError(f"ffmpeg exited {proc.returncode}: {proc.stderr.strip()[-500:]}")
+        os.replace(tmp_path, output_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return output_path
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+    return _pool
+
+
+def active_renders() -> list:
+    """IDs of renders still queued or running in this worker's pool."""
+    return [render_id for render_id, future in _jobs.items() if not future.done()]
+
+
+def _record_done(render_id: str, future, submitted: float) -> None:
+    # Runs when the ffmpeg job settles, so other workers see the outcome without polling this one
+    outcome = "ok" if not future.cancelled() and future.exception() is None else "error"
+    UPSTREAM_LATENCY.labels("ffmpeg", "render", outcome).observe(time.monotonic() - submitted)
+    if future.cancelled():
+        record_result("local", render_id, {"render_id": render_id, "status": "cancelled"})
+    elif future.exception() is not None:
+        record_result("local", render_id, {"render_id": render_id, "status": "failed", "error": str(future.exception())})
+    else:
+        record_result("local", render_id, {"render_id": render_id, "status": "succeeded"})
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+@traced()
+def submit_local_composite(
+    heygen_video_url: str,
+    background_video_url: str,
+    hook_text: str,
+    music_track_id: str = "hype",
+    duration: float = 10.0,
+    spoken_script: str = None,
+    preview: bool = False,
+) -> dict:
+    """
+    Queue a local ffmpeg render in the process pool.
+    preview=True renders a 360x640 12fps proxy with the fastest encoder settings.
+    Returns the same shape as submit_composite — poll with poll_local_composite(render_id).
+    """
+    if shutil.which(FFMPEG_BIN) is None:
+        return {"render_id": None, "status": "error", "video_url": None, "error": f"{FFMPEG_BIN} not found on PATH"}
+    for url in (heygen_video_url, background_video_url):
+        if not asset_cache.is_remote_url(url):
+            return {"render_id": None, "status": "error", "video_url": None, "error": f"Input must be an http(s) URL: {url}"}
+
+    music_url = MUSIC_TRACKS.get(music_track_id, MUSIC_TRACKS["hype"])["url"]
+    render_id = f"{RENDER_PREFIX}{uuid.uuid4().hex}"
+    output_path = str(render_path(render_id))
+    work_dir = RENDER_DIR / f"{render_id}.work"
+    try:
+        work_dir.mkdir(parents=True, exist_ok=True)
+        subtitles_path = work_dir / "captions.ass"
+        subtitles_path.write_text(build_subtitles(hook_text, duration, spoken_script), encoding="utf-8")
+        quality = (
+            {"width": PREVIEW_WIDTH, "height": PREVIEW_HEIGHT, "fps": PREVIEW_FPS, "preset": "ultrafast", "crf": 32}
+            if preview else {}
+        )
+        inputs = (heygen_video_url, background_video_url, music_url)
+        record_submit(render_id, "local-ffmpeg")
+        job_store.claim("local", render_id)
+        future = _get_pool().submit(
+            _render, output_path, str(work_dir), str(subtitles_path), inputs, duration, quality,
+        )
+        _jobs[render_id] = future
+        submitted = time.monotonic()
+        future.add_done_callback(lambda f: _record_done(render_id, f, submitted))
+    except Exception as e:
+        return {"render_id": None, "status": "error", "video_url": None, "error": str(e)}
+    return {"render_id": render_id, "status": "pending", "video_url": None, "engine": "local"}
+
+
+def poll_local_composite(render_id: str, base_url: str) -> dict:
+    """
+    Poll a local render. base_url is the public URL of this API, used to build the video_url.
+    Finished renders are found on disk, so they stay pollable across restarts. Renders owned
+    by another worker are reported from the job store while that worker holds their lease.
+    """
+    video_url = f"{base_url.rstrip('/')}/pipeline/renders/{render_id}.mp4"
+    future = _jobs.get(render_id)
+
+    if future is not None and not future.done():
+        return {"render_id": render_id, "status": "pending", "video_url": None, "running": future.running()}
+    if future is not None and future.cancelled():
+        # Dropped from the pool queue at shutdown before it started
+        return {"render_id": render_id, "status": "cancelled", "video_url": None}
+    if future is not None and future.exception() is not None:
+        return {"render_id": render_id, "status": "failed", "video_url": None, "error": str(future.exception())}
+    if render_path(render_id).exists():
+        return {"render_id": render_id, "status": "succeeded", "video_url": video_url}
+
+    job = job_store.get("local", render_id)
+    if job is not None and job["status"] in UNFINISHED_STATUSES and (job["lease_until"] or 0) > time.time():
+        return {"render_id": render_id, "status": "pending", "video_url": None, "running": job["status"] == "running"}
+    if job is not None and job["status"] == "failed" and job["result"]:
+        return {"render_id": render_id, "status": "failed", "video_url": None, "error": job["result"].get("error")}
+    return {"render_id": render_id, "status": "failed", "video_url": None, "error": "Unknown render"}
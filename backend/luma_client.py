@@ -1,4 +1,7 @@
-import lumaai
+from startup import sdk
+from rate_limit import limited_call
+
+lumaai = sdk("luma")
 
 
 def submit_luma_task(luma_key: str, concept: dict) -> dict:
@@ -8,7 +11,9 @@ def submit_luma_task(luma_key: str, concept: dict) -> dict:
     """
     client = lumaai.LumaAI(auth_token=luma_key)
     try:
-        generation = client.generations.video.create(
+        generation = limited_call(
+            "luma",
+            client.generations.video.create,
             prompt=concept["runway_prompt"],
             aspect_ratio="9:16",
             duration="5s",
@@ -55,7 +60,17 @@ def poll_luma_task(luma_key: str, generation_id: str) -> dict:
             return {"task_id": generation_id, "status": "failed", "video_url": None, "error": reason}
 
         else:
-            return {"task_id": generation_id, "status": "pending", "video_url": None}
+            return {"task_id": generation_id, "status": "pending", "video_url": None, "running": state == "dreaming"}
 
     except Exception as e:
         return {"task_id": generation_id, "status": "error", "video_url": None, "error": str(e)}
+
+
+def cancel_luma_task(luma_key: str, generation_id: str) -> bool:
+    """Best-effort delete of a Luma generation. Returns True if the delete was accepted."""
+    client = lumaai.LumaAI(auth_token=luma_key)
+    try:
+        client.generations.delete(generation_id)
+        return True
+    except Exception:
+        return False
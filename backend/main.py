@@ -1,36 +1,158 @@
+import startup
+startup.profile_imports()  # first: with PROFILE_IMPORTS=1, times every import below for GET /diagnostics/startup
+
 import os
 import asyncio
+import hashlib
+import json
+import re
+import time
+import uuid
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional, List
-import tempfile
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from typing import Dict, Optional, List
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
+# Load .env before importing local modules — several read their config at import time
+load_dotenv(dotenv_path=Path(__file__).parent / ".env", override=True)
+
+import cassettes
+cassettes.install()  # UPSTREAM_CASSETTE_MODE=record|replay; before any upstream client is created
+
 from apify_client import run_instagram_scraper
 from tiktok_client import run_tiktok_scraper
 from analyzer import analyze_posts
-from video_generator import generate_videos, poll_runway_task, generate_prompt_proposals, generate_concept, submit_background_runway
-import fal_client
+from video_generator import (
+    generate_videos, get_hedge, poll_runway_task, generate_prompt_proposals, generate_concept, submit_background_runway,
+    background_runway_breaker,
+)
 from kling_client import poll_kling_task, poll_pika_task, poll_hailuo_task, submit_background_kling
 from luma_client import poll_luma_task
-from heygen_client import fetch_heygen_config, submit_heygen_task, poll_heygen_task, build_spoken_script
+from heygen_client import catalog_cache, submit_heygen_task, poll_heygen_task, build_spoken_script
 from shotstack_client import submit_composite, poll_composite, get_music_tracks
+from job_store import TERMINAL_STATUSES
+from rate_limit import queue_stats
+import executors
+from executors import Saturated, executor_stats
+import telemetry
+import metrics
+from prometheus_client import CONTENT_TYPE_LATEST
+import tracing
+import job_store as jobs
+import asset_cache
+import http_clients
+import circuit_breaker
+from analysis_store import analysis_store
+from compression import CompressionMiddleware
+import idempotency
+from idempotency import IdempotencyMiddleware
+from image_upload import upload_image
+import local_compositor
+from local_compositor import submit_local_composite, poll_local_composite, is_local_render, render_path
+import pipeline_runner
+from pipeline_runner import cached_poll
+from webhooks import verify_token, record_result, parse_fal_webhook, parse_heygen_webhook, parse_shotstack_webhook
+
+
+
+def _provider_keys() -> dict:
+    return {
+        "anthropic": os.getenv("ANTHROPIC_API_KEY", ""),
+        "apify": os.getenv("APIFY_TOKEN", ""),
+        "heygen": os.getenv("HEYGEN_API_KEY", ""),
+        "runway": os.getenv("RUNWAYML_API_KEY", ""),
+        "fal": os.getenv("FAL_KEY", ""),
+        "luma": os.getenv("LUMAAI_API_KEY", ""),
+        "shotstack": os.getenv("SHOTSTACK_API_KEY", ""),
+    }
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup.mark_ready()
+    http_clients.start()
+    if startup.PRELOAD:
+        asyncio.get_running_loop().run_in_executor(None, startup.preload)
+    # Resume work orphaned by a restart (or another worker dying), then keep leases fresh
+    maintenance = asyncio.create_task(
+        pipeline_runner.maintenance_loop(_provider_keys, os.getenv("PUBLIC_BASE_URL", ""))
+    )
+    yield
+    maintenance.cancel()
+    local_compositor.shutdown()
+    executors.shutdown()
+    await http_clients.aclose()
+
+
+app = FastAPI(title="Instagram Trend Analyzer API", lifespan=lifespan, default_response_class=ORJSONResponse)
 
-load_dotenv(dotenv_path=Path(__file__).parent / ".env", override=True)
 
-app = FastAPI(title="Instagram Trend Analyzer API")
+@app.exception_handler(Saturated)
+async def saturated_handler(request: Request, exc: Saturated):
+    """
+    An upstream's pool is full, or its circuit is open (CircuitOpen). Submits get 429 (the caller
+    should send less work); status polls get 503 (the same request will succeed later).
+    """
+    status_code = 429 if request.method == "POST" else 503
+    return JSONResponse(
+        status_code=status_code,
+        content={"detail": str(exc), "pool": exc.pool},
+        headers={"Retry-After": str(int(exc.retry_after))},
+    )
+
+# Endpoints that submit paid provider work; a repeated Idempotency-Key gets the first response back
+IDEMPOTENT_PATHS = (
+    "/generate-videos",
+    "/tiktok/generate-videos",
+    "/heygen/generate",
+    "/pipeline/generate-backgrounds",
+    "/pipeline/generate-background",
+    "/pipeline/composite",
+    "/pipeline/composite-batch",
+    "/pipeline/composite/{render_id}/approve",
+    "/pipeline/run",
+)
 
+app.add_middleware(IdempotencyMiddleware, paths=IDEMPOTENT_PATHS)
+app.add_middleware(CompressionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[tracing.TRACE_HEADER, idempotency.REPLAYED_HEADER],
 )
 
 
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    """
+    Per-route latency histogram, labelled by route template so IDs don't explode cardinality.
+    Each request is also the root span of a trace: the caller's (traceparent / X-Trace-Id) or a new one,
+    returned in X-Trace-Id.
+    """
+    trace_id, parent_id = tracing.parse_headers(request.headers)
+    started = time.perf_counter()
+    status = 500
+    async with tracing.Span(request.method, trace_id=trace_id, parent_id=parent_id) as span:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            response.headers[tracing.TRACE_HEADER] = span.trace_id
+            return response
+        finally:
+            route = request.scope.get("route")
+            route_path = route.path if route is not None else "unmatched"
+            span.name = f"{request.method} {route_path}"
+            span.set(route=route_path, status_code=status)
+            metrics.REQUEST_LATENCY.labels(request.method, route_path, str(status)).observe(time.perf_counter() - started)
+
+
 class ScrapeRequest(BaseModel):
     hashtags: List[str] = Field(..., min_length=1, description="List of hashtags (without #)")
     min_likes: int = Field(0, ge=0, description="Minimum likes threshold")
@@ -44,14 +166,25 @@ class TikTokScrapeRequest(BaseModel):
 
 
 class ProposePromptsRequest(BaseModel):
-    analysis: dict = Field(..., description="The analysis object from /analyze")
+    analysis: Optional[dict] = Field(None, description="The analysis object from /analyze (or send analysis_id)")
+    analysis_id: Optional[str] = Field(None, description="The analysis_id from /analyze, instead of the whole analysis")
     hashtags: List[str] = Field(..., description="The hashtags used in the analysis")
+    refresh: bool = Field(False, description="Ask Claude again instead of returning this analysis's cached proposals")
+
+
+class HedgePolicy(BaseModel):
+    fanout: Optional[int] = Field(None, ge=1, le=6, description="Max providers to submit to (default HEDGE_FANOUT)")
+    delay: Optional[float] = Field(None, ge=0, description="Seconds to wait before launching the next provider (default HEDGE_DELAY)")
+    timeout: Optional[float] = Field(None, gt=0, description="Seconds the background hedge waits for a finished clip (default HEDGE_TIMEOUT)")
+    order: Optional[List[str]] = Field(None, description="Provider ranking, e.g. ['kling', 'gen4.5', 'veo3.1', 'hailuo', 'luma', 'pika']")
 
 
 class VideoRequest(BaseModel):
-    analysis: dict = Field(..., description="The analysis object from /analyze")
+    analysis: Optional[dict] = Field(None, description="The analysis object from /analyze (or send analysis_id)")
+    analysis_id: Optional[str] = Field(None, description="The analysis_id from /analyze, instead of the whole analysis")
     hashtags: List[str] = Field(..., description="The hashtags used in the analysis")
     selected_prompt: Optional[str] = Field(None, description="The user-selected runway prompt from propose-prompts")
+    hedge: Optional[HedgePolicy] = Field(None, description="If set, submit the top-ranked provider now and hedge with the rest in the background")
 
 
 class PostSummary(BaseModel):
@@ -71,6 +204,30 @@ class AnalyzeResponse(BaseModel):
     posts: List[PostSummary]
     total_scraped: int
     analysis: dict
+    analysis_id: Optional[str] = None
+
+
+def _model_response(model: BaseModel) -> Response:
+    """
+    Serialize a response model in one pydantic-core pass. Returned from a route with the same
+    response_model, this skips FastAPI's re-validation and dict round trip (about 3x faster for 200 posts).
+    """
+    return Response(model.model_dump_json(), media_type="application/json")
+
+
+def _analysis(req) -> dict:
+    """
+    The analysis a request refers to (by analysis_id, or inline), after joining the trace that produced it.
+    410 tells the client the id has expired and the full analysis must be sent again.
+    """
+    if req.analysis_id is None and req.analysis is None:
+        raise HTTPException(status_code=422, detail="Send analysis_id or analysis")
+    try:
+        analysis = analysis_store.resolve(req.analysis_id, req.analysis)
+    except KeyError:
+        raise HTTPException(status_code=410, detail="Unknown or expired analysis_id; send the analysis object instead")
+    tracing.join(analysis.get("trace_id"))
+    return analysis
 
 
 class VideoResponse(BaseModel):
@@ -80,14 +237,14 @@ class VideoResponse(BaseModel):
 class BackgroundRequest(BaseModel):
     prompt_a: str = Field(..., description="Visual prompt for background slot A")
     prompt_b: str = Field(..., description="Visual prompt for background slot B")
-    model: str = Field("kling", description="Video model: 'kling' or 'runway'")
+    model: str = Field("kling", description="Video model: 'kling', 'runway', or 'auto' (currently fastest healthy model)")
     image_url_a: Optional[str] = Field(None, description="Optional CDN image URL to use for slot A (image-to-video)")
     image_url_b: Optional[str] = Field(None, description="Optional CDN image URL to use for slot B (image-to-video)")
 
 
 class SingleBackgroundRequest(BaseModel):
     prompt: str = Field(..., description="Visual prompt for the background clip")
-    model: str = Field("kling", description="Video model: 'kling' or 'runway'")
+    model: str = Field("kling", description="Video model: 'kling', 'runway', or 'auto' (currently fastest healthy model)")
     slot: str = Field("A", description="Which slot this is for: 'A' or 'B'")
     image_url: Optional[str] = Field(None, description="Optional CDN image URL for image-to-video")
 
@@ -99,16 +256,58 @@ class CompositeRequest(BaseModel):
     music_track_id: str = Field("hype", description="Music track ID from /pipeline/music-tracks")
     duration: float = Field(10.0, description="Total video duration in seconds")
     spoken_script: Optional[str] = Field(None, description="Full spoken script for timed subtitle captions; replaces hook-text overlay when provided")
+    engine: str = Field(os.getenv("COMPOSITE_ENGINE", "shotstack"), description="Render engine: 'shotstack' or 'local' (ffmpeg on this server)")
+    preview: bool = Field(False, description="Render a fast low-res proxy; commit the full render via /pipeline/composite/{render_id}/approve")
+
+
+class PipelineRunRequest(BaseModel):
+    # Avatar branch (same inputs as /heygen/generate)
+    analysis: Optional[dict] = Field(None, description="The analysis object from /analyze (or send analysis_id)")
+    analysis_id: Optional[str] = Field(None, description="The analysis_id from /analyze, instead of the whole analysis")
+    hashtags: List[str] = Field(..., description="The hashtags used in the analysis")
+    selected_prompt: Optional[str] = Field(None, description="Selected runway prompt for concept direction")
+    avatar_id: str = Field(..., description="HeyGen Avatar IV avatar ID")
+    voice_id: str = Field(..., description="HeyGen voice ID")
+    platform: str = Field("instagram", description="Source platform: instagram or tiktok")
+    spoken_script: Optional[str] = Field(None, description="User-edited spoken script — if provided skips Claude generation")
+    # Background branch
+    background_prompt: str = Field(..., description="Visual prompt for the background clip")
+    background_model: str = Field("kling", description="Video model: 'kling', 'runway', or 'auto'")
+    background_image_url: Optional[str] = Field(None, description="Optional CDN image URL for image-to-video")
+    # Composite
+    hook_text: Optional[str] = Field(None, description="Hook caption; defaults to the generated concept's hook")
+    music_track_id: str = Field("hype", description="Music track ID from /pipeline/music-tracks")
+    duration: float = Field(10.0, description="Total video duration in seconds")
+    engine: str = Field(os.getenv("COMPOSITE_ENGINE", "shotstack"), description="Render engine: 'shotstack' or 'local'")
+    preview: bool = Field(False, description="Render a low-res proxy instead of the full composite")
+
+
+class ApproveCompositeRequest(BaseModel):
+    engine: Optional[str] = Field(None, description="Engine for the full render; defaults to the preview's engine")
+
+
+class BatchCompositeRequest(BaseModel):
+    heygen_video_url: str = Field(..., description="HeyGen avatar video URL (green screen), shared by every variant")
+    backgrounds: Dict[str, str] = Field(..., description="Background slot → video URL, e.g. {'A': url, 'B': url}")
+    music_track_ids: List[str] = Field(["hype"], description="Music tracks to try; one variant per background × track")
+    hook_text: str = Field(..., description="Hook text displayed as caption overlay")
+    duration: float = Field(10.0, description="Total video duration in seconds")
+    spoken_script: Optional[str] = Field(None, description="Full spoken script for timed subtitle captions")
+    engine: str = Field(os.getenv("COMPOSITE_ENGINE", "shotstack"), description="Render engine: 'shotstack' or 'local'")
+    preview: bool = Field(False, description="Render low-res proxies; approve the chosen variant's render_id")
 
 
 class HeyGenScriptRequest(BaseModel):
-    analysis: dict = Field(..., description="The analysis object from /analyze")
+    analysis: Optional[dict] = Field(None, description="The analysis object from /analyze (or send analysis_id)")
+    analysis_id: Optional[str] = Field(None, description="The analysis_id from /analyze, instead of the whole analysis")
     hashtags: List[str] = Field(..., description="The hashtags used in the analysis")
     platform: str = Field("instagram", description="Source platform: instagram or tiktok")
+    refresh: bool = Field(False, description="Generate a new script instead of returning this analysis's cached one")
 
 
 class HeyGenRequest(BaseModel):
-    analysis: dict = Field(..., description="The analysis object from /analyze")
+    analysis: Optional[dict] = Field(None, description="The analysis object from /analyze (or send analysis_id)")
+    analysis_id: Optional[str] = Field(None, description="The analysis_id from /analyze, instead of the whole analysis")
     hashtags: List[str] = Field(..., description="The hashtags used in the analysis")
     selected_prompt: Optional[str] = Field(None, description="Selected runway prompt for concept direction")
     avatar_id: str = Field(..., description="HeyGen Avatar IV avatar ID")
@@ -119,7 +318,71 @@ class HeyGenRequest(BaseModel):
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    """
+    Liveness plus this worker's circuit breaker per provider. "degraded" means at least one provider's
+    circuit is not closed: its calls are being skipped or failed fast, the API itself is fine.
+    """
+    circuits = circuit_breaker.states()
+    degraded = any(c["state"] != circuit_breaker.CLOSED for c in circuits.values())
+    return {"status": "degraded" if degraded else "ok", "circuits": circuits}
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """
+    Prometheus exposition: route and upstream latency histograms, Anthropic tokens and latency
+    per stage, cache hits/misses, executor/limiter queue depths and jobs in flight.
+    """
+    return Response(metrics.render(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/queue-stats")
+def upstream_queue_stats():
+    """
+    Per-provider submit limiter state: in-flight calls, queue depth, retries and throttling;
+    per-upstream executor pools: active/queued calls, queue wait p50/p95 and rejections;
+    open pooled connections per upstream HTTP client;
+    plus job store counts by kind and status (shared by all workers).
+    """
+    return {
+        "providers": queue_stats(),
+        "executors": executor_stats(),
+        "http": http_clients.pool_stats(),
+        "jobs": jobs.job_store.counts(),
+    }
+
+
+@app.get("/telemetry/models")
+def telemetry_models():
+    """Rolling submit→completion latency (p50/p95), queue time and success rate per model."""
+    return {"models": telemetry.model_stats()}
+
+
+@app.get("/diagnostics/startup")
+def startup_report():
+    """
+    Cold start breakdown: interpreter start, import time by top-level package up to app startup,
+    and which provider SDKs this worker has imported so far (they load on first use).
+    """
+    return startup.report()
+
+
+@app.get("/traces/{trace_id}")
+def trace_waterfall(trace_id: str, format: str = Query("json", pattern="^(json|text)$")):
+    """
+    Every exported span of a trace (the X-Trace-Id of /analyze and the calls that continued it),
+    in tree order with offsets from the trace start. format=text renders a plain-text waterfall.
+    """
+    if not tracing.valid_trace_id(trace_id):
+        raise HTTPException(status_code=400, detail="trace_id must be 32 lowercase hex characters")
+    if not tracing.EXPORT_PATH:
+        raise HTTPException(status_code=404, detail="Trace export is disabled; set TRACE_EXPORT_PATH")
+    rows = tracing.waterfall(tracing.load_trace(trace_id))
+    if not rows:
+        raise HTTPException(status_code=404, detail="Unknown trace_id")
+    if format == "text":
+        return PlainTextResponse(tracing.render_waterfall(rows) + "\n")
+    return {"trace_id": trace_id, "spans": rows}
 
 
 @app.post("/analyze", response_model=AnalyzeResponse)
@@ -174,11 +437,13 @@ async def analyze(req: ScrapeRequest):
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Analysis failed: {str(e)}")
 
-    return AnalyzeResponse(
+    stored = analysis_store.save({**analysis, "trace_id": tracing.current_trace_id()}, hashtags=req.hashtags, platform="instagram")
+    return _model_response(AnalyzeResponse(
         posts=posts,
         total_scraped=len(posts),
-        analysis=analysis,
-    )
+        analysis=stored,
+        analysis_id=stored["analysis_id"],
+    ))
 
 
 @app.post("/tiktok/analyze", response_model=AnalyzeResponse)
@@ -244,30 +509,39 @@ async def tiktok_analyze(req: TikTokScrapeRequest):
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Analysis failed: {str(e)}")
 
-    return AnalyzeResponse(
+    stored = analysis_store.save({**analysis, "trace_id": tracing.current_trace_id()}, hashtags=req.hashtags, platform="tiktok")
+    return _model_response(AnalyzeResponse(
         posts=posts,
         total_scraped=len(posts),
-        analysis=analysis,
-    )
+        analysis=stored,
+        analysis_id=stored["analysis_id"],
+    ))
 
 
 @app.post("/tiktok/propose-prompts")
 async def tiktok_propose_prompts(req: ProposePromptsRequest):
+    analysis = _analysis(req)
     anthropic_key = os.getenv("ANTHROPIC_API_KEY", "")
     if not anthropic_key:
         raise HTTPException(status_code=500, detail="ANTHROPIC_API_KEY not configured")
+    cached = None if req.refresh else analysis_store.get_step(analysis, "proposals", req.hashtags, "tiktok")
+    if cached is not None:
+        return {"proposals": cached}
     try:
-        loop = asyncio.get_event_loop()
-        proposals = await loop.run_in_executor(
-            None, generate_prompt_proposals, anthropic_key, req.analysis, req.hashtags, "tiktok"
+        proposals = await executors.run(
+            "anthropic", generate_prompt_proposals, anthropic_key, analysis, req.hashtags, "tiktok"
         )
+        analysis_store.put_step(analysis, "proposals", proposals, req.hashtags, "tiktok")
         return {"proposals": proposals}
+    except Saturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Prompt proposal failed: {str(e)}")
 
 
 @app.post("/tiktok/generate-videos", response_model=VideoResponse)
 async def tiktok_generate_videos(req: VideoRequest):
+    analysis = _analysis(req)
     anthropic_key = os.getenv("ANTHROPIC_API_KEY", "")
     runway_key = os.getenv("RUNWAYML_API_KEY", "")
     fal_key = os.getenv("FAL_KEY", "")
@@ -282,11 +556,14 @@ async def tiktok_generate_videos(req: VideoRequest):
             runway_key=runway_key,
             fal_key=fal_key,
             luma_key=luma_key,
-            analysis=req.analysis,
+            analysis=analysis,
             hashtags=req.hashtags,
             selected_prompt=req.selected_prompt,
+            hedge=req.hedge.model_dump() if req.hedge else None,
             platform="tiktok",
         )
+    except Saturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Video generation failed: {str(e)}")
 
@@ -295,21 +572,28 @@ async def tiktok_generate_videos(req: VideoRequest):
 
 @app.post("/propose-prompts")
 async def propose_prompts_endpoint(req: ProposePromptsRequest):
+    analysis = _analysis(req)
     anthropic_key = os.getenv("ANTHROPIC_API_KEY", "")
     if not anthropic_key:
         raise HTTPException(status_code=500, detail="ANTHROPIC_API_KEY not configured")
+    cached = None if req.refresh else analysis_store.get_step(analysis, "proposals", req.hashtags, "instagram")
+    if cached is not None:
+        return {"proposals": cached}
     try:
-        loop = asyncio.get_event_loop()
-        proposals = await loop.run_in_executor(
-            None, generate_prompt_proposals, anthropic_key, req.analysis, req.hashtags
+        proposals = await executors.run(
+            "anthropic", generate_prompt_proposals, anthropic_key, analysis, req.hashtags
         )
+        analysis_store.put_step(analysis, "proposals", proposals, req.hashtags, "instagram")
         return {"proposals": proposals}
+    except Saturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Prompt proposal failed: {str(e)}")
 
 
 @app.post("/generate-videos", response_model=VideoResponse)
 async def generate_videos_endpoint(req: VideoRequest):
+    analysis = _analysis(req)
     anthropic_key = os.getenv("ANTHROPIC_API_KEY", "")
     runway_key = os.getenv("RUNWAYML_API_KEY", "")
     fal_key = os.getenv("FAL_KEY", "")
@@ -324,25 +608,37 @@ async def generate_videos_endpoint(req: VideoRequest):
             runway_key=runway_key,
             fal_key=fal_key,
             luma_key=luma_key,
-            analysis=req.analysis,
+            analysis=analysis,
             hashtags=req.hashtags,
             selected_prompt=req.selected_prompt,
+            hedge=req.hedge.model_dump() if req.hedge else None,
         )
+    except Saturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Video generation failed: {str(e)}")
 
     return VideoResponse(videos=videos)
 
 
+@app.get("/hedge-status/{hedge_id}")
+def hedge_status(hedge_id: str):
+    """A hedged /generate-videos job: running, succeeded, failed or timeout, with every card it launched."""
+    state = get_hedge(hedge_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Unknown hedge_id")
+    return state
+
+
 @app.get("/video-status/runway/{task_id}")
 async def video_status_runway(task_id: str):
     runway_key = os.getenv("RUNWAYML_API_KEY", "")
     if not runway_key:
         raise HTTPException(status_code=500, detail="RUNWAYML_API_KEY not configured")
     try:
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, poll_runway_task, runway_key, task_id)
-        return result
+        return await cached_poll("runway", task_id, poll_runway_task, runway_key)
+    except Saturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Status check failed: {str(e)}")
 
@@ -353,9 +649,9 @@ async def video_status_kling(request_id: str):
     if not fal_key:
         raise HTTPException(status_code=500, detail="FAL_KEY not configured")
     try:
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, poll_kling_task, fal_key, request_id)
-        return result
+        return await cached_poll("kling", request_id, poll_kling_task, fal_key)
+    except Saturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Status check failed: {str(e)}")
 
@@ -366,9 +662,9 @@ async def video_status_luma(generation_id: str):
     if not luma_key:
         raise HTTPException(status_code=500, detail="LUMAAI_API_KEY not configured")
     try:
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, poll_luma_task, luma_key, generation_id)
-        return result
+        return await cached_poll("luma", generation_id, poll_luma_task, luma_key)
+    except Saturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Status check failed: {str(e)}")
 
@@ -379,9 +675,9 @@ async def video_status_pika(request_id: str):
     if not fal_key:
         raise HTTPException(status_code=500, detail="FAL_KEY not configured")
     try:
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, poll_pika_task, fal_key, request_id)
-        return result
+        return await cached_poll("pika", request_id, poll_pika_task, fal_key)
+    except Saturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Status check failed: {str(e)}")
 
@@ -392,9 +688,9 @@ async def video_status_hailuo(request_id: str):
     if not fal_key:
         raise HTTPException(status_code=500, detail="FAL_KEY not configured")
     try:
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, poll_hailuo_task, fal_key, request_id)
-        return result
+        return await cached_poll("hailuo", request_id, poll_hailuo_task, fal_key)
+    except Saturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Status check failed: {str(e)}")
 
@@ -405,9 +701,9 @@ async def video_status_heygen(video_id: str):
     if not heygen_key:
         raise HTTPException(status_code=500, detail="HEYGEN_API_KEY not configured")
     try:
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, poll_heygen_task, heygen_key, video_id)
-        return result
+        return await cached_poll("heygen", video_id, poll_heygen_task, heygen_key)
+    except Saturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Status check failed: {str(e)}")
 
@@ -417,40 +713,89 @@ async def heygen_preview_script(req: HeyGenScriptRequest):
     """
     Generate a concept via Claude and return the pre-built spoken script for preview/editing.
     Does NOT submit to HeyGen — just returns the text so the user can review and edit.
+    The script is kept with the analysis; refresh=true generates a new one.
     """
+    analysis = _analysis(req)
     anthropic_key = os.getenv("ANTHROPIC_API_KEY", "")
     if not anthropic_key:
         raise HTTPException(status_code=500, detail="ANTHROPIC_API_KEY not configured")
+    cached = None if req.refresh else analysis_store.get_step(analysis, "script", req.hashtags, req.platform)
+    if cached is not None:
+        return cached
     try:
-        loop = asyncio.get_event_loop()
-        concept = await loop.run_in_executor(
-            None, generate_concept, anthropic_key, req.analysis, req.hashtags, None, req.platform
+        concept = await executors.run(
+            "anthropic", generate_concept, anthropic_key, analysis, req.hashtags, None, req.platform
         )
         spoken_script = build_spoken_script(concept)
-        return {
+        preview = {
             "spoken_script": spoken_script,
             "hook": concept.get("hook", ""),
             "word_count": len(spoken_script.split()),
         }
+        analysis_store.put_step(analysis, "script", preview, req.hashtags, req.platform)
+        return preview
+    except Saturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Script generation failed: {str(e)}")
 
 
+def _paginate(items: list, page: int, page_size: Optional[int]) -> list:
+    if not page_size:
+        return items
+    start = (page - 1) * page_size
+    return items[start:start + page_size]
+
+
 @app.get("/heygen/config")
-async def heygen_config():
+async def heygen_config(
+    request: Request,
+    q: Optional[str] = None,
+    gender: Optional[str] = None,
+    page: int = Query(1, ge=1),
+    page_size: Optional[int] = Query(None, ge=1, le=500, description="Omit to return the full lists"),
+):
+    """
+    Avatar/voice catalog, served from a stale-while-revalidate cache.
+    q filters by name substring, gender by exact gender; page/page_size paginate each list.
+    Responses carry an ETag — a matching If-None-Match returns 304 with no body.
+    """
     heygen_key = os.getenv("HEYGEN_API_KEY", "")
     if not heygen_key:
         raise HTTPException(status_code=500, detail="HEYGEN_API_KEY not configured")
     try:
-        loop = asyncio.get_event_loop()
-        config = await loop.run_in_executor(None, fetch_heygen_config, heygen_key)
-        return config
+        config = await catalog_cache.get(heygen_key)
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"HeyGen config fetch failed: {str(e)}")
 
+    avatars, voices = config["avatars"], config["voices"]
+    if q:
+        needle = q.lower()
+        avatars = [a for a in avatars if needle in (a.get("name") or "").lower()]
+        voices = [v for v in voices if needle in (v.get("name") or "").lower()]
+    if gender:
+        avatars = [a for a in avatars if (a.get("gender") or "").lower() == gender.lower()]
+        voices = [v for v in voices if (v.get("gender") or "").lower() == gender.lower()]
+
+    body = {
+        "avatars": _paginate(avatars, page, page_size),
+        "voices": _paginate(voices, page, page_size),
+        "total_avatars": len(avatars),
+        "total_voices": len(voices),
+        "page": page,
+        "page_size": page_size,
+    }
+    payload = json.dumps(body, separators=(",", ":")).encode()
+    etag = '"' + hashlib.sha1(payload).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=300, stale-while-revalidate=3600"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type="application/json", headers=headers)
+
 
 @app.post("/heygen/generate", response_model=VideoResponse)
 async def heygen_generate(req: HeyGenRequest):
+    analysis = _analysis(req)
     anthropic_key = os.getenv("ANTHROPIC_API_KEY", "")
     heygen_key = os.getenv("HEYGEN_API_KEY", "")
 
@@ -460,22 +805,21 @@ async def heygen_generate(req: HeyGenRequest):
         raise HTTPException(status_code=500, detail="HEYGEN_API_KEY not configured")
 
     try:
-        loop = asyncio.get_event_loop()
         if req.spoken_script and req.spoken_script.strip():
             # User provided/edited script — skip Claude, use an empty concept shell
             concept = {"hook": "", "script_outline": [], "runway_prompt": "", "hashtags": []}
         else:
-            concept = await loop.run_in_executor(
-                None,
+            concept = await executors.run(
+                "anthropic",
                 generate_concept,
                 anthropic_key,
-                req.analysis,
+                analysis,
                 req.hashtags,
                 req.selected_prompt,
                 req.platform,
             )
-        result = await loop.run_in_executor(
-            None,
+        result = await circuit_breaker.run_for(
+            "heygen",
             submit_heygen_task,
             heygen_key,
             concept,
@@ -483,9 +827,13 @@ async def heygen_generate(req: HeyGenRequest):
             req.voice_id,
             req.spoken_script,  # None → auto-build from concept; str → use directly
         )
+    except Saturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"HeyGen generation failed: {str(e)}")
 
+    telemetry.record_cards([result])
+    jobs.record_cards([result])
     return VideoResponse(videos=[result])
 
 
@@ -500,33 +848,32 @@ async def pipeline_upload_image(file: UploadFile = File(...)):
     """
     Upload an image to fal.ai CDN and return the public URL.
     Used by the frontend to get a public URL before submitting an image-to-video job.
+    Oversized images are downscaled first; re-uploading the same image returns the cached URL.
     """
     fal_key = os.getenv("FAL_KEY", "")
     if not fal_key:
         raise HTTPException(status_code=500, detail="FAL_KEY not configured")
 
-    os.environ["FAL_KEY"] = fal_key
-    content = await file.read()
-    content_type = file.content_type or "image/jpeg"
-
-    suffix = ".png" if "png" in content_type else ".jpg"
-
-    def _upload() -> str:
-        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
-            tmp.write(content)
-            tmp_path = tmp.name
-        try:
-            return fal_client.upload_file(tmp_path)
-        finally:
-            os.unlink(tmp_path)
-
-    loop = asyncio.get_event_loop()
     try:
-        url = await loop.run_in_executor(None, _upload)
+        return await upload_image(fal_key, file)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Image upload failed: {str(e)}")
 
-    return {"url": url}
+
+# Background routing keys and the telemetry model each one is measured under
+BACKGROUND_MODELS = {"kling": "kling-2.6-pro", "runway": "gen4.5"}
+
+
+def _resolve_background_model(model: str, runway_key: str, fal_key: str) -> str:
+    """Map 'auto' to the configured background model with the best recent p50; pass others through."""
+    if model != "auto":
+        return model
+    configured = {"kling": fal_key, "runway": runway_key}
+    candidates = {
+        key: name for key, name in BACKGROUND_MODELS.items()
+        if configured[key] and circuit_breaker.available(circuit_breaker.submit_breaker(key, name))
+    }
+    return telemetry.pick_fastest(candidates, default="kling" if fal_key or not runway_key else "runway")
 
 
 @app.post("/pipeline/generate-backgrounds")
@@ -538,26 +885,33 @@ async def pipeline_generate_backgrounds(req: BackgroundRequest):
     """
     runway_key = os.getenv("RUNWAYML_API_KEY", "")
     fal_key = os.getenv("FAL_KEY", "")
+    model = _resolve_background_model(req.model, runway_key, fal_key)
 
-    loop = asyncio.get_event_loop()
-
-    if req.model == "runway":
+    if model == "runway":
         if not runway_key:
             raise HTTPException(status_code=500, detail="RUNWAYML_API_KEY not configured")
         results = await asyncio.gather(
-            loop.run_in_executor(None, submit_background_runway, runway_key, req.prompt_a, "A", req.image_url_a),
-            loop.run_in_executor(None, submit_background_runway, runway_key, req.prompt_b, "B", req.image_url_b),
+            circuit_breaker.run_for(
+                background_runway_breaker(req.image_url_a), submit_background_runway, runway_key, req.prompt_a, "A",
+                req.image_url_a,
+            ),
+            circuit_breaker.run_for(
+                background_runway_breaker(req.image_url_b), submit_background_runway, runway_key, req.prompt_b, "B",
+                req.image_url_b,
+            ),
         )
     else:
         # Default: Kling
         if not fal_key:
             raise HTTPException(status_code=500, detail="FAL_KEY not configured")
         results = await asyncio.gather(
-            loop.run_in_executor(None, submit_background_kling, fal_key, req.prompt_a, "A", req.image_url_a),
-            loop.run_in_executor(None, submit_background_kling, fal_key, req.prompt_b, "B", req.image_url_b),
+            circuit_breaker.run_for("kling", submit_background_kling, fal_key, req.prompt_a, "A", req.image_url_a),
+            circuit_breaker.run_for("kling", submit_background_kling, fal_key, req.prompt_b, "B", req.image_url_b),
         )
 
-    return {"backgrounds": list(results)}
+    telemetry.record_cards(results)
+    jobs.record_cards(results)
+    return {"backgrounds": list(results), "model": model}
 
 
 @app.post("/pipeline/generate-background")
@@ -568,64 +922,316 @@ async def pipeline_generate_background(req: SingleBackgroundRequest):
     """
     runway_key = os.getenv("RUNWAYML_API_KEY", "")
     fal_key = os.getenv("FAL_KEY", "")
+    model = _resolve_background_model(req.model, runway_key, fal_key)
 
-    loop = asyncio.get_event_loop()
-
-    if req.model == "runway":
+    if model == "runway":
         if not runway_key:
             raise HTTPException(status_code=500, detail="RUNWAYML_API_KEY not configured")
-        result = await loop.run_in_executor(
-            None, submit_background_runway, runway_key, req.prompt, req.slot, req.image_url
+        result = await circuit_breaker.run_for(
+            background_runway_breaker(req.image_url), submit_background_runway, runway_key, req.prompt, req.slot,
+            req.image_url,
         )
     else:
         if not fal_key:
             raise HTTPException(status_code=500, detail="FAL_KEY not configured")
-        result = await loop.run_in_executor(
-            None, submit_background_kling, fal_key, req.prompt, req.slot, req.image_url
+        result = await circuit_breaker.run_for(
+            "kling", submit_background_kling, fal_key, req.prompt, req.slot, req.image_url
         )
 
-    return {"background": result}
+    telemetry.record_cards([result])
+    jobs.record_cards([result])
+    return {"background": result, "model": model}
+
+
+# Preview render_id -> the CompositeRequest that produced it, kept in the shared job store (kind "preview")
+# so any worker can approve it, also after a restart. Older previews can no longer be approved.
+PREVIEW_TTL_SECONDS = float(os.getenv("COMPOSITE_PREVIEW_TTL_SECONDS", str(24 * 3600)))
 
 
 @app.post("/pipeline/composite")
 async def pipeline_composite(req: CompositeRequest):
     """
-    Submit a Shotstack render job to composite:
+    Submit a render job to composite:
     avatar (green screen) + background + caption + music → 9:16 MP4.
+    engine='shotstack' renders on Shotstack; engine='local' renders with ffmpeg on this server.
+    Both return a render_id for /pipeline/composite-status.
+    preview=True renders a low-res, low-fps proxy in seconds for iterating on background,
+    music and captions; approve it to commit the full-quality render.
     """
-    shotstack_key = os.getenv("SHOTSTACK_API_KEY", "")
-    if not shotstack_key:
-        raise HTTPException(status_code=500, detail="SHOTSTACK_API_KEY not configured")
-
-    loop = asyncio.get_event_loop()
-    result = await loop.run_in_executor(
-        None,
-        submit_composite,
-        shotstack_key,
+    args = (
         req.heygen_video_url,
         req.background_video_url,
         req.hook_text,
         req.music_track_id,
         req.duration,
         req.spoken_script,
+        req.preview,
     )
 
+    if req.engine == "local":
+        for url in (req.heygen_video_url, req.background_video_url):
+            if not asset_cache.is_remote_url(url):
+                raise HTTPException(status_code=400, detail=f"Video URLs must be http(s): {url}")
+        result = submit_local_composite(*args)
+        telemetry.record_submit(result.get("render_id"), "local-ffmpeg")
+    elif req.engine == "shotstack":
+        shotstack_key = os.getenv("SHOTSTACK_API_KEY", "")
+        if not shotstack_key:
+            raise HTTPException(status_code=500, detail="SHOTSTACK_API_KEY not configured")
+        result = await circuit_breaker.run_for("shotstack", submit_composite, shotstack_key, *args)
+        telemetry.record_submit(result.get("render_id"), "shotstack")
+        jobs.record_submit(result.get("render_id"), "shotstack")
+    else:
+        raise HTTPException(status_code=400, detail=f"Unknown composite engine: {req.engine}")
+
     if result.get("status") == "error":
         raise HTTPException(status_code=502, detail=result.get("error", "Composite submission failed"))
 
-    return result
+    if req.preview:
+        jobs.job_store.upsert("preview", "preview", result["render_id"], "succeeded", params=req.model_dump())
+    return {**result, "preview": req.preview}
+
+
+@app.post("/pipeline/composite/{render_id}/approve")
+async def pipeline_composite_approve(render_id: str, req: ApproveCompositeRequest):
+    """Commit the full-quality render for an approved preview, reusing the preview's inputs."""
+    job = jobs.job_store.get("preview", render_id)
+    if job is None or job["kind"] != "preview" or job["updated_at"] + PREVIEW_TTL_SECONDS <= time.time():
+        raise HTTPException(status_code=404, detail="Unknown or expired preview render_id")
+    preview_req = CompositeRequest(**job["params"])
+    full_req = preview_req.model_copy(update={"preview": False, "engine": req.engine or preview_req.engine})
+    result = await pipeline_composite(full_req)
+    return {**result, "preview_render_id": render_id}
 
 
 @app.get("/pipeline/composite-status/{render_id}")
-async def pipeline_composite_status(render_id: str):
-    """Poll a Shotstack render job by render_id."""
+async def pipeline_composite_status(render_id: str, request: Request):
+    """Poll a render job by render_id (Shotstack, or a local ffmpeg render)."""
+    return await _composite_status(render_id, os.getenv("PUBLIC_BASE_URL") or str(request.base_url))
+
+
+async def _composite_status(render_id: str, base_url: str) -> dict:
+    if is_local_render(render_id):
+        result = poll_local_composite(render_id, base_url)
+        telemetry.record_poll(render_id, result)
+        return result
+
     shotstack_key = os.getenv("SHOTSTACK_API_KEY", "")
     if not shotstack_key:
         raise HTTPException(status_code=500, detail="SHOTSTACK_API_KEY not configured")
 
-    loop = asyncio.get_event_loop()
-    result = await loop.run_in_executor(None, poll_composite, shotstack_key, render_id)
-    return result
+    return await cached_poll("shotstack", render_id, poll_composite, shotstack_key)
+
+
+MAX_BATCH_VARIANTS = int(os.getenv("MAX_BATCH_VARIANTS", "12"))
+
+
+@app.post("/pipeline/composite-batch")
+async def pipeline_composite_batch(req: BatchCompositeRequest):
+    """
+    Render every background × music track combination for one HeyGen clip in a single request.
+    Variants are submitted concurrently; the provider limiter (Shotstack) or the render pool
+    (local) caps how many run at once. Poll /pipeline/composite-batch/{batch_id} for grouped status.
+    """
+    if req.engine not in ("shotstack", "local"):
+        raise HTTPException(status_code=400, detail=f"Unknown composite engine: {req.engine}")
+    if req.engine == "shotstack" and not os.getenv("SHOTSTACK_API_KEY", ""):
+        raise HTTPException(status_code=500, detail="SHOTSTACK_API_KEY not configured")
+    variants = [
+        (slot, url, track)
+        for slot, url in req.backgrounds.items()
+        for track in dict.fromkeys(req.music_track_ids)
+    ]
+    if not variants:
+        raise HTTPException(status_code=400, detail="At least one background and one music track are required")
+    if len(variants) > MAX_BATCH_VARIANTS:
+        raise HTTPException(status_code=400, detail=f"{len(variants)} variants exceeds the limit of {MAX_BATCH_VARIANTS}")
+
+    async def submit(slot: str, url: str, track: str) -> dict:
+        card = {"variant_id": f"{slot}-{track}", "background_slot": slot, "music_track_id": track}
+        variant_req = CompositeRequest(
+            heygen_video_url=req.heygen_video_url,
+            background_video_url=url,
+            hook_text=req.hook_text,
+            music_track_id=track,
+            duration=req.duration,
+            spoken_script=req.spoken_script,
+            engine=req.engine,
+            preview=req.preview,
+        )
+        try:
+            return {**card, **await pipeline_composite(variant_req)}
+        except HTTPException as e:
+            return {**card, "render_id": None, "status": "error", "video_url": None, "error": e.detail}
+        except Saturated as e:
+            return {**card, "render_id": None, "status": "error", "video_url": None, "error": str(e)}
+
+    cards = await asyncio.gather(*(submit(*v) for v in variants))
+    batch_id = uuid.uuid4().hex
+    jobs.job_store.upsert("batch", "batch", batch_id, "pending", params=req.model_dump(), result={"variants": cards})
+    return {"batch_id": batch_id, "variants": cards}
+
+
+@app.get("/pipeline/composite-batch/{batch_id}")
+async def pipeline_composite_batch_status(batch_id: str, request: Request):
+    """
+    Poll every variant of a batch at once. status is 'pending' while any render is,
+    then 'succeeded' (all), 'partial' (some) or 'failed' (none).
+    """
+    job = jobs.job_store.get("batch", batch_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown batch_id")
+    base_url = os.getenv("PUBLIC_BASE_URL") or str(request.base_url)
+
+    async def status(card: dict) -> dict:
+        if not card.get("render_id") or card.get("status") in TERMINAL_STATUSES + ("error",):
+            return card
+        return {**card, **await _composite_status(card["render_id"], base_url)}
+
+    cards = await asyncio.gather(*(status(c) for c in job["result"]["variants"]))
+    counts = {}
+    for card in cards:
+        counts[card["status"]] = counts.get(card["status"], 0) + 1
+    if counts.get("pending"):
+        overall = "pending"
+    elif counts.get("succeeded") == len(cards):
+        overall = "succeeded"
+    else:
+        overall = "partial" if counts.get("succeeded") else "failed"
+    jobs.job_store.upsert("batch", "batch", batch_id, overall, result={"variants": cards})
+    return {"batch_id": batch_id, "status": overall, "counts": counts, "variants": cards}
+
+
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+def _video_file_response(path: Path, request: Request, etag: str, cache_control: str) -> Response:
+    """
+    Serve an immutable video file with ETag revalidation and single-range requests,
+    so players can seek and resume without re-downloading the whole file.
+    Multi-range requests get the full body, which RFC 9110 allows.
+    """
+    size = path.stat().st_size
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    start, end = 0, size - 1
+    match = RANGE_PATTERN.match(request.headers.get("range", "").strip())
+    if_range = request.headers.get("if-range")
+    if match and (if_range is None or if_range == etag) and any(match.groups()):
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        else:
+            start = max(size - int(last), 0)  # suffix range: the last N bytes
+        if start >= size or start > end:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    def body():
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(asset_cache.CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    status_code = 206 if "Content-Range" in headers else 200
+    return StreamingResponse(body(), status_code=status_code, headers=headers, media_type="video/mp4")
+
+
+@app.get("/pipeline/renders/{render_id}.mp4")
+def pipeline_render_file(render_id: str, request: Request):
+    """Serve a finished local render (range requests supported)."""
+    path = render_path(render_id)
+    if not is_local_render(render_id) or "/" in render_id or not path.exists():
+        raise HTTPException(status_code=404, detail="Render not found")
+    return _video_file_response(path, request, f'"{render_id}"', "public, max-age=86400")
+
+
+@app.get("/assets/{digest}.mp4")
+def asset_file(digest: str, request: Request):
+    """
+    Serve a cached copy of a finished provider video. Blobs are content-addressed,
+    so the digest is a strong ETag and responses are cacheable forever.
+    """
+    path = asset_cache.blob_path(digest)
+    if not asset_cache.is_digest(digest) or not path.exists():
+        raise HTTPException(status_code=404, detail="Asset not found")
+    asset_cache.touch(path)
+    return _video_file_response(path, request, f'"{digest}"', "public, max-age=31536000, immutable")
+
+
+@app.post("/pipeline/run")
+async def pipeline_run(req: PipelineRunRequest, request: Request):
+    """
+    Run the whole pipeline server-side under one pipeline_id:
+    HeyGen avatar and background generation in parallel, then the composite as soon as both are ready.
+    Returns immediately; poll /pipeline/run/{pipeline_id}.
+    """
+    analysis = _analysis(req)
+    keys = _provider_keys()
+    background_model = _resolve_background_model(req.background_model, keys["runway"], keys["fal"])
+    required = [("heygen", "HEYGEN_API_KEY")]
+    if not (req.spoken_script and req.spoken_script.strip()):
+        required.append(("anthropic", "ANTHROPIC_API_KEY"))
+    required.append(("runway", "RUNWAYML_API_KEY") if background_model == "runway" else ("fal", "FAL_KEY"))
+    if req.engine == "shotstack":
+        required.append(("shotstack", "SHOTSTACK_API_KEY"))
+    elif req.engine != "local":
+        raise HTTPException(status_code=400, detail=f"Unknown composite engine: {req.engine}")
+    for key, env_name in required:
+        if not keys[key]:
+            raise HTTPException(status_code=500, detail=f"{env_name} not configured")
+
+    params = {**req.model_dump(), "analysis": analysis, "background_model": background_model}
+    base_url = os.getenv("PUBLIC_BASE_URL") or str(request.base_url)
+    return pipeline_runner.start_run(params, keys, base_url)
+
+
+@app.get("/pipeline/run/{pipeline_id}")
+def pipeline_run_status(pipeline_id: str):
+    state = pipeline_runner.get_run(pipeline_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Unknown pipeline_id")
+    return state
+
+
+WEBHOOK_SOURCES = {
+    "fal": (parse_fal_webhook, ("kling", "pika", "hailuo")),
+    "heygen": (parse_heygen_webhook, ("heygen",)),
+    "shotstack": (parse_shotstack_webhook, ("shotstack",)),
+}
+
+
+@app.post("/webhooks/{source}/{provider}")
+async def provider_webhook(source: str, provider: str, request: Request, token: Optional[str] = None):
+    """
+    Completion callback from fal.ai, HeyGen or Shotstack.
+    The URL is attached at submit time; the shared token authenticates the caller.
+    Terminal results land in the task cache so the next status poll returns without an upstream call.
+    """
+    if not verify_token(token):
+        raise HTTPException(status_code=401, detail="Invalid webhook token")
+    if source not in WEBHOOK_SOURCES or provider not in WEBHOOK_SOURCES[source][1]:
+        raise HTTPException(status_code=404, detail=f"Unknown webhook: {source}/{provider}")
+
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Webhook body must be JSON")
+
+    parse = WEBHOOK_SOURCES[source][0]
+    task_id, result = parse(payload)
+    if not task_id:
+        raise HTTPException(status_code=400, detail="Webhook payload has no task id")
+
+    return {"task_id": task_id, **record_result(provider, task_id, result)}
 
 
 # Keep old endpoint working for backwards compat (routes to runway)
@@ -635,9 +1241,9 @@ async def video_status_legacy(task_id: str):
     if not runway_key:
         raise HTTPException(status_code=500, detail="RUNWAYML_API_KEY not configured")
     try:
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, poll_runway_task, runway_key, task_id)
-        return result
+        return await cached_poll("runway", task_id, poll_runway_task, runway_key)
+    except Saturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Status check failed: {str(e)}")
 
@@ -0,0 +1,143 @@
+import os
+import time
+from functools import wraps
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+import tracing
+
+# Prometheus metrics for capacity planning. Histograms and counters are updated inline;
+# queue depths and in-flight jobs are read from their owners at scrape time (StateCollector).
+# With several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty directory so
+# /metrics aggregates every worker's samples instead of reporting whichever one answered.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+# Upstream calls span ~50ms status polls to multi-minute Apify runs
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "API request latency by route.",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_LATENCY = Histogram(
+    "upstream_call_duration_seconds", "Latency of calls to upstream providers.",
+    ["upstream", "operation", "outcome"], buckets=LATENCY_BUCKETS,
+)
+LLM_LATENCY = Histogram(
+    "anthropic_request_duration_seconds", "Anthropic messages.create latency by pipeline stage.",
+    ["stage", "model"], buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "anthropic_tokens_total", "Anthropic tokens consumed by pipeline stage.",
+    ["stage", "model", "kind"],
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total", "Cache lookups by cache and result; hit ratio = hit / (hit + miss).",
+    ["cache", "result"],
+)
+
+
+class observe_upstream:
+    """
+    Time an upstream call and trace it as a span; usable with `with` or `async with`.
+    Outcome is 'error' if it raised.
+    """
+
+    def __init__(self, upstream: str, operation: str):
+        self.upstream = upstream
+        self.operation = operation
+        self.span = tracing.Span(f"{upstream}.{operation}", upstream=upstream)
+
+    def __enter__(self):
+        self.span.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        outcome = "ok" if exc_type is None else "error"
+        UPSTREAM_LATENCY.labels(self.upstream, self.operation, outcome).observe(time.perf_counter() - self.started)
+        return self.span.__exit__(exc_type, exc, tb)
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+def timed(upstream: str, operation: str, fn):
+    """Wrap a blocking upstream call so every invocation is timed (for passing to executors)."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with observe_upstream(upstream, operation):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def record_llm(stage: str, message, started: float) -> None:
+    """Record latency and token usage for one Anthropic messages.create response."""
+    model = getattr(message, "model", "") or ""
+    LLM_LATENCY.labels(stage, model).observe(time.perf_counter() - started)
+    usage = getattr(message, "usage", None)
+    if usage is not None:
+        LLM_TOKENS.labels(stage, model, "input").inc(usage.input_tokens or 0)
+        LLM_TOKENS.labels(stage, model, "output").inc(usage.output_tokens or 0)
+
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+class StateCollector:
+    """Gauges sampled at scrape time: executor and limiter queues, jobs in flight."""
+
+    def collect(self):
+        # Imported here: these modules import metrics themselves
+        from circuit_breaker import states as circuit_states
+        from executors import executor_stats
+        from job_store import job_store, UNFINISHED_STATUSES
+        from rate_limit import queue_stats
+
+        active = GaugeMetricFamily("executor_active_calls", "Calls running on an upstream pool.", labels=["pool"])
+        queued = GaugeMetricFamily("executor_queued_calls", "Calls waiting for an upstream pool.", labels=["pool"])
+        for name, stats in executor_stats().items():
+            active.add_metric([name], stats["active"])
+            queued.add_metric([name], stats["queued"])
+        yield active
+        yield queued
+
+        in_flight = GaugeMetricFamily("limiter_in_flight_calls", "Submits in flight per provider limiter.", labels=["provider"])
+        waiting = GaugeMetricFamily("limiter_queued_calls", "Submits waiting on a provider limiter.", labels=["provider"])
+        for name, stats in queue_stats().items():
+            in_flight.add_metric([name], stats["in_flight"])
+            waiting.add_metric([name], stats["queued"])
+        yield in_flight
+        yield waiting
+
+        circuits = GaugeMetricFamily(
+            "circuit_breaker_state", "Provider circuit: 0 closed, 1 half-open, 2 open.", labels=["provider"]
+        )
+        for name, stats in circuit_states().items():
+            circuits.add_metric([name], {"closed": 0, "half_open": 1, "open": 2}[stats["state"]])
+        yield circuits
+
+        jobs = GaugeMetricFamily("jobs_in_flight", "Unfinished jobs in the shared job store.", labels=["kind"])
+        for kind, statuses in job_store.counts().items():
+            jobs.add_metric([kind], sum(n for status, n in statuses.items() if status in UNFINISHED_STATUSES))
+        yield jobs
+
+
+REGISTRY.register(StateCollector())
+
+
+def render() -> bytes:
+    """Exposition for /metrics: this process's registry, or all workers' in multiprocess mode."""
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(StateCollector())
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
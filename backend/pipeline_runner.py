@@ -0,0 +1,399 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+import asset_cache
+import circuit_breaker
+from analysis_store import analysis_store
+import executors
+import idempotency
+import metrics
+import telemetry
+import tracing
+import local_compositor
+import webhooks
+from job_store import (
+    job_store, LEASE_SECONDS, TERMINAL_STATUSES, UNFINISHED_STATUSES, record_cards, record_submit, record_result,
+)
+from task_cache import task_cache
+from video_generator import generate_concept, submit_background_runway, poll_runway_task, background_runway_breaker
+from kling_client import submit_background_kling, poll_kling_task, poll_pika_task, poll_hailuo_task
+from luma_client import poll_luma_task
+from heygen_client import submit_heygen_task, poll_heygen_task
+from shotstack_client import submit_composite, poll_composite
+from local_compositor import submit_local_composite, poll_local_composite
+
+POLL_INTERVAL = float(os.getenv("PIPELINE_POLL_INTERVAL", "3"))  # seconds between upstream polls
+CACHE_CHECK_INTERVAL = 0.5  # webhook results land in the task cache; check it more often than upstream
+STEP_TIMEOUT = float(os.getenv("PIPELINE_STEP_TIMEOUT", "1200"))
+MAX_RUNS = 500
+
+# Leases are renewed every MAINTENANCE_INTERVAL; work idle for a full lease is considered orphaned
+MAINTENANCE_INTERVAL = LEASE_SECONDS / 3
+
+# provider -> (poll function, key name in the keys dict), for resuming tasks nobody is polling
+POLLERS = {
+    "runway": (poll_runway_task, "runway"),
+    "kling": (poll_kling_task, "fal"),
+    "pika": (poll_pika_task, "fal"),
+    "hailuo": (poll_hailuo_task, "fal"),
+    "luma": (poll_luma_task, "luma"),
+    "heygen": (poll_heygen_task, "heygen"),
+    "shotstack": (poll_composite, "shotstack"),
+}
+
+_runs: "OrderedDict[str, dict]" = OrderedDict()
+_tasks = set()  # strong refs so running pipelines aren't garbage-collected
+_watching = set()  # (provider, external_id) this worker resumed and is polling
+
+
+async def cached_poll(provider: str, task_id: str, poll_fn, *poll_args, admit: bool = True) -> dict:
+    """
+    Return a task's status, serving terminal results from the local cache.
+    Only non-terminal tasks reach the provider; terminal results are stored on first sight.
+    Finished videos are pulled into the local asset cache in the background on first sight.
+    The poll runs on the provider's own executor; admit=False waits instead of raising Saturated.
+    Raises CircuitOpen, without polling, while the provider's circuit is open.
+    """
+    cached = await task_cache.aget(provider, task_id)
+    if cached is not None:
+        return await _localize(cached, admit)
+    if tracing.joinable():
+        # A client status poll: file it under the trace that submitted the task
+        job = job_store.get(provider, task_id)
+        tracing.join(((job or {}).get("params") or {}).get("trace_id"))
+    result = await circuit_breaker.run_for(
+        provider, metrics.timed(provider, "poll", poll_fn), *poll_args, task_id, admit=admit
+    )
+    if not task_cache.put(provider, task_id, result):
+        record_result(provider, task_id, result)
+    telemetry.record_poll(task_id, result)
+    return await _localize(result, admit)
+
+
+async def _localize(result: dict, admit: bool) -> dict:
+    """
+    Point a finished video at its local copy once cached. Until then the provider's URL is returned
+    and the download runs in the background, so a poll never waits on it.
+    """
+    result, download = await executors.run("assets", asset_cache.localize_result, result, admit=admit)
+    if download:
+        task = asyncio.create_task(executors.run("assets", asset_cache.prefetch, download, admit=False))
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+    return result
+
+
+async def wait_for_task(provider: str, task_id: str, poll_fn, *poll_args) -> dict:
+    """
+    Poll until the task is terminal or STEP_TIMEOUT passes.
+    Checks the task cache between upstream polls so webhook completions are picked up within ~0.5s.
+    """
+    started = time.monotonic()
+    last_poll = 0.0
+    while time.monotonic() - started < STEP_TIMEOUT:
+        cached = await task_cache.aget(provider, task_id)
+        if cached is not None:
+            telemetry.record_poll(task_id, cached)
+            return await _localize(cached, admit=False)
+        if time.monotonic() - last_poll >= POLL_INTERVAL:
+            last_poll = time.monotonic()
+            try:
+                result = await cached_poll(provider, task_id, poll_fn, *poll_args, admit=False)
+            except circuit_breaker.CircuitOpen:
+                result = {}  # the task keeps running upstream; poll again once the circuit lets us
+            if result.get("status") in TERMINAL_STATUSES:
+                return result
+        await asyncio.sleep(CACHE_CHECK_INTERVAL)
+    return {"task_id": task_id, "status": "timeout", "video_url": None, "error": f"Timed out after {STEP_TIMEOUT:.0f}s"}
+
+
+def start_run(params: dict, keys: dict, base_url: str) -> dict:
+    """Register a pipeline run and start it in the background. Returns the initial state."""
+    pipeline_id = uuid.uuid4().hex
+    state = {
+        "pipeline_id": pipeline_id,
+        "status": "running",
+        "stage": "generating",
+        "avatar": None,
+        "background": None,
+        "composite": None,
+        "video_url": None,
+        "error": None,
+        "trace_id": tracing.current_trace_id(),
+        "created_at": time.time(),
+        "updated_at": time.time(),
+    }
+    # Keys are never persisted; a resuming worker reads its own from the environment
+    job_store.upsert(
+        "pipeline", "pipeline", pipeline_id, "running", params={"params": params, "base_url": base_url}, result=state,
+    )
+    job_store.claim("pipeline", pipeline_id)
+    _launch(state, params, keys, base_url)
+    return state
+
+
+def _launch(state: dict, params: dict, keys: dict, base_url: str) -> None:
+    _runs[state["pipeline_id"]] = state
+    while len(_runs) > MAX_RUNS:
+        _runs.popitem(last=False)
+    task = asyncio.create_task(_run(state, params, keys, base_url))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+def get_run(pipeline_id: str) -> Optional[dict]:
+    """This worker's live state if it drives the run, otherwise the last state persisted by whoever does."""
+    if pipeline_id in _runs:
+        return _runs[pipeline_id]
+    job = job_store.get("pipeline", pipeline_id)
+    return job["result"] if job is not None else None
+
+
+def _update(state: dict, **changes) -> None:
+    state.update(changes, updated_at=time.time())
+    job_store.upsert("pipeline", "pipeline", state["pipeline_id"], state["status"], result=state)
+
+
+def _resumable(card: Optional[dict], id_field: str = "task_id") -> bool:
+    """A card from an earlier attempt at this run whose upstream job can be picked up again."""
+    return bool(card and card.get(id_field) and card.get("status") not in ("error", "timeout"))
+
+
+async def _avatar_branch(state: dict, params: dict, keys: dict) -> dict:
+    card = state["avatar"]
+    if not _resumable(card):
+        spoken_script = params.get("spoken_script")
+        if spoken_script and spoken_script.strip():
+            concept = {"hook": "", "script_outline": [], "runway_prompt": "", "hashtags": []}
+        else:
+            concept = await executors.run(
+                "anthropic", generate_concept, keys["anthropic"], params["analysis"], params["hashtags"],
+                params.get("selected_prompt"), params.get("platform", "instagram"), admit=False,
+            )
+        card = await circuit_breaker.run_for(
+            "heygen", submit_heygen_task, keys["heygen"], concept, params["avatar_id"], params["voice_id"], spoken_script,
+            admit=False,
+        )
+        telemetry.record_cards([card])
+        record_cards([card], {"pipeline_id": state["pipeline_id"]})
+        _update(state, avatar=card)
+        if card.get("status") == "error":
+            return card
+    if card.get("status") in TERMINAL_STATUSES:
+        return card
+    result = await wait_for_task("heygen", card["task_id"], poll_heygen_task, keys["heygen"])
+    card = {**card, **result}
+    _update(state, avatar=card)
+    return card
+
+
+async def _background_branch(state: dict, params: dict, keys: dict) -> dict:
+    model = params["background_model"]
+    if model == "runway":
+        submit_fn, poll_fn, provider, key = submit_background_runway, poll_runway_task, "runway", keys["runway"]
+        breaker = background_runway_breaker(params.get("background_image_url"))
+    else:
+        submit_fn, poll_fn, provider, key = submit_background_kling, poll_kling_task, "kling", keys["fal"]
+        breaker = provider
+    card = state["background"]
+    if not _resumable(card):
+        card = await circuit_breaker.run_for(
+            breaker, submit_fn, key, params["background_prompt"], "A", params.get("background_image_url"), admit=False,
+        )
+        telemetry.record_cards([card])
+        record_cards([card], {"pipeline_id": state["pipeline_id"]})
+        _update(state, background=card)
+        if card.get("status") == "error":
+            return card
+    if card.get("status") in TERMINAL_STATUSES:
+        return card
+    result = await wait_for_task(provider, card["task_id"], poll_fn, key)
+    card = {**card, **result}
+    _update(state, background=card)
+    return card
+
+
+async def _run(state: dict, params: dict, keys: dict, base_url: str) -> None:
+    """
+    DAG: (avatar ‖ background) → composite.
+    Both generation branches run concurrently; the composite is submitted the moment both succeed.
+    Steps already submitted by an earlier attempt (see resume_pipelines) are awaited, not resubmitted.
+    """
+    async with tracing.Span("pipeline.run", trace_id=state.get("trace_id"), pipeline_id=state["pipeline_id"]):
+        await _run_steps(state, params, keys, base_url)
+
+
+async def _run_steps(state: dict, params: dict, keys: dict, base_url: str) -> None:
+    try:
+        avatar, background = await asyncio.gather(
+            _avatar_branch(state, params, keys),
+            _background_branch(state, params, keys),
+        )
+        for name, card in (("avatar", avatar), ("background", background)):
+            if card.get("status") != "succeeded":
+                _update(state, status="failed", error=f"{name} step {card.get('status')}: {card.get('error', '')}".strip())
+                return
+
+        _update(state, stage="compositing")
+        composite = state["composite"]
+        if _resumable(composite, "render_id"):
+            if params.get("engine") == "local":
+                # A local render dies with its worker; reuse it only if it already finished
+                composite = {**composite, **poll_local_composite(composite["render_id"], base_url)}
+                if composite.get("status") != "succeeded":
+                    composite = None
+            await _finish_composite(state, params, keys, base_url, composite)
+            return
+        args = (
+            avatar["video_url"],
+            background["video_url"],
+            params.get("hook_text") or avatar.get("hook") or "",
+            params.get("music_track_id", "hype"),
+            params.get("duration", 10.0),
+            avatar.get("spoken_script"),
+            params.get("preview", False),
+        )
+        if params.get("engine") == "local":
+            composite = submit_local_composite(*args)
+            telemetry.record_submit(composite.get("render_id"), "local-ffmpeg")
+        else:
+            composite = await circuit_breaker.run_for("shotstack", submit_composite, keys["shotstack"], *args, admit=False)
+            telemetry.record_submit(composite.get("render_id"), "shotstack")
+            record_submit(composite.get("render_id"), "shotstack", {"pipeline_id": state["pipeline_id"]})
+        _update(state, composite=composite)
+        if composite.get("status") == "error":
+            _update(state, status="failed", error=f"composite submit failed: {composite.get('error')}")
+            return
+        await _finish_composite(state, params, keys, base_url, composite)
+    except Exception as e:
+        _update(state, status="failed", error=str(e))
+
+
+async def _finish_composite(state: dict, params: dict, keys: dict, base_url: str, composite: Optional[dict]) -> None:
+    if composite is None:
+        # Resumed local render that didn't survive the restart: render again
+        _update(state, composite=None)
+        await _run_steps(state, params, keys, base_url)
+        return
+    if composite.get("status") not in TERMINAL_STATUSES:
+        if params.get("engine") == "local":
+            result = await _wait_for_local_render(composite["render_id"], base_url)
+        else:
+            result = await wait_for_task("shotstack", composite["render_id"], poll_composite, keys["shotstack"])
+        composite = {**composite, **result}
+    ok = composite.get("status") == "succeeded"
+    _update(
+        state,
+        composite=composite,
+        stage="done",
+        status="succeeded" if ok else "failed",
+        video_url=composite.get("video_url"),
+        error=None if ok else f"composite {composite.get('status')}: {composite.get('error', '')}".strip(),
+    )
+
+
+async def _wait_for_local_render(render_id: str, base_url: str) -> dict:
+    started = time.monotonic()
+    while time.monotonic() - started < STEP_TIMEOUT:
+        result = poll_local_composite(render_id, base_url)
+        if result.get("status") in TERMINAL_STATUSES:
+            telemetry.record_poll(render_id, result)
+            return result
+        await asyncio.sleep(CACHE_CHECK_INTERVAL)
+    return {"render_id": render_id, "status": "timeout", "video_url": None, "error": f"Timed out after {STEP_TIMEOUT:.0f}s"}
+
+
+# ── Resuming work after restarts ──────────────────────────────────────────────
+
+def _heartbeat() -> None:
+    """Renew this worker's leases on the pipelines, renders, resumed tasks and idempotent requests it is driving."""
+    for pipeline_id, state in list(_runs.items()):
+        if state["status"] == "running":
+            job_store.claim("pipeline", pipeline_id)
+    for render_id in local_compositor.active_renders():
+        job_store.claim("local", render_id)
+    for provider, external_id in list(_watching):
+        job_store.claim(provider, external_id)
+    for record_id in idempotency.active():
+        job_store.claim(idempotency.PROVIDER, record_id)
+
+
+def _watch(provider: str, external_id: str, coro, trace_id: Optional[str] = None) -> None:
+    async def _runner():
+        try:
+            async with tracing.Span(f"{provider}.resume", trace_id=trace_id, external_id=external_id):
+                await coro
+        except Exception:
+            pass  # left unfinished; another sweep picks it up once the lease lapses
+        finally:
+            _watching.discard((provider, external_id))
+
+    _watching.add((provider, external_id))
+    task = asyncio.create_task(_runner())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+def _owned(job: dict) -> bool:
+    """
+    Whether something server-side still waits on a task: an unfinished pipeline, or a provider
+    webhook (a delivery may have been lost). Cards only a client polls are left to that client.
+    """
+    if (job["result"] or {}).get("status") == "cancelled":
+        return False  # e.g. a hedge straggler
+    if webhooks.expects_callback(job["provider"]):
+        return True
+    pipeline_id = (job["params"] or {}).get("pipeline_id")
+    if not pipeline_id:
+        return False
+    pipeline = job_store.get("pipeline", pipeline_id)
+    return pipeline is not None and pipeline["status"] in UNFINISHED_STATUSES
+
+
+def resume_unfinished(keys: dict, base_url: str) -> None:
+    """
+    Pick up work that no live worker is driving: pipelines whose lease lapsed, provider tasks and
+    renders nobody has polled for a full lease period that still have an owner (see _owned), and
+    local renders left by a dead worker. Each job is claimed first, so exactly one worker resumes it.
+    Apify runs are left to the next identical request, which reattaches to them.
+    """
+    for job in job_store.unfinished(["pipeline"]):
+        pipeline_id = job["external_id"]
+        if pipeline_id in _runs or not job["result"] or not job_store.claim("pipeline", pipeline_id):
+            continue
+        saved = job["params"] or {}
+        _launch(job["result"], saved.get("params", {}), keys, saved.get("base_url") or base_url)
+
+    for job in job_store.unfinished(["task", "render"], idle=LEASE_SECONDS):
+        provider, external_id = job["provider"], job["external_id"]
+        if provider == "local":
+            # Renders belong to the process pool that ran them; once the owner's lease lapses, settle from disk
+            if external_id not in local_compositor.active_renders():
+                record_result(provider, external_id, poll_local_composite(external_id, base_url))
+            continue
+        if provider not in POLLERS or (provider, external_id) in _watching or not _owned(job):
+            continue
+        poll_fn, key_name = POLLERS[provider]
+        if not keys.get(key_name) or not job_store.claim(provider, external_id):
+            continue
+        trace_id = (job["params"] or {}).get("trace_id")
+        _watch(provider, external_id, wait_for_task(provider, external_id, poll_fn, keys[key_name]), trace_id)
+
+
+async def maintenance_loop(get_keys, base_url: str) -> None:
+    """Renew leases, resume orphaned work and prune old jobs. Runs for the app's lifetime."""
+    loop = asyncio.get_event_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, _heartbeat)
+            resume_unfinished(get_keys(), base_url)
+            await loop.run_in_executor(None, job_store.prune)
+            await loop.run_in_executor(None, analysis_store.prune)
+            await loop.run_in_executor(None, idempotency.prune)
+        except Exception:
+            pass
+        await asyncio.sleep(MAINTENANCE_INTERVAL)
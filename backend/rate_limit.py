@@ -0,0 +1,186 @@
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import httpx
+
+from metrics import observe_upstream
+
+# Per-provider submit limits: sustained requests/sec, burst size, max concurrent calls.
+# Override with e.g. RUNWAY_RATE=0.5, RUNWAY_BURST=2, RUNWAY_CONCURRENCY=2
+DEFAULT_LIMITS = {
+    "runway": {"rate": 1.0, "burst": 5, "concurrency": 4},
+    "fal": {"rate": 2.0, "burst": 10, "concurrency": 8},
+    "luma": {"rate": 1.0, "burst": 5, "concurrency": 4},
+    "heygen": {"rate": 1.0, "burst": 3, "concurrency": 3},
+    "shotstack": {"rate": 1.0, "burst": 5, "concurrency": 4},
+}
+
+MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "4"))
+BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "1.0"))  # seconds
+BACKOFF_CAP = float(os.getenv("UPSTREAM_BACKOFF_CAP", "30.0"))
+
+# 429 means the request was rejected before any work happened, so it is always safe to retry.
+# For 5xx only gateway-style errors are retried — a 500 on a submit may already have created a job.
+RETRYABLE_STATUS = (429, 502, 503, 504)
+
+# Seconds the current thread has spent queued in a limiter or sleeping between retries; the circuit breaker
+# subtracts it so throttling alone never makes a call look slow
+_waits = threading.local()
+
+
+def waited() -> float:
+    return getattr(_waits, "seconds", 0.0)
+
+
+def _add_wait(seconds: float) -> None:
+    _waits.seconds = waited() + seconds
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    """Find an HTTP status on an SDK exception (runwayml/lumaai .status_code, httpx .response, fal __cause__)."""
+    while exc is not None:
+        code = getattr(exc, "status_code", None)
+        if isinstance(code, int):
+            return code
+        response = getattr(exc, "response", None)
+        if isinstance(response, httpx.Response):
+            return response.status_code
+        exc = exc.__cause__
+    return None
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    while exc is not None:
+        response = getattr(exc, "response", None)
+        if isinstance(response, httpx.Response):
+            try:
+                return float(response.headers.get("retry-after"))
+            except (TypeError, ValueError):
+                return None
+        exc = exc.__cause__
+    return None
+
+
+def raise_for_retryable(resp: httpx.Response) -> None:
+    """For clients that inspect error bodies themselves: raise only on throttling/gateway errors."""
+    if resp.status_code in RETRYABLE_STATUS:
+        resp.raise_for_status()
+
+
+class ProviderLimiter:
+    """
+    Token bucket + concurrency cap for one upstream.
+    Callers block in acquire() until both a token and a concurrency slot are free;
+    waiting callers are the provider's queue depth.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, concurrency: int):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+        self._retrying = 0
+        self._throttled = 0
+        self._completed = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @contextmanager
+    def slot(self):
+        queued_at = time.monotonic()
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    self._refill()
+                    if self._tokens >= 1 and self._in_flight < self.concurrency:
+                        break
+                    # Sleep until the next token is due, or a slot is released
+                    wait = (1 - self._tokens) / self.rate if self._tokens < 1 else None
+                    self._cond.wait(timeout=wait)
+            finally:
+                self._waiting -= 1
+            self._tokens -= 1
+            self._in_flight += 1
+        _add_wait(time.monotonic() - queued_at)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._completed += 1
+                self._cond.notify()
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn under the limiter, retrying 429/gateway errors with full-jitter exponential backoff."""
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                with self.slot(), observe_upstream(self.name, "submit"):
+                    return fn(*args, **kwargs)
+            except Exception as e:
+                if _status_code(e) not in RETRYABLE_STATUS or attempt == MAX_RETRIES:
+                    raise
+                retry_after = _retry_after(e)
+                if retry_after is not None:
+                    # Honor the upstream's hint, but never sleep past the cap while holding a worker
+                    delay = min(BACKOFF_CAP, max(0.0, retry_after))
+                else:
+                    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            with self._cond:
+                self._throttled += 1
+                self._retrying += 1
+            try:
+                time.sleep(delay)
+            finally:
+                _add_wait(delay)
+                with self._cond:
+                    self._retrying -= 1
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            self._refill()
+            return {
+                "rate_per_sec": self.rate,
+                "burst": self.burst,
+                "concurrency": self.concurrency,
+                "in_flight": self._in_flight,
+                "queued": self._waiting,
+                "retrying": self._retrying,
+                "throttled_total": self._throttled,
+                "completed_total": self._completed,
+                "tokens_available": round(self._tokens, 2),
+            }
+
+
+def _build_limiter(name: str, defaults: dict) -> ProviderLimiter:
+    prefix = name.upper()
+    return ProviderLimiter(
+        name,
+        rate=float(os.getenv(f"{prefix}_RATE", defaults["rate"])),
+        burst=int(os.getenv(f"{prefix}_BURST", defaults["burst"])),
+        concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", defaults["concurrency"])),
+    )
+
+
+limiters = {name: _build_limiter(name, defaults) for name, defaults in DEFAULT_LIMITS.items()}
+
+
+def limited_call(provider: str, fn, *args, **kwargs):
+    """Call fn through the named provider's limiter and retry queue."""
+    return limiters[provider].call(fn, *args, **kwargs)
+
+
+def queue_stats() -> dict:
+    return {name: limiter.snapshot() for name, limiter in limiters.items()}
@@ -1,6 +1,11 @@
+import os
 import httpx
+import http_clients
+from webhooks import callback_url
+from rate_limit import limited_call, raise_for_retryable
+from tracing import traced
 
-SHOTSTACK_BASE = "https://api.shotstack.io/edit/stage"  # sandbox tier
+SHOTSTACK_BASE = os.getenv("SHOTSTACK_BASE_URL", "https://api.shotstack.io/edit/stage")  # sandbox tier
 
 MUSIC_TRACKS = {
     "hype": {
@@ -31,11 +36,11 @@ def get_music_tracks():
     return [{"id": k, "name": v["name"]} for k, v in MUSIC_TRACKS.items()]
 
 
-def _build_caption_clips(script: str, duration: float, words_per_chunk: int = 4) -> list:
+def caption_chunks(script: str, duration: float, words_per_chunk: int = 4) -> list:
     """
-    Split the spoken script into evenly-timed subtitle caption clips.
-    Each chunk of ~words_per_chunk words gets an equal slice of the total duration,
-    with fade-in / fade-out transitions between chunks.
+    Split the spoken script into evenly-timed subtitle chunks.
+    Each chunk of ~words_per_chunk words gets an equal slice of the total duration.
+    Returns [(text, start, length), ...]
     """
     words = script.strip().split()
     if not words:
@@ -45,8 +50,16 @@ def _build_caption_clips(script: str, duration: float, words_per_chunk: int = 4)
         for i in range(0, len(words), words_per_chunk)
     ]
     chunk_dur = round(duration / len(chunks), 2)
+    return [(chunk, round(idx * chunk_dur, 2), chunk_dur) for idx, chunk in enumerate(chunks)]
+
+
+def _build_caption_clips(script: str, duration: float, words_per_chunk: int = 4) -> list:
+    """
+    Build Shotstack subtitle caption clips from caption_chunks(),
+    with fade-in / fade-out transitions between chunks.
+    """
     clips = []
-    for idx, chunk in enumerate(chunks):
+    for chunk, start, length in caption_chunks(script, duration, words_per_chunk):
         clips.append({
             "asset": {
                 "type": "html",
@@ -63,8 +76,8 @@ def _build_caption_clips(script: str, duration: float, words_per_chunk: int = 4)
                 "height": 130,
                 "background": "transparent",
             },
-            "start": round(idx * chunk_dur, 2),
-            "length": chunk_dur,
+            "start": start,
+            "length": length,
             "position": "bottom",
             "offset": {"x": 0, "y": 0.08},
             "transition": {"in": "fade", "out": "fade"},
@@ -72,6 +85,7 @@ def _build_caption_clips(script: str, duration: float, words_per_chunk: int = 4)
     return clips
 
 
+@traced()
 def submit_composite(
     api_key: str,
     heygen_video_url: str,
@@ -80,6 +94,7 @@ def submit_composite(
     music_track_id: str = "hype",
     duration: float = 10.0,
     spoken_script: str = None,
+    preview: bool = False,
 ) -> dict:
     """
     Submit a Shotstack render job to composite:
@@ -87,7 +102,7 @@ def submit_composite(
       - HeyGen avatar video (chroma-keyed green screen, full audio)
       - Hook text caption (bottom third, first 3.5 seconds, fades out)
       - Background music (low volume, full duration)
-    Output: 720x1280 (9:16) MP4
+    Output: 720x1280 (9:16) MP4, or a low-res 15fps proxy when preview=True
     """
     music_url = MUSIC_TRACKS.get(music_track_id, MUSIC_TRACKS["hype"])["url"]
 
@@ -189,6 +204,9 @@ def submit_composite(
         "size": {"width": 720, "height": 1280},
         "fps": 25,
     }
+    if preview:
+        # Shotstack's preview resolution renders in a fraction of the time; size must be dropped
+        output = {"format": "mp4", "resolution": "preview", "aspectRatio": "9:16", "fps": 15}
 
     headers = {
         "x-api-key": api_key,
@@ -196,27 +214,39 @@ def submit_composite(
         "Accept": "application/json",
     }
 
+    body = {"timeline": timeline, "output": output}
+    webhook_url = callback_url("shotstack", "shotstack")
+    if webhook_url:
+        body["callback"] = webhook_url
+
+    def _post() -> httpx.Response:
+        resp = http_clients.client("shotstack").post(
+            f"{SHOTSTACK_BASE}/render",
+            headers=headers,
+            json=body,
+        )
+        raise_for_retryable(resp)
+        return resp
+
     try:
-        with httpx.Client(timeout=30) as client:
-            resp = client.post(
-                f"{SHOTSTACK_BASE}/render",
-                headers=headers,
-                json={"timeline": timeline, "output": output},
-            )
-            # Capture body before raise so we see Shotstack's error detail
-            if not resp.is_success:
-                try:
-                    detail = resp.json()
-                except Exception:
-                    detail = resp.text
-                return {
-                    "render_id": None,
-                    "status": "error",
-                    "video_url": None,
-                    "error": f"Shotstack {resp.status_code}: {detail}",
-                }
-            data = resp.json()
-            render_id = data.get("response", {}).get("id")
+        try:
+            resp = limited_call("shotstack", _post)
+        except httpx.HTTPStatusError as e:
+            resp = e.response  # retries exhausted — report Shotstack's error below
+        # Capture body before raise so we see Shotstack's error detail
+        if not resp.is_success:
+            try:
+                detail = resp.json()
+            except Exception:
+                detail = resp.text
+            return {
+                "render_id": None,
+                "status": "error",
+                "video_url": None,
+                "error": f"Shotstack {resp.status_code}: {detail}",
+            }
+        data = resp.json()
+        render_id = data.get("response", {}).get("id")
 
         return {"render_id": render_id, "status": "pending", "video_url": None}
 
@@ -235,13 +265,12 @@ def poll_composite(api_key: str, render_id: str) -> dict:
     }
 
     try:
-        with httpx.Client(timeout=30) as client:
-            resp = client.get(
-                f"{SHOTSTACK_BASE}/render/{render_id}",
-                headers=headers,
-            )
-            resp.raise_for_status()
-            data = resp.json().get("response", {})
+        resp = http_clients.client("shotstack").get(
+            f"{SHOTSTACK_BASE}/render/{render_id}",
+            headers=headers,
+        )
+        resp.raise_for_status()
+        data = resp.json().get("response", {})
 
         status = data.get("status", "queued")
 
@@ -261,6 +290,7 @@ def poll_composite(api_key: str, render_id: str) -> dict:
                 "status": "pending",
                 "video_url": None,
                 "shotstack_status": status,
+                "running": status in ("rendering", "saving"),
             }
 
     except Exception as e:
@@ -0,0 +1,170 @@
+import builtins
+import importlib
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+# Cold-start accounting and deferred SDK imports.
+# With PROFILE_IMPORTS=1, profile_imports() (first thing in main.py) times each module's first import until
+# mark_ready() (app startup); GET /diagnostics/startup reports where the time went. The provider SDKs are only
+# imported when first used, so a worker that serves status polls for one provider never loads the others.
+PROFILE_IMPORTS = os.getenv("PROFILE_IMPORTS", "") == "1"
+
+# provider -> SDK module, loaded on first attribute access via sdk(provider)
+SDKS = {
+    "anthropic": "anthropic",
+    "runway": "runwayml",
+    "luma": "lumaai",
+    "fal": "fal_client",
+}
+# Providers to import in the background once the app is up, e.g. "anthropic,fal" on workers that submit work
+PRELOAD = [p.strip() for p in os.getenv("SDK_PRELOAD", "").split(",") if p.strip() in SDKS]
+
+_original_import = builtins.__import__
+_thread: Optional[int] = None
+_stack: list = []  # time spent in nested first-imports, per open import
+_imports: dict = {}  # module -> (cumulative seconds, self seconds)
+_profile_started: Optional[float] = None
+_process_age_at_profile: Optional[float] = None
+_ready: Optional[float] = None
+_process_age_at_ready: Optional[float] = None
+_sdk_loads: dict = {}  # provider -> seconds its import took
+_sdk_lock = threading.Lock()
+
+
+def _process_age() -> Optional[float]:
+    """Seconds since this process was exec'd, from /proc (Linux only)."""
+    try:
+        with open("/proc/self/stat") as f:
+            started_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - started_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name in sys.modules or threading.get_ident() != _thread:
+        return _original_import(name, globals, locals, fromlist, level)
+    _stack.append(0.0)
+    started = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - started
+        nested = _stack.pop()
+        if _stack:
+            _stack[-1] += elapsed
+        if name in sys.modules and name not in _imports:
+            _imports[name] = (elapsed, elapsed - nested)
+
+
+def profile_imports(force: bool = False) -> None:
+    """Start timing first imports on this thread if PROFILE_IMPORTS is set (or force); mark_ready() stops."""
+    global _thread, _profile_started, _process_age_at_profile
+    if _thread is not None or not (PROFILE_IMPORTS or force):
+        return
+    _thread = threading.get_ident()
+    _profile_started = time.perf_counter()
+    _process_age_at_profile = _process_age()
+    builtins.__import__ = _timed_import
+
+
+def mark_ready() -> None:
+    """The app is about to serve requests: stop import timing."""
+    global _ready, _process_age_at_ready
+    try:
+        if _ready is None:
+            _ready = time.perf_counter()
+            _process_age_at_ready = _process_age()
+    finally:
+        if builtins.__import__ is _timed_import:
+            builtins.__import__ = _original_import
+
+
+class _LazySDK:
+    """Stands in for an SDK module; the real import happens on first attribute access."""
+
+    def __init__(self, provider: str):
+        self._provider = provider
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            with _sdk_lock:
+                if self._module is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(SDKS[self._provider])
+                    _sdk_loads[self._provider] = time.perf_counter() - started
+                    self._module = module
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy SDK {SDKS[self._provider]} ({state})>"
+
+
+_lazy: dict = {}
+
+
+def sdk(provider: str) -> _LazySDK:
+    """The SDK module for a provider in SDKS, imported on first use."""
+    if provider not in _lazy:
+        _lazy[provider] = _LazySDK(provider)
+    return _lazy[provider]
+
+
+def preload(providers: list = None) -> None:
+    """Import SDKs ahead of their first use (blocking; run it off the event loop)."""
+    for provider in PRELOAD if providers is None else providers:
+        getattr(sdk(provider), "__name__")
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def report(top: int = 20) -> dict:
+    """Cold start breakdown: interpreter, imports by top-level package, app setup, and SDK loads."""
+    packages: dict = {}
+    for name, (_, own) in _imports.items():
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + own
+    imports = sum(own for _, own in _imports.values())
+    ready = _ready if _ready is not None else time.perf_counter()
+    profiled = _profile_started is not None
+    return {
+        "ready": _ready is not None,
+        "imports_profiled": profiled,  # set PROFILE_IMPORTS=1 for the import breakdown
+        "process_to_ready_ms": _ms(_process_age_at_ready),
+        "interpreter_ms": _ms(_process_age_at_profile),
+        "main_to_ready_ms": _ms(ready - _profile_started) if profiled else None,
+        "imports_ms": _ms(imports) if profiled else None,
+        "modules_imported": len(_imports) if profiled else None,
+        "packages": [
+            {"package": p, "ms": _ms(s)} for p, s in sorted(packages.items(), key=lambda kv: -kv[1])[:top]
+        ],
+        "sdks": {
+            provider: {"module": module, "loaded": provider in _sdk_loads, "import_ms": _ms(_sdk_loads.get(provider))}
+            for provider, module in SDKS.items()
+        },
+    }
+
+
+if __name__ == "__main__":
+    # Cold import of the API, as a fresh worker does it (through the `startup` module main.py uses)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import startup
+
+    startup.profile_imports(force=True)
+    import main  # noqa: F401
+
+    startup.mark_ready()
+    r = startup.report()
+    print(f"process start -> ready  {r['process_to_ready_ms']} ms  (interpreter {r['interpreter_ms']} ms)")
+    print(f"main import             {r['main_to_ready_ms']} ms  ({r['modules_imported']} modules)")
+    for row in r["packages"]:
+        print(f"  {row['package']:<28} {row['ms']:>8} ms")
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from job_store import job_store, record_result, TERMINAL_STATUSES
+from metrics import cache_lookup
+
+# Terminal results (TERMINAL_STATUSES) never change again,
+# so they can be served locally instead of re-polling the provider.
+MAX_ENTRIES = int(os.getenv("TASK_CACHE_MAX_ENTRIES", "5000"))
+
+
+class TerminalTaskCache:
+    """
+    Bounded in-memory LRU of terminal task results keyed by (provider, task_id).
+    Entries are written through to the shared job store, which keeps them across restarts
+    and serves a result seen by one worker to all of them; misses are filled from it.
+    """
+
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(provider: str, task_id: str) -> str:
+        return f"{provider}:{task_id}"
+
+    def _peek(self, key: str) -> Optional[dict]:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                return None
+            self._entries.move_to_end(key)
+        cache_lookup("task_results", True)
+        return dict(result)
+
+    def get(self, provider: str, task_id: str) -> Optional[dict]:
+        """Blocking on a miss (reads the job store): from coroutines use aget()."""
+        key = self._key(provider, task_id)
+        result = self._peek(key)
+        return result if result is not None else self._fill(provider, task_id)
+
+    async def aget(self, provider: str, task_id: str) -> Optional[dict]:
+        """get() for the event loop: only a miss in memory goes to the job store, on a thread."""
+        result = self._peek(self._key(provider, task_id))
+        if result is not None:
+            return result
+        return await asyncio.get_running_loop().run_in_executor(None, self._fill, provider, task_id)
+
+    def _fill(self, provider: str, task_id: str) -> Optional[dict]:
+        key = self._key(provider, task_id)
+        job = job_store.get(provider, task_id)
+        if job is None or job["status"] not in TERMINAL_STATUSES or not job["result"]:
+            cache_lookup("task_results", False)
+            return None
+        cache_lookup("task_results", True)
+        self._store(key, job["result"])
+        return dict(job["result"])
+
+    def put(self, provider: str, task_id: str, result: dict) -> bool:
+        """Store result if it is terminal. Returns True when the entry was stored."""
+        if not task_id or result.get("status") not in TERMINAL_STATUSES:
+            return False
+        self._store(self._key(provider, task_id), result)
+        record_result(provider, task_id, result)
+        return True
+
+    def _store(self, key: str, result: dict) -> None:
+        with self._lock:
+            self._entries[key] = dict(result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+task_cache = TerminalTaskCache(MAX_ENTRIES)
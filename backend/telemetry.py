@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from typing import Iterable, Optional
+
+from job_store import TERMINAL_STATUSES
+
+WINDOW = int(os.getenv("TELEMETRY_WINDOW", "200"))  # completed jobs kept per model
+MAX_IN_FLIGHT = 10000
+
+# Routing only trusts a model once it has this many completions in the window
+MIN_SAMPLES = int(os.getenv("ROUTING_MIN_SAMPLES", "3"))
+MIN_SUCCESS_RATE = float(os.getenv("ROUTING_MIN_SUCCESS_RATE", "0.7"))
+
+_lock = threading.Lock()
+# task_id -> {"model", "submitted_at", "running_at"}
+_in_flight: "OrderedDict[str, dict]" = OrderedDict()
+# model -> deque of {"ok", "total", "queued"}
+_completed = defaultdict(lambda: deque(maxlen=WINDOW))
+
+
+def record_submit(task_id: Optional[str], model: str) -> None:
+    """Start the clock for a submitted job. Submits that errored (no task_id) count as failures."""
+    now = time.time()
+    with _lock:
+        if not task_id:
+            _completed[model].append({"ok": False, "total": None, "queued": None})
+            return
+        _in_flight[task_id] = {"model": model, "submitted_at": now, "running_at": None}
+        while len(_in_flight) > MAX_IN_FLIGHT:
+            _in_flight.popitem(last=False)
+
+
+def record_poll(task_id: str, result: dict) -> None:
+    """Update timestamps from a poll or webhook result. Unknown task IDs are ignored."""
+    now = time.time()
+    status = result.get("status")
+    with _lock:
+        job = _in_flight.get(task_id)
+        if job is None:
+            return
+        if job["running_at"] is None and (result.get("running") or status in TERMINAL_STATUSES):
+            job["running_at"] = now
+        if status not in TERMINAL_STATUSES:
+            return
+        del _in_flight[task_id]
+        _completed[job["model"]].append({
+            "ok": status == "succeeded",
+            "total": now - job["submitted_at"],
+            "queued": job["running_at"] - job["submitted_at"],
+        })
+
+
+def _percentile(values: list, pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return round(values[idx], 2)
+
+
+def _stats(model: str) -> dict:
+    samples = list(_completed.get(model, ()))
+    durations = [s["total"] for s in samples if s["ok"] and s["total"] is not None]
+    queued = [s["queued"] for s in samples if s["queued"] is not None]
+    return {
+        "samples": len(samples),
+        "success_rate": round(sum(s["ok"] for s in samples) / len(samples), 3) if samples else None,
+        "p50_seconds": _percentile(durations, 50),
+        "p95_seconds": _percentile(durations, 95),
+        "queue_p50_seconds": _percentile(queued, 50),
+        "in_flight": sum(1 for job in _in_flight.values() if job["model"] == model),
+    }
+
+
+def model_stats() -> dict:
+    """Rolling submit→completion p50/p95 and success rate per model."""
+    with _lock:
+        models = set(_completed) | {job["model"] for job in _in_flight.values()}
+        return {model: _stats(model) for model in sorted(models)}
+
+
+def pick_fastest(candidates: dict, default: str) -> str:
+    """
+    candidates: routing key -> model name, e.g. {"kling": "kling-2.6-pro", "runway": "gen4.5"}
+    Returns the key whose model has the lowest p50 among healthy models with enough samples,
+    or default when no model qualifies yet.
+    """
+    with _lock:
+        stats = {key: _stats(model) for key, model in candidates.items()}
+    healthy = [
+        (s["p50_seconds"], key)
+        for key, s in stats.items()
+        if s["samples"] >= MIN_SAMPLES
+        and (s["success_rate"] or 0) >= MIN_SUCCESS_RATE
+        and s["p50_seconds"] is not None
+    ]
+    return min(healthy)[1] if healthy else default
+
+
+def record_cards(cards: Iterable[dict]) -> None:
+    for card in cards:
+        record_submit(card.get("task_id"), card.get("model", "unknown"))
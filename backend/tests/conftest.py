@@ -0,0 +1,24 @@
+import argparse
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark  # noqa: E402
+
+# Point every provider at an unreachable fake and keep all local state in a throwaway directory,
+# before main (and the modules reading these at import) is imported.
+benchmark.configure_api("http://127.0.0.1:9", tempfile.mkdtemp(prefix="api-tests-"), argparse.Namespace(trace=False, poll_interval=0.2))
+os.environ["WEBHOOK_SECRET"] = "test-secret"
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    return TestClient(main.app)
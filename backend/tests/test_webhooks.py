@@ -0,0 +1,93 @@
+import uuid
+
+import pytest
+
+import fake_upstreams
+from task_cache import task_cache
+
+TOKEN = "test-secret"
+
+SOURCES = [
+    # (source, provider, payload builder, id field in the stored result)
+    ("fal", "kling", fake_upstreams.fal_callback_payload, "task_id"),
+    ("heygen", "heygen", fake_upstreams.heygen_callback_payload, "task_id"),
+    ("shotstack", "shotstack", fake_upstreams.shotstack_callback_payload, "render_id"),
+]
+
+# A non-terminal delivery in each source's format
+PROGRESS = {
+    "fal": lambda job_id: {"request_id": job_id, "status": "IN_PROGRESS"},
+    "heygen": lambda job_id: {"event_type": "avatar_video.processing", "event_data": {"video_id": job_id}},
+    "shotstack": lambda job_id: {"type": "edit", "action": "render", "id": job_id, "status": "rendering"},
+}
+
+
+def deliver(client, source, provider, payload, token=TOKEN):
+    return client.post(f"/webhooks/{source}/{provider}", params={"token": token} if token else {}, json=payload)
+
+
+@pytest.mark.parametrize("source, provider, payload, id_field", SOURCES)
+def test_terminal_delivery_is_stored(client, source, provider, payload, id_field):
+    job_id = uuid.uuid4().hex
+    resp = deliver(client, source, provider, payload(job_id, video_url="https://cdn.test/out.mp4"))
+    assert resp.status_code == 200
+    assert resp.json() == {"task_id": job_id, "accepted": True, "duplicate": False}
+    stored = task_cache.get(provider, job_id)
+    assert stored["status"] == "succeeded"
+    assert stored["video_url"] == "https://cdn.test/out.mp4"
+    assert stored[id_field] == job_id
+
+
+@pytest.mark.parametrize("source, provider, payload, id_field", SOURCES)
+@pytest.mark.parametrize("token", [None, "wrong-secret"])
+def test_bad_token_is_rejected(client, source, provider, payload, id_field, token):
+    job_id = uuid.uuid4().hex
+    resp = deliver(client, source, provider, payload(job_id), token=token)
+    assert resp.status_code == 401
+    assert task_cache.get(provider, job_id) is None
+
+
+@pytest.mark.parametrize("source, provider, payload, id_field", SOURCES)
+def test_repeated_delivery_is_a_duplicate(client, source, provider, payload, id_field):
+    job_id = uuid.uuid4().hex
+    assert deliver(client, source, provider, payload(job_id)).json()["accepted"] is True
+    resp = deliver(client, source, provider, payload(job_id))
+    assert resp.status_code == 200
+    assert resp.json() == {"task_id": job_id, "accepted": False, "duplicate": True}
+
+
+@pytest.mark.parametrize("source, provider, payload, id_field", SOURCES)
+def test_first_terminal_delivery_wins(client, source, provider, payload, id_field):
+    job_id = uuid.uuid4().hex
+    deliver(client, source, provider, payload(job_id, ok=False))
+    resp = deliver(client, source, provider, payload(job_id, ok=True))
+    assert resp.json()["duplicate"] is True
+    assert task_cache.get(provider, job_id)["status"] == "failed"
+
+
+@pytest.mark.parametrize("source, provider, payload, id_field", SOURCES)
+def test_late_progress_after_terminal_is_dropped(client, source, provider, payload, id_field):
+    job_id = uuid.uuid4().hex
+    deliver(client, source, provider, payload(job_id))
+    resp = deliver(client, source, provider, PROGRESS[source](job_id))
+    assert resp.status_code == 200
+    assert resp.json() == {"task_id": job_id, "accepted": False, "duplicate": True}
+    assert task_cache.get(provider, job_id)["status"] == "succeeded"
+
+
+@pytest.mark.parametrize("source, provider, payload, id_field", SOURCES)
+def test_progress_before_terminal_is_not_stored(client, source, provider, payload, id_field):
+    job_id = uuid.uuid4().hex
+    resp = deliver(client, source, provider, PROGRESS[source](job_id))
+    assert resp.json() == {"task_id": job_id, "accepted": False, "duplicate": False}
+    assert task_cache.get(provider, job_id) is None
+    assert deliver(client, source, provider, payload(job_id)).json()["accepted"] is True
+
+
+def test_unknown_source_or_provider(client):
+    assert deliver(client, "fal", "heygen", fake_upstreams.fal_callback_payload("x")).status_code == 404
+    assert deliver(client, "runway", "runway", {"id": "x"}).status_code == 404
+
+
+def test_payload_without_task_id(client):
+    assert deliver(client, "shotstack", "shotstack", {"status": "done"}).status_code == 400
@@ -1,11 +1,19 @@
-import httpx
 import asyncio
+import os
 from typing import List
 
-APIFY_BASE_URL = "https://api.apify.com/v2"
+import http_clients
+from job_store import job_store, input_hash
+from metrics import cache_lookup, observe_upstream
+from tracing import traced
+
+APIFY_BASE_URL = os.getenv("APIFY_BASE_URL", "https://api.apify.com/v2")
+POLL_INTERVAL = float(os.getenv("APIFY_POLL_INTERVAL", "5"))  # seconds between run status checks
 TIKTOK_ACTOR_ID = "clockworks~tiktok-scraper"
+REATTACH_SECONDS = float(os.getenv("APIFY_REATTACH_SECONDS", "900"))
 
 
+@traced()
 async def run_tiktok_scraper(
     api_token: str,
     hashtags: List[str],
@@ -47,23 +55,38 @@ async def _start_tiktok_run(
         "proxyConfiguration": {"useApifyProxy": True},
     }
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        resp = await client.post(
+    # Reattach to a run of the same input that is still going (or just finished),
+    # e.g. one started by a worker that restarted before it could return the results.
+    digest = input_hash(TIKTOK_ACTOR_ID, input_payload)
+    existing = job_store.find_by_input("apify_run", digest, REATTACH_SECONDS)
+    cache_lookup("apify_reattach", existing is not None)
+    if existing is not None:
+        return existing["external_id"]
+
+    async with observe_upstream("apify", "start"):
+        resp = await http_clients.async_client("apify").post(
             f"{APIFY_BASE_URL}/acts/{TIKTOK_ACTOR_ID}/runs",
             params={"token": api_token},
             json=input_payload,
         )
         resp.raise_for_status()
-        return resp.json()["data"]["id"]
+        run_id = resp.json()["data"]["id"]
+    job_store.upsert("apify_run", "apify", run_id, "running", params={"actor": TIKTOK_ACTOR_ID}, input_hash=digest)
+    return run_id
 
 
+@traced()
 async def _poll_until_finished(
-    api_token: str, run_id: str, poll_interval: int = 5, max_wait: int = 300
+    api_token: str, run_id: str, poll_interval: float = POLL_INTERVAL, max_wait: int = 300
 ) -> str:
+    job = job_store.get("apify", run_id)
+    if job is not None and job["status"] == "succeeded" and job["result"]:
+        return job["result"]["dataset_id"]
+
     elapsed = 0
     while elapsed < max_wait:
-        async with httpx.AsyncClient(timeout=30) as client:
-            resp = await client.get(
+        async with observe_upstream("apify", "poll"):
+            resp = await http_clients.async_client("apify").get(
                 f"{APIFY_BASE_URL}/actor-runs/{run_id}",
                 params={"token": api_token},
             )
@@ -72,9 +95,12 @@ async def _poll_until_finished(
             status = run_data["status"]
 
         if status == "SUCCEEDED":
+            job_store.update("apify", run_id, "succeeded", {"dataset_id": run_data["defaultDatasetId"]})
             return run_data["defaultDatasetId"]
         elif status in ("FAILED", "ABORTED", "TIMED-OUT"):
+            job_store.update("apify", run_id, "failed", {"apify_status": status})
             raise RuntimeError(f"Apify TikTok run ended with status: {status}")
+        job_store.update("apify", run_id, "running")
 
         await asyncio.sleep(poll_interval)
         elapsed += poll_interval
@@ -83,10 +109,11 @@ async def _poll_until_finished(
 
 
 async def _fetch_dataset(api_token: str, dataset_id: str) -> List[dict]:
-    async with httpx.AsyncClient(timeout=60) as client:
-        resp = await client.get(
+    async with observe_upstream("apify", "fetch"):
+        resp = await http_clients.async_client("apify").get(
             f"{APIFY_BASE_URL}/datasets/{dataset_id}/items",
             params={"token": api_token, "format": "json", "clean": "true"},
+            timeout=60,
         )
         resp.raise_for_status()
         return resp.json()
@@ -0,0 +1,317 @@
+import asyncio
+import atexit
+import inspect
+import json
+import os
+import queue
+import re
+import secrets
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+from typing import List, Optional
+
+# In-process spans for following one trend → video run across scrape, analyze, generate and composite.
+# Export is opt-in: with TRACE_EXPORT_PATH set (e.g. .cache/traces.jsonl), finished spans are appended
+# to that JSONL file (one span per line, OTLP field names) by a background thread, so tracing works
+# offline; GET /traces/{trace_id} or `python tracing.py <trace_id>` shows a waterfall.
+EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(20 * 1024 ** 2)))  # rotated to <path>.1 beyond this
+MAX_PENDING = 10000  # spans queued for the writer; more are dropped rather than blocking requests
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "trend-analyzer-api")
+
+TRACE_HEADER = "X-Trace-Id"
+_TRACE_ID = re.compile(r"^[0-9a-f]{32}$")
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+_current: ContextVar[Optional["Span"]] = ContextVar("trace_span", default=None)
+_export_lock = threading.Lock()
+_fd: Optional[int] = None
+_pending: "queue.Queue" = queue.Queue(MAX_PENDING)  # encoded lines, or an Event to set once written
+_writer: Optional[threading.Thread] = None
+
+
+def new_trace_id() -> str:
+    return secrets.token_hex(16)
+
+
+def valid_trace_id(value) -> bool:
+    return isinstance(value, str) and bool(_TRACE_ID.match(value))
+
+
+def parse_headers(headers) -> tuple:
+    """(trace_id, parent_span_id) from a W3C traceparent or X-Trace-Id header; (None, None) if absent."""
+    match = _TRACEPARENT.match((headers.get("traceparent") or "").strip().lower())
+    if match:
+        return match.group(1), match.group(2)
+    trace_id = (headers.get(TRACE_HEADER) or "").strip().lower()
+    return (trace_id, None) if valid_trace_id(trace_id) else (None, None)
+
+
+class Span:
+    """
+    A timed operation, used with `with` or `async with`. Spans opened inside it become its children.
+    Given a trace_id it joins that trace (as a root unless the current span is already in it);
+    otherwise it continues the current trace or starts a new one.
+    """
+
+    def __init__(self, name: str, trace_id: str = None, parent_id: str = None, **attributes):
+        self.name = name
+        self.trace_id = trace_id if valid_trace_id(trace_id) else None
+        self.parent_id = parent_id
+        self.span_id = secrets.token_hex(8)
+        self.attributes = attributes
+        self.status = "ok"
+        self.start = self.end = None
+        self.fresh = False  # started a new trace rather than continuing one (see join)
+        self._token = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        parent = _current.get()
+        if parent is not None and self.trace_id in (None, parent.trace_id):
+            self.trace_id, self.parent_id = parent.trace_id, parent.span_id
+        elif self.trace_id is None:
+            self.trace_id, self.fresh = new_trace_id(), True
+        self.start = time.time()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.time()
+        if exc_type is not None:
+            self.status = "cancelled" if issubclass(exc_type, asyncio.CancelledError) else "error"
+            self.attributes["error"] = f"{exc_type.__name__}: {exc}"[:300]
+        _current.reset(self._token)
+        _export(self)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+    def to_dict(self) -> dict:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "service": SERVICE_NAME,
+            "startTimeUnixNano": int(self.start * 1e9),
+            "endTimeUnixNano": int(self.end * 1e9),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+def traced(name: str = None):
+    """Decorator: run every call of a sync or async function inside a span (default name module.function)."""
+    def decorate(fn):
+        span_name = name or f"{fn.__module__}.{fn.__name__}"
+        if inspect.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                async with Span(span_name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with Span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current.get()
+    return span.trace_id if span is not None else None
+
+
+def joinable() -> bool:
+    """True while the current span is a request root that started its own trace and can still join another."""
+    span = _current.get()
+    return span is not None and span.fresh
+
+
+def join(trace_id: Optional[str]) -> None:
+    """
+    Move the current request's root span into an existing trace, e.g. the one an /analyze call started.
+    Call it before opening child spans; a no-op if the request already arrived with a trace.
+    """
+    span = _current.get()
+    if span is not None and span.fresh and valid_trace_id(trace_id):
+        span.trace_id, span.fresh = trace_id, False
+
+
+def _export(span: Span) -> None:
+    global _writer
+    if not EXPORT_PATH:
+        return
+    if _writer is None:
+        with _export_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_write_loop, name="trace-export", daemon=True)
+                _writer.start()
+    try:
+        _pending.put_nowait((json.dumps(span.to_dict(), default=str) + "\n").encode())
+    except queue.Full:
+        pass  # tracing must never slow down or fail the traced call
+
+
+def _write_loop() -> None:
+    while True:
+        item = _pending.get()
+        if isinstance(item, threading.Event):
+            item.set()
+            continue
+        _write(item)
+
+
+def _write(line: bytes) -> None:
+    global _fd
+    try:
+        if _fd is not None and _needs_reopen():
+            os.close(_fd)
+            _fd = None
+        if _fd is None:
+            Path(EXPORT_PATH).parent.mkdir(parents=True, exist_ok=True)
+            _fd = os.open(EXPORT_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        # One write per line with O_APPEND, so several workers can share the file
+        os.write(_fd, line)
+    except OSError:
+        pass
+
+
+@atexit.register
+def flush(timeout: float = 2.0) -> None:
+    """Wait (up to timeout) until every span finished so far is written."""
+    if _writer is None:
+        return
+    written = threading.Event()
+    try:
+        _pending.put(written, timeout=timeout)
+    except queue.Full:
+        return
+    written.wait(timeout)
+
+
+def _needs_reopen() -> bool:
+    """Rotate the file once it outgrows MAX_BYTES; reopen if another worker already rotated it."""
+    st = os.fstat(_fd)
+    try:
+        if os.stat(EXPORT_PATH).st_ino != st.st_ino:
+            return True
+    except FileNotFoundError:
+        return True
+    if st.st_size > MAX_BYTES:
+        os.replace(EXPORT_PATH, f"{EXPORT_PATH}.1")
+        return True
+    return False
+
+
+def load_trace(trace_id: str) -> List[dict]:
+    """All exported spans of a trace, oldest first."""
+    flush()
+    spans = []
+    for path in (f"{EXPORT_PATH}.1", EXPORT_PATH):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if trace_id in line:
+                        try:
+                            span = json.loads(line)
+                        except ValueError:
+                            continue
+                        if span.get("traceId") == trace_id:
+                            spans.append(span)
+        except OSError:
+            continue
+    return sorted(spans, key=lambda s: s["startTimeUnixNano"])
+
+
+def latest_trace_id() -> Optional[str]:
+    """Trace of the most recently finished span, skipping lookups of /traces itself."""
+    flush()
+    try:
+        with open(EXPORT_PATH, "rb") as f:
+            f.seek(max(0, os.fstat(f.fileno()).st_size - 65536))
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    for line in reversed(lines):
+        try:
+            span = json.loads(line)
+        except ValueError:
+            continue
+        if not span.get("name", "").startswith("GET /traces/"):
+            return span.get("traceId")
+    return None
+
+
+def waterfall(spans: List[dict]) -> List[dict]:
+    """Spans in tree order with depth, offset from the trace start and duration (ms)."""
+    if not spans:
+        return []
+    trace_start = min(s["startTimeUnixNano"] for s in spans)
+    ids = {s["spanId"] for s in spans}
+    children = {}
+    for s in spans:
+        parent = s.get("parentSpanId") if s.get("parentSpanId") in ids else None
+        children.setdefault(parent, []).append(s)
+
+    rows = []
+
+    def walk(parent: Optional[str], depth: int) -> None:
+        for s in children.get(parent, []):
+            rows.append({
+                "name": s["name"],
+                "depth": depth,
+                "offset_ms": round((s["startTimeUnixNano"] - trace_start) / 1e6, 1),
+                "duration_ms": round((s["endTimeUnixNano"] - s["startTimeUnixNano"]) / 1e6, 1),
+                "status": s["status"],
+                "attributes": s.get("attributes", {}),
+                "span_id": s["spanId"],
+            })
+            walk(s["spanId"], depth + 1)
+
+    walk(None, 0)
+    return rows
+
+
+def render_waterfall(rows: List[dict], width: int = 60) -> str:
+    """Plain-text waterfall: one bar per span, scaled to the whole trace."""
+    if not rows:
+        return ""
+    total = max(r["offset_ms"] + r["duration_ms"] for r in rows) or 1.0
+    label_width = min(60, max(2 * r["depth"] + len(r["name"]) for r in rows))
+    lines = []
+    for r in rows:
+        start = int(r["offset_ms"] / total * width)
+        length = max(1, int(r["duration_ms"] / total * width))
+        bar = " " * start + "█" * min(length, width - start)
+        label = ("  " * r["depth"] + r["name"])[:label_width]
+        flag = "" if r["status"] == "ok" else f" [{r['status']}]"
+        lines.append(f"{label:<{label_width}} |{bar:<{width}}| {r['offset_ms']:>9.1f} +{r['duration_ms']:.1f}ms{flag}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    if not EXPORT_PATH:
+        sys.exit("Set TRACE_EXPORT_PATH to the exported spans file")
+    trace = sys.argv[1] if len(sys.argv) > 1 else latest_trace_id()
+    if not trace:
+        sys.exit(f"No traces in {EXPORT_PATH}")
+    print(f"trace {trace}")
+    print(render_waterfall(waterfall(load_trace(trace))))
@@ -1,12 +1,42 @@
-import anthropic
-import runwayml
 import asyncio
 import json
+import os
+import time
+import uuid
 from typing import List
-from kling_client import submit_kling_task, submit_pika_task, submit_hailuo_task
-from luma_client import submit_luma_task
+from kling_client import (
+    submit_kling_task, submit_pika_task, submit_hailuo_task,
+    poll_kling_task, poll_pika_task, poll_hailuo_task,
+    cancel_kling_task, cancel_pika_task, cancel_hailuo_task,
+)
+from luma_client import submit_luma_task, poll_luma_task, cancel_luma_task
+from task_cache import task_cache
+from rate_limit import limited_call
+import circuit_breaker
+import executors
+import metrics
+import telemetry
+import job_store
+from startup import sdk
+from tracing import traced
+
+anthropic = sdk("anthropic")
+runwayml = sdk("runway")
+
+# Hedged generation: providers tried in this order, fastest-to-usable first
+HEDGE_PROVIDER_ORDER = [
+    p.strip() for p in os.getenv("HEDGE_PROVIDER_ORDER", "kling,gen4.5,veo3.1,hailuo,luma,pika").split(",") if p.strip()
+]
+HEDGE_FANOUT = int(os.getenv("HEDGE_FANOUT", "2"))  # max providers submitted per request
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "30"))  # seconds before launching the next provider
+HEDGE_TIMEOUT = float(os.getenv("HEDGE_TIMEOUT", "600"))  # background job stops and leaves cards to client polling
+HEDGE_POLL_INTERVAL = 5
+HEDGE_STALE_SECONDS = 60  # a hedge still "running" this long past its deadline was interrupted
+
+_hedges = set()  # strong refs so running hedge jobs aren't garbage-collected
 
 
+@traced()
 def generate_prompt_proposals(
     anthropic_key: str,
     analysis: dict,
@@ -76,11 +106,13 @@ Rules for each prompt:
 
 Return ONLY the JSON array. No markdown, no extra text."""
 
+    started = time.perf_counter()
     message = client.messages.create(
         model="claude-opus-4-6",
         max_tokens=4000,
         messages=[{"role": "user", "content": prompt}],
     )
+    metrics.record_llm("generate_prompt_proposals", message, started)
 
     raw = message.content[0].text.strip()
     if raw.startswith("```"):
@@ -92,6 +124,7 @@ Return ONLY the JSON array. No markdown, no extra text."""
     return json.loads(raw)
 
 
+@traced()
 def _generate_video_concepts(
     anthropic_key: str,
     analysis: dict,
@@ -170,11 +203,13 @@ Respond ONLY with a valid JSON array of exactly 1 object, each with this structu
 
 Return ONLY the JSON array. No markdown, no extra text."""
 
+    started = time.perf_counter()
     message = client.messages.create(
         model="claude-opus-4-6",
         max_tokens=3000,
         messages=[{"role": "user", "content": prompt}],
     )
+    metrics.record_llm("_generate_video_concepts", message, started)
 
     raw = message.content[0].text.strip()
     if raw.startswith("```"):
@@ -186,6 +221,11 @@ Return ONLY the JSON array. No markdown, no extra text."""
     return json.loads(raw)
 
 
+def background_runway_breaker(image_url: str = None) -> str:
+    """Circuit breaker for submit_background_runway(): gen4_turbo animates an image, gen4.5 is text-only."""
+    return circuit_breaker.submit_breaker("runway", "gen4_turbo" if image_url else "gen4.5")
+
+
 def submit_background_runway(
     runway_key: str,
     prompt_text: str,
@@ -202,7 +242,9 @@ def submit_background_runway(
     use_img = bool(image_url)
     try:
         if use_img:
-            task = client.image_to_video.create(
+            task = limited_call(
+                "runway",
+                client.image_to_video.create,
                 model="gen4_turbo",
                 prompt_image=image_url,
                 prompt_text=prompt_text,
@@ -211,7 +253,9 @@ def submit_background_runway(
             )
             model_name = "gen4_turbo-img2vid"
         else:
-            task = client.text_to_video.create(
+            task = limited_call(
+                "runway",
+                client.text_to_video.create,
                 model="gen4.5",
                 prompt_text=prompt_text,
                 ratio="720:1280",
@@ -253,7 +297,9 @@ def _submit_runway_task(
     client = runwayml.RunwayML(api_key=runway_key)
 
     try:
-        task = client.text_to_video.create(
+        task = limited_call(
+            "runway",
+            client.text_to_video.create,
             model="veo3.1",
             prompt_text=concept["runway_prompt"],
             ratio=ratio,
@@ -278,7 +324,9 @@ def _submit_runway_task_gen4(
     client = runwayml.RunwayML(api_key=runway_key)
 
     try:
-        task = client.text_to_video.create(
+        task = limited_call(
+            "runway",
+            client.text_to_video.create,
             model="gen4.5",
             prompt_text=concept["runway_prompt"],
             ratio=ratio,
@@ -312,7 +360,7 @@ def poll_runway_task(runway_key: str, task_id: str) -> dict:
         }
     else:
         # Still PENDING or RUNNING
-        return {"task_id": task_id, "status": "pending", "video_url": None}
+        return {"task_id": task_id, "status": "pending", "video_url": None, "running": status == "RUNNING"}
 
 
 def generate_concept(
@@ -332,6 +380,7 @@ def generate_concept(
     return concepts[0]
 
 
+@traced()
 async def generate_videos(
     anthropic_key: str,
     runway_key: str,
@@ -341,44 +390,238 @@ async def generate_videos(
     hashtags: List[str],
     selected_prompt: str = None,
     platform: str = "instagram",
+    hedge: dict = None,
 ) -> List[dict]:
     """
     Full pipeline: generate 1 concept via Claude, then submit to all providers in parallel.
     Providers: RunwayML veo3.1, RunwayML gen4_turbo, Kling 2.6 Pro, Pika 2.2, Luma ray-3-14.
     Returns immediately with task_ids — frontend polls each card separately.
-    """
-    loop = asyncio.get_event_loop()
+    Providers whose circuit is open or whose pool is saturated come back as error cards; the rest
+    still run. If every pool is saturated, Saturated is raised (nothing was submitted).
 
+    hedge: optional policy {"fanout", "delay", "timeout", "order"} — when given, only the top-ranked
+    provider is submitted now and a background job hedges with the rest (see _generate_hedged).
+    """
     # Step 1: Generate 1 concept via Claude (using selected_prompt if provided)
-    concepts = await loop.run_in_executor(
-        None, _generate_video_concepts, anthropic_key, analysis, hashtags, selected_prompt, platform
+    concepts = await executors.run(
+        "anthropic", _generate_video_concepts, anthropic_key, analysis, hashtags, selected_prompt, platform
     )
     concept = concepts[0]
 
-    # Step 2: Submit to all providers concurrently
-    submit_tasks = []
+    if hedge is not None:
+        return await _generate_hedged(runway_key, fal_key, luma_key, concept, hedge)
 
+    # Step 2: Submit to all providers concurrently
+    submits = []  # (status provider, model, api key, submit fn)
     if runway_key:
-        submit_tasks.append(
-            loop.run_in_executor(None, _submit_runway_task, runway_key, concept)
-        )
-        submit_tasks.append(
-            loop.run_in_executor(None, _submit_runway_task_gen4, runway_key, concept)
-        )
+        submits.append(("runway", "veo3.1", runway_key, _submit_runway_task))
+        submits.append(("runway", "gen4.5", runway_key, _submit_runway_task_gen4))
     if fal_key:
-        submit_tasks.append(
-            loop.run_in_executor(None, submit_kling_task, fal_key, concept)
-        )
-        submit_tasks.append(
-            loop.run_in_executor(None, submit_pika_task, fal_key, concept)
-        )
-        submit_tasks.append(
-            loop.run_in_executor(None, submit_hailuo_task, fal_key, concept)
-        )
+        submits.append(("kling", "kling-2.6-pro", fal_key, submit_kling_task))
+        submits.append(("pika", "pika-2.2", fal_key, submit_pika_task))
+        submits.append(("hailuo", "hailuo-02-pro", fal_key, submit_hailuo_task))
     if luma_key:
-        submit_tasks.append(
-            loop.run_in_executor(None, submit_luma_task, luma_key, concept)
-        )
+        submits.append(("luma", "ray-2", luma_key, submit_luma_task))
+
+    def error_card(model: str, e: Exception) -> dict:
+        return {**concept, "task_id": None, "video_url": None, "status": "error", "error": str(e), "model": model}
+
+    submit_tasks = []  # (model, coroutine)
+    skipped = []
+    for provider, model, key, submit_fn in submits:
+        guarded = circuit_breaker.submit_breaker(provider, model)
+        try:
+            submit_tasks.append((model, executors.run_for(provider, circuit_breaker.guard(guarded, submit_fn), key, concept)))
+        except circuit_breaker.CircuitOpen as e:
+            skipped.append(error_card(model, e))
+
+    # A saturated pool fails only its own card: the other paid submits still run and get recorded
+    outcomes = await asyncio.gather(*(coro for _, coro in submit_tasks), return_exceptions=True)
+    if outcomes and all(isinstance(outcome, executors.Saturated) for outcome in outcomes):
+        raise outcomes[0]  # nothing was submitted: let the client back off (429 + Retry-After)
+    results = [
+        error_card(model, outcome) if isinstance(outcome, Exception) else outcome
+        for (model, _), outcome in zip(submit_tasks, outcomes)
+    ]
+    telemetry.record_cards(results)
+    job_store.record_cards(results)
+    return results + skipped
+
+
+def cancel_runway_task(runway_key: str, task_id: str) -> bool:
+    """Best-effort cancel of a Runway task. Returns True if the cancel was accepted."""
+    client = runwayml.RunwayML(api_key=runway_key)
+    try:
+        client.tasks.delete(task_id)
+        return True
+    except Exception:
+        return False
+
+
+def _hedge_providers(runway_key: str, fal_key: str, luma_key: str) -> dict:
+    """
+    Hedge-capable providers: name -> (api_key, submit_fn, poll_fn, cancel_fn, status_provider).
+    status_provider is the /video-status/{provider} name, used as the task cache key.
+    """
+    return {
+        "veo3.1": (runway_key, _submit_runway_task, poll_runway_task, cancel_runway_task, "runway"),
+        "gen4.5": (runway_key, _submit_runway_task_gen4, poll_runway_task, cancel_runway_task, "runway"),
+        "kling": (fal_key, submit_kling_task, poll_kling_task, cancel_kling_task, "kling"),
+        "pika": (fal_key, submit_pika_task, poll_pika_task, cancel_pika_task, "pika"),
+        "hailuo": (fal_key, submit_hailuo_task, poll_hailuo_task, cancel_hailuo_task, "hailuo"),
+        "luma": (luma_key, submit_luma_task, poll_luma_task, cancel_luma_task, "luma"),
+    }
+
 
-    results = await asyncio.gather(*submit_tasks)
-    return list(results)
+async def _generate_hedged(
+    runway_key: str,
+    fal_key: str,
+    luma_key: str,
+    concept: dict,
+    hedge: dict,
+) -> List[dict]:
+    """
+    Hedged "first finished wins" generation.
+    Submits the top-ranked configured provider and returns its card straight away, tagged with a hedge_id.
+    A background job then adds the next provider every `delay` seconds (or as soon as one fails) up to
+    `fanout` providers. The first clip to succeed wins; stragglers are cancelled, and their status polls
+    come back "cancelled" with the winning card in hedge_winner. GET /hedge-status/{hedge_id} lists every
+    card. If nothing finishes within `timeout`, the job stops and leaves the cards to client polling.
+    """
+    fanout = max(1, int(hedge.get("fanout") or HEDGE_FANOUT))
+    delay = float(hedge["delay"]) if hedge.get("delay") is not None else HEDGE_DELAY
+    timeout = float(hedge.get("timeout") or HEDGE_TIMEOUT)
+    order = hedge.get("order") or HEDGE_PROVIDER_ORDER
+
+    registry = _hedge_providers(runway_key, fal_key, luma_key)
+    candidates = [
+        name for name in order
+        if name in registry and registry[name][0]
+        and circuit_breaker.available(circuit_breaker.submit_breaker(registry[name][4], name))
+    ][:fanout]
+    if not candidates:
+        raise ValueError("No configured providers available for hedged generation")
+
+    hedge_id = uuid.uuid4().hex
+    deadline = time.time() + timeout
+    cards = []  # (name, card) in launch order
+    live = []  # indexes into cards still in flight
+    last_launch = None
+
+    async def launch(name: str):
+        nonlocal last_launch
+        key, submit_fn, *_ = registry[name]
+        # Admission happened at the concept step; from here on the hedge waits for capacity
+        try:
+            card = await circuit_breaker.run_for(
+                circuit_breaker.submit_breaker(registry[name][4], name), submit_fn, key, concept, admit=False
+            )
+        except circuit_breaker.CircuitOpen as e:
+            card = {**concept, "task_id": None, "video_url": None, "status": "error", "error": str(e), "model": name}
+        card = {**card, "hedge_id": hedge_id}
+        telemetry.record_cards([card])
+        job_store.record_cards([card], {"hedge_id": hedge_id})
+        cards.append((name, card))
+        last_launch = time.monotonic()
+        if card.get("status") == "pending" and card.get("task_id"):
+            live.append(len(cards) - 1)
+
+    def save(status: str, winner=None) -> None:
+        result = {
+            "hedge_id": hedge_id,
+            "status": status,
+            "deadline": deadline,
+            "winner_task_id": cards[winner][1].get("task_id") if winner is not None else None,
+            "cancelled_task_ids": [card["task_id"] for _, card in cards if card.get("status") == "cancelled"],
+            "cards": [{**card, "hedge_winner": idx == winner} for idx, (_, card) in enumerate(cards)],
+        }
+        job_store.job_store.upsert("hedge", "hedge", hedge_id, status, result=result)
+
+    async def run():
+        started = time.monotonic()
+        winner = None
+        while winner is None:
+            now = time.monotonic()
+            if now - started >= timeout:
+                break  # no backup launches past the deadline either
+            can_launch = len(cards) < len(candidates)
+            if can_launch and (not live or now - last_launch >= delay):
+                await launch(candidates[len(cards)])
+                save("running")
+                continue
+            if not live:
+                break
+
+            await asyncio.sleep(HEDGE_POLL_INTERVAL)
+
+            polls = []
+            for idx in live:
+                name, card = cards[idx]
+                key, _, poll_fn, _, status_provider = registry[name]
+                timed_poll = metrics.timed(status_provider, "poll", poll_fn)
+                polls.append(circuit_breaker.run_for(status_provider, timed_poll, key, card["task_id"], admit=False))
+            results = await asyncio.gather(*polls, return_exceptions=True)
+
+            for idx, result in zip(list(live), results):
+                if isinstance(result, Exception):
+                    continue  # transient poll error or open circuit — try again next round
+                name, card = cards[idx]
+                task_cache.put(registry[name][4], card["task_id"], result)
+                telemetry.record_poll(card["task_id"], result)
+                if result.get("status") not in job_store.TERMINAL_STATUSES:
+                    continue
+                live.remove(idx)
+                cards[idx] = (name, {**card, **result})
+                if result.get("status") == "succeeded" and winner is None:
+                    winner = idx
+
+        if winner is None:
+            save("timeout" if live else "failed")
+            return
+
+        # Answer the stragglers' status polls with the winner and persist the group before cancelling
+        # upstream, so a restart mid-cancel neither loses the winner nor resumes polling the losers
+        winning_card = cards[winner][1]
+        cancels = []
+        for idx in live:
+            name, card = cards[idx]
+            key, _, _, cancel_fn, status_provider = registry[name]
+            cancelled = {
+                "task_id": card["task_id"],
+                "status": "cancelled",
+                "video_url": None,
+                "error": "Cancelled: another provider finished first",
+                "hedge_winner": winning_card,
+            }
+            task_cache.put(status_provider, card["task_id"], cancelled)
+            cards[idx] = (name, {**card, **cancelled})
+            timed_cancel = metrics.timed(status_provider, "cancel", cancel_fn)
+            cancels.append(executors.run_for(status_provider, timed_cancel, key, card["task_id"], admit=False))
+        save("succeeded", winner)
+        await asyncio.gather(*cancels, return_exceptions=True)
+
+    async def run_logged():
+        try:
+            await run()
+        except Exception as e:
+            result = {"hedge_id": hedge_id, "status": "failed", "error": str(e)}
+            job_store.job_store.upsert("hedge", "hedge", hedge_id, "failed", result=result)
+
+    await launch(candidates[0])
+    save("running")
+    task = asyncio.create_task(run_logged())
+    _hedges.add(task)
+    task.add_done_callback(_hedges.discard)
+    return [card for _, card in cards]
+
+
+def get_hedge(hedge_id: str):
+    """The last persisted state of a hedged generation: its status and every card launched so far."""
+    job = job_store.job_store.get("hedge", hedge_id)
+    if job is None:
+        return None
+    result = job["result"]
+    if result.get("status") == "running" and time.time() > result.get("deadline", 0) + HEDGE_STALE_SECONDS:
+        # The worker running it went away (e.g. a restart) before it could settle
+        result = {**result, "status": "interrupted"}
+    return result
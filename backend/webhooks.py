@@ -0,0 +1,126 @@
+import hmac
+import os
+from typing import Optional, Tuple
+from urllib.parse import urlencode
+
+import telemetry
+from job_store import TERMINAL_STATUSES
+from task_cache import task_cache
+
+# Public URL providers can reach this API on (e.g. https://your-app.up.railway.app).
+# Callbacks are only attached when both values are configured.
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+# /video-status providers whose submits attach callback_url()
+CALLBACK_PROVIDERS = ("kling", "pika", "hailuo", "heygen", "shotstack")
+
+
+def callback_url(source: str, provider: str) -> Optional[str]:
+    """
+    Build the callback URL a provider should hit when a job finishes.
+    source: upstream API family ('fal', 'heygen', 'shotstack')
+    provider: the /video-status provider name the result is stored under
+    Returns None when webhooks are not configured, so submits fall back to polling.
+    """
+    if not PUBLIC_BASE_URL or not WEBHOOK_SECRET:
+        return None
+    return f"{PUBLIC_BASE_URL}/webhooks/{source}/{provider}?{urlencode({'token': WEBHOOK_SECRET})}"
+
+
+def expects_callback(provider: str) -> bool:
+    """Whether this provider's jobs report back through a webhook."""
+    return bool(PUBLIC_BASE_URL and WEBHOOK_SECRET) and provider in CALLBACK_PROVIDERS
+
+
+def verify_token(token: Optional[str]) -> bool:
+    if not WEBHOOK_SECRET or not token:
+        return False
+    return hmac.compare_digest(token, WEBHOOK_SECRET)
+
+
+def record_result(provider: str, task_id: str, result: dict) -> dict:
+    """
+    Apply a webhook result to the task state.
+    Terminal states are final: the first one wins, so redelivered or late,
+    out-of-order events for a finished task are acknowledged and dropped.
+    """
+    if task_cache.get(provider, task_id) is not None:
+        return {"accepted": False, "duplicate": True}
+    if result.get("status") not in TERMINAL_STATUSES:
+        # Progress events carry nothing polling doesn't already report
+        return {"accepted": False, "duplicate": False}
+    task_cache.put(provider, task_id, result)
+    telemetry.record_poll(task_id, result)
+    return {"accepted": True, "duplicate": False}
+
+
+def parse_fal_webhook(payload: dict) -> Tuple[str, dict]:
+    """
+    fal.ai queue webhook:
+      {"request_id": "...", "status": "OK" | "ERROR", "payload": {...}, "error": "..."}
+    """
+    from kling_client import extract_fal_video_url
+
+    request_id = payload.get("request_id") or payload.get("gateway_request_id")
+    if payload.get("status") == "OK":
+        result = {
+            "task_id": request_id,
+            "status": "succeeded",
+            "video_url": extract_fal_video_url(payload.get("payload")),
+        }
+    elif payload.get("status") == "ERROR":
+        result = {
+            "task_id": request_id,
+            "status": "failed",
+            "video_url": None,
+            "error": payload.get("error") or payload.get("payload_error") or "Generation failed",
+        }
+    else:
+        # Not a completion event: leave the outcome to polling rather than recording a false failure
+        result = {"task_id": request_id, "status": "pending", "video_url": None}
+    return request_id, result
+
+
+def parse_heygen_webhook(payload: dict) -> Tuple[str, dict]:
+    """
+    HeyGen webhook:
+      {"event_type": "avatar_video.success" | "avatar_video.fail",
+       "event_data": {"video_id": "...", "url": "...", "msg": "..."}}
+    """
+    event_type = payload.get("event_type", "")
+    data = payload.get("event_data") or {}
+    video_id = data.get("video_id")
+    if event_type == "avatar_video.success":
+        result = {"task_id": video_id, "status": "succeeded", "video_url": data.get("url")}
+    elif event_type == "avatar_video.fail":
+        result = {
+            "task_id": video_id,
+            "status": "failed",
+            "video_url": None,
+            "error": data.get("msg") or "Generation failed",
+        }
+    else:
+        result = {"task_id": video_id, "status": "pending", "video_url": None}
+    return video_id, result
+
+
+def parse_shotstack_webhook(payload: dict) -> Tuple[str, dict]:
+    """
+    Shotstack render callback:
+      {"type": "edit", "action": "render", "id": "...", "status": "done" | "failed", "url": "...", "error": ...}
+    """
+    render_id = payload.get("id")
+    status = payload.get("status")
+    if status == "done":
+        result = {"render_id": render_id, "status": "succeeded", "video_url": payload.get("url")}
+    elif status in ("failed", "cancelled"):
+        result = {
+            "render_id": render_id,
+            "status": "failed",
+            "video_url": None,
+            "error": payload.get("error") or "Render failed",
+        }
+    else:
+        result = {"render_id": render_id, "status": "pending", "video_url": None, "shotstack_status": status}
+    return render_id, result
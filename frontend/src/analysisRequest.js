@@ -0,0 +1,34 @@
+const API_BASE = import.meta.env.VITE_API_URL || 'http://localhost:8000'
+
+// POST a step that works on an analysis. Sends only the server-side analysis_id when the analysis
+// has one, and falls back to the full analysis if the server no longer has it (410: expired, or an
+// analysis restored from an old session).
+export async function postWithAnalysis(path, analysis, body, headers = {}) {
+  const post = ref => fetch(`${API_BASE}${path}`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', ...headers },
+    body: JSON.stringify({ ...ref, ...body }),
+  })
+  if (analysis?.analysis_id) {
+    const res = await post({ analysis_id: analysis.analysis_id })
+    if (res.status !== 410) return res
+  }
+  return post({ analysis })
+}
+
+const pendingKeys = new Map() // action -> { key, fingerprint } until the server answers
+
+// Send a paid submit with an Idempotency-Key. Repeating the same action with the same payload before
+// the server has answered (a double-click, or a retry after a network error) reuses the key, so the
+// server submits the work once and hands both calls the same response.
+export async function submitOnce(action, payload, send) {
+  const fingerprint = JSON.stringify(payload)
+  let entry = pendingKeys.get(action)
+  if (!entry || entry.fingerprint !== fingerprint) {
+    entry = { key: crypto.randomUUID(), fingerprint }
+    pendingKeys.set(action, entry)
+  }
+  const res = await send({ 'Idempotency-Key': entry.key }) // a network error keeps the key for the retry
+  if (pendingKeys.get(action) === entry) pendingKeys.delete(action)
+  return res
+}
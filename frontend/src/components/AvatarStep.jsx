@@ -1,4 +1,5 @@
 import { useState, useEffect } from 'react'
+import { postWithAnalysis } from '../analysisRequest'
 import './AvatarStep.css'
 
 const API_BASE = import.meta.env.VITE_API_URL || 'http://localhost:8000'
@@ -56,15 +57,11 @@ export default function AvatarStep({ analysis, hashtags, platform = 'instagram',
     }
   }, [analysis, hashtags])
 
-  async function fetchScript() {
+  async function fetchScript(refresh = false) {
     setScriptLoading(true)
     setScriptError('')
     try {
-      const res = await fetch(`${API_BASE}/heygen/preview-script`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ analysis, hashtags, platform }),
-      })
+      const res = await postWithAnalysis('/heygen/preview-script', analysis, { hashtags, platform, refresh })
       if (!res.ok) {
         const err = await res.json()
         throw new Error(err.detail || `Error ${res.status}`)
@@ -170,7 +167,7 @@ export default function AvatarStep({ analysis, hashtags, platform = 'instagram',
                   )}
                   <button
                     className="avs-refresh-script"
-                    onClick={fetchScript}
+                    onClick={() => fetchScript(true)}
                     disabled={scriptLoading || isLoading}
                     title="Regenerate script from Claude"
                   >
@@ -1,4 +1,5 @@
 import { useState, useEffect, useRef } from 'react'
+import { postWithAnalysis } from '../analysisRequest'
 import './BackgroundStep.css'
 
 const API_BASE = import.meta.env.VITE_API_URL || 'http://localhost:8000'
@@ -104,11 +105,7 @@ export default function BackgroundStep({ analysis, hashtags, proposalsEndpoint,
     setProposalsLoading(true)
     setProposalsError('')
     try {
-      const res = await fetch(`${API_BASE}${proposalsEndpoint}`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ analysis, hashtags }),
-      })
+      const res = await postWithAnalysis(proposalsEndpoint, analysis, { hashtags })
       if (!res.ok) {
         const err = await res.json()
         throw new Error(err.detail || `Server error ${res.status}`)
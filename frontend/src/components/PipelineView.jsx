@@ -3,6 +3,7 @@ import ScriptStep from './ScriptStep'
 import AvatarStep from './AvatarStep'
 import BackgroundStep from './BackgroundStep'
 import CompositeStep from './CompositeStep'
+import { postWithAnalysis, submitOnce } from '../analysisRequest'
 import './PipelineView.css'
 
 const API_BASE = import.meta.env.VITE_API_URL || 'http://localhost:8000'
@@ -125,18 +126,16 @@ export default function PipelineView({ analysis, hashtags, platform = 'instagram
   async function handleGenerateAvatar(avatarId, voiceId, spokenScript) {
     setStep2({ ...INITIAL_STEP2, status: 'loading', hasGenerated: true })
     try {
-      const res = await fetch(`${API_BASE}/heygen/generate`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          analysis,
-          hashtags,
-          avatar_id: avatarId,
-          voice_id: voiceId,
-          platform,
-          spoken_script: spokenScript || null,
-        }),
-      })
+      const body = {
+        hashtags,
+        avatar_id: avatarId,
+        voice_id: voiceId,
+        platform,
+        spoken_script: spokenScript || null,
+      }
+      const res = await submitOnce('heygen', body, headers =>
+        postWithAnalysis('/heygen/generate', analysis, body, headers)
+      )
       if (!res.ok) {
         const err = await res.json()
         throw new Error(err.detail || `Server error ${res.status}`)
@@ -171,11 +170,14 @@ export default function PipelineView({ analysis, hashtags, platform = 'instagram
       ],
     }))
     try {
-      const res = await fetch(`${API_BASE}/pipeline/generate-background`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ prompt, model, slot, image_url: imageUrl || null }),
-      })
+      const body = { prompt, model, slot, image_url: imageUrl || null }
+      const res = await submitOnce(`background:${slot}`, body, headers =>
+        fetch(`${API_BASE}/pipeline/generate-background`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json', ...headers },
+          body: JSON.stringify(body),
+        })
+      )
       if (!res.ok) {
         const err = await res.json()
         throw new Error(err.detail || `Server error ${res.status}`)
@@ -199,17 +201,20 @@ export default function PipelineView({ analysis, hashtags, platform = 'instagram
   async function handleGenerateBackgrounds(promptA, promptB, model, imageUrlA = null, imageUrlB = null) {
     setStep3({ ...INITIAL_STEP3, status: 'loading', hasGenerated: true })
     try {
-      const res = await fetch(`${API_BASE}/pipeline/generate-backgrounds`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          prompt_a: promptA,
-          prompt_b: promptB,
-          model,
-          image_url_a: imageUrlA,
-          image_url_b: imageUrlB,
-        }),
-      })
+      const body = {
+        prompt_a: promptA,
+        prompt_b: promptB,
+        model,
+        image_url_a: imageUrlA,
+        image_url_b: imageUrlB,
+      }
+      const res = await submitOnce('backgrounds', body, headers =>
+        fetch(`${API_BASE}/pipeline/generate-backgrounds`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json', ...headers },
+          body: JSON.stringify(body),
+        })
+      )
       if (!res.ok) {
         const err = await res.json()
         throw new Error(err.detail || `Server error ${res.status}`)
@@ -240,18 +245,21 @@ export default function PipelineView({ analysis, hashtags, platform = 'instagram
     }))
 
     try {
-      const res = await fetch(`${API_BASE}/pipeline/composite`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          heygen_video_url: step2.videoUrl,
-          background_video_url: bg.video_url,
-          hook_text: hookText,
-          music_track_id: step4.selectedMusic,
-          duration,
-          spoken_script: step4.captionsEnabled ? (step2.spokenScript || '') : null,
-        }),
-      })
+      const body = {
+        heygen_video_url: step2.videoUrl,
+        background_video_url: bg.video_url,
+        hook_text: hookText,
+        music_track_id: step4.selectedMusic,
+        duration,
+        spoken_script: step4.captionsEnabled ? (step2.spokenScript || '') : null,
+      }
+      const res = await submitOnce(`composite:${slot}`, body, headers =>
+        fetch(`${API_BASE}/pipeline/composite`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json', ...headers },
+          body: JSON.stringify(body),
+        })
+      )
       if (!res.ok) {
         const err = await res.json()
         throw new Error(err.detail || `Server error ${res.status}`)
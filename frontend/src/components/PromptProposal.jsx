@@ -1,8 +1,7 @@
 import { useState, useEffect } from 'react'
+import { postWithAnalysis } from '../analysisRequest'
 import './PromptProposal.css'
 
-const API_BASE = import.meta.env.VITE_API_URL || 'http://localhost:8000'
-
 export default function PromptProposal({ analysis, hashtags, onPromptsReady, proposalsEndpoint = '/propose-prompts' }) {
   const [proposals, setProposals] = useState([])
   const [selectedIndex, setSelectedIndex] = useState(0)
@@ -19,11 +18,7 @@ export default function PromptProposal({ analysis, hashtags, onPromptsReady, pro
     setError('')
     setProposals([])
     try {
-      const res = await fetch(`${API_BASE}${proposalsEndpoint}`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ analysis, hashtags }),
-      })
+      const res = await postWithAnalysis(proposalsEndpoint, analysis, { hashtags })
       if (!res.ok) {
         const err = await res.json()
         throw new Error(err.detail || `Server error ${res.status}`)